@@ -0,0 +1,19 @@
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, Request, status
+
+from app.services.clients import Clients
+
+
+def get_clients(request: Request) -> Clients:
+    """Clientes compartidos creados en el lifespan (ver init_clients)"""
+    clients = getattr(request.app.state, "clients", None)
+    if clients is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Clients not initialized",
+        )
+    return clients
+
+
+ClientsDep = Annotated[Clients, Depends(get_clients)]
@@ -1,13 +1,35 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, status
+import json
+import time
+from uuid import UUID
+
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.api.deps import ClientsDep
 from app.schemas.query import QueryResponse
-from app.services.document import query_documents
-from app.schemas.document import (
-    DocumentResponse,
+from app.services.document import (
+    aquery_documents,
+    aquery_documents_batch,
+    astream_query_documents,
 )
+from app.schemas.job import BulkIngestionJobResponse, IngestionJobResponse
 import logging
 
-from app.utils.doc_to_vectores import delete_all_vectors, process_document
-from app.schemas.query import QueryRequest
+from app.utils.archives import ARCHIVE_EXTENSIONS, is_archive
+from app.utils.doc_to_vectores import delete_all_vectors
+from app.utils.text_extraction import SUPPORTED_EXTENSIONS
+from app.services.jobs import (
+    get_ingestion_job_response,
+    submit_bulk_ingestion_job,
+    submit_ingestion_job,
+)
+from app.schemas.query import BatchQueryRequest, BatchQueryResponse, QueryRequest
+from app.core.config import settings
+from app.services.embedding_cache import get_embedding_cache
+from app.services.vector_store import delete_namespace
+from app.services.query_cache import get_query_embedding_cache
+from app.services.semantic_cache import get_semantic_cache
+from app.services.single_flight import get_query_single_flight
 
 logger = logging.getLogger(__name__)
 
@@ -16,20 +38,36 @@ router = APIRouter()
 
 @router.post(
     "/upload",
-    response_model=DocumentResponse,
-    status_code=status.HTTP_201_CREATED,
+    response_model=IngestionJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
     summary="Subir documento",
     description="Sube un documento (PDF, DOCX, TXT, MD, CSV)",
 )
-async def upload_document(file: UploadFile = File(...)):
+async def upload_document(
+    file: UploadFile = File(...),
+    namespace: str = Form(""),
+    document_id: str | None = Form(None),
+):
     """
-    📤 Sube y procesa un documento
+    📤 Sube un documento y lo encola para procesarlo
 
+    El procesamiento corre en segundo plano:
     - Extrae texto del archivo
     - Divide en chunks inteligentes
     - Genera embeddings con OpenAI
     - Almacena vectores en Pinecone
 
+    Responde 202 con el id del trabajo; el progreso se consulta en
+    `GET /documents/jobs/{job_id}`.
+
+    `namespace` (opcional) guarda el documento en un namespace de
+    Pinecone, p. ej. uno por línea de producto.
+
+    `document_id` (opcional) sube el archivo como nueva versión de un
+    documento ya cargado: solo se vectorizan los chunks que cambiaron y se
+    eliminan los que ya no están. Sin él, el id se deriva del contenido
+    del archivo.
+
     Formatos soportados: PDF, DOCX, TXT, MD, CSV
     """
     try:
@@ -38,17 +76,24 @@ async def upload_document(file: UploadFile = File(...)):
             raise HTTPException(400, "Filename is required")
 
         # Validar tipo de archivo
-        supported_types = [".pdf", ".docx", ".txt", ".md", ".csv"]
-        if not any(file.filename.lower().endswith(ext) for ext in supported_types):
+        if not file.filename.lower().endswith(SUPPORTED_EXTENSIONS):
             raise HTTPException(
-                400, f"Unsupported file type. Supported: {', '.join(supported_types)}"
+                400,
+                f"Unsupported file type. Supported: {', '.join(SUPPORTED_EXTENSIONS)}",
             )
 
-        # Procesar documento (función pura)
-        result = process_document(file)
+        if document_id:
+            try:
+                document_id = str(UUID(document_id))
+            except ValueError:
+                raise HTTPException(400, "document_id must be a UUID") from None
 
-        # Convertir a modelo de respuesta
-        return DocumentResponse(**result)
+        # Encolar documento para el pool de ingesta
+        job = await run_in_threadpool(
+            submit_ingestion_job, file, namespace, document_id or None
+        )
+
+        return job.to_response()
 
     except HTTPException:
         raise
@@ -59,8 +104,112 @@ async def upload_document(file: UploadFile = File(...)):
         )
 
 
+@router.post(
+    "/upload/bulk",
+    response_model=BulkIngestionJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Subir documentos en lote",
+    description="Sube varios documentos o archivos zip/tar con documentos",
+)
+async def upload_documents_bulk(
+    files: list[UploadFile] = File(...),
+    namespace: str = Form(""),
+    document_ids: str | None = Form(None),
+):
+    """
+    📦 Sube varios documentos y los encola como un solo trabajo
+
+    Todos los archivos comparten el pipeline de extracción, embeddings y
+    upsert, así que los lotes se llenan entre documentos. Los zip/tar se
+    expanden sin extraerlos a disco; los archivos de formatos no soportados
+    dentro de ellos se omiten.
+
+    `document_ids` (opcional) es un objeto JSON nombre de archivo -> id de
+    documento para subir nuevas versiones, como `document_id` en /upload;
+    dentro de un zip/tar el nombre es la ruta del miembro. Los archivos que
+    no aparecen toman el id derivado de su contenido.
+
+    El resultado del trabajo incluye el estado de cada archivo y el
+    throughput total.
+    """
+    versions = parse_document_ids(document_ids)
+
+    for file in files:
+        if not file.filename:
+            raise HTTPException(400, "Filename is required")
+        if not (
+            file.filename.lower().endswith(SUPPORTED_EXTENSIONS)
+            or is_archive(file.filename)
+        ):
+            supported = SUPPORTED_EXTENSIONS + ARCHIVE_EXTENSIONS
+            raise HTTPException(
+                400,
+                f"Unsupported file type: {file.filename}. "
+                f"Supported: {', '.join(supported)}",
+            )
+
+    try:
+        job = await run_in_threadpool(
+            submit_bulk_ingestion_job, files, namespace, versions
+        )
+        return job.to_response()
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Processing error: {e!s}",
+        ) from e
+
+
+def parse_document_ids(document_ids: str | None) -> dict[str, str]:
+    """Valida el mapeo nombre de archivo -> id de documento (400 si no es válido)"""
+    if not document_ids:
+        return {}
+    try:
+        mapping = json.loads(document_ids)
+    except ValueError:
+        raise HTTPException(400, "document_ids must be a JSON object") from None
+    if not isinstance(mapping, dict):
+        raise HTTPException(400, "document_ids must be a JSON object")
+
+    versions = {}
+    for filename, document_id in mapping.items():
+        try:
+            versions[filename] = str(UUID(str(document_id)))
+        except ValueError:
+            raise HTTPException(
+                400, f"document_ids[{filename!r}] must be a UUID"
+            ) from None
+    return versions
+
+
+@router.get(
+    "/jobs/{job_id}",
+    response_model=IngestionJobResponse | BulkIngestionJobResponse,
+)
+async def get_ingestion_job_endpoint(
+    job_id: str,
+) -> IngestionJobResponse | BulkIngestionJobResponse:
+    """
+    ⏱️ Consulta el estado de un trabajo de ingesta
+
+    - Etapa actual (extracting, embedding, upserting, done)
+    - Chunks vectorizados hasta el momento
+    - Tiempos por etapa y resultado final
+    """
+    job = get_ingestion_job_response(job_id)
+    if job is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Job not found")
+
+    return job
+
+
 @router.post("/query", response_model=QueryResponse)
-async def query_documents_endpoint(request: QueryRequest) -> QueryResponse:
+async def query_documents_endpoint(
+    request: QueryRequest, clients: ClientsDep
+) -> QueryResponse:
     """
     🔍 Consulta documentos con RAG y guard rails
 
@@ -76,11 +225,14 @@ async def query_documents_endpoint(request: QueryRequest) -> QueryResponse:
     - Control de calidad de contexto
     """
     try:
-        # Delegar a función pura de service
-        return query_documents(
+        # Delegar a función pura de service (asíncrona: no bloquea el worker)
+        return await aquery_documents(
             query=request.query,
             max_results=request.max_results,
             similarity_threshold=request.similarity_threshold,
+            namespace=request.namespace,
+            filters=request.filters,
+            clients=clients,
         )
 
     except Exception as e:
@@ -90,8 +242,92 @@ async def query_documents_endpoint(request: QueryRequest) -> QueryResponse:
         )
 
 
+@router.post("/query/batch", response_model=BatchQueryResponse)
+async def query_documents_batch_endpoint(
+    request: BatchQueryRequest, clients: ClientsDep
+) -> BatchQueryResponse:
+    """
+    📚 Responde varias consultas en una sola llamada
+
+    - Embeddings de todas las consultas en una sola request
+    - Búsquedas en paralelo y llamadas al LLM con concurrencia acotada
+    - Los guard rails se aplican a cada consulta por separado
+    - Las respuestas vuelven en el mismo orden que las consultas
+    """
+    if len(request.queries) > settings.QUERY_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many queries: maximum is {settings.QUERY_BATCH_MAX_SIZE}",
+        )
+
+    start = time.perf_counter()
+    try:
+        results = await aquery_documents_batch(
+            queries=request.queries,
+            max_results=request.max_results,
+            similarity_threshold=request.similarity_threshold,
+            namespace=request.namespace,
+            filters=request.filters,
+            clients=clients,
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Query error: {e!s}",
+        ) from e
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"📚 Lote de {len(results)} consultas en {elapsed:.2f}s")
+    return BatchQueryResponse(
+        results=results,
+        total_seconds=round(elapsed, 3),
+        queries_per_second=round(len(results) / elapsed, 2) if elapsed else 0.0,
+    )
+
+
+@router.post("/query/stream")
+async def query_documents_stream_endpoint(
+    request: QueryRequest, clients: ClientsDep
+) -> StreamingResponse:
+    """
+    ⚡ Consulta documentos con la respuesta en streaming (Server-Sent Events)
+
+    Eventos, en orden:
+    - `sources`: fuentes usadas como contexto
+    - `token`: fragmentos de la respuesta a medida que los genera el LLM
+    - `done`: confianza, guard rails, cache y tiempo hasta el primer token
+    - `error`: si la consulta falla a mitad de camino
+    """
+
+    async def event_stream():
+        try:
+            async for event, data in astream_query_documents(
+                query=request.query,
+                max_results=request.max_results,
+                similarity_threshold=request.similarity_threshold,
+                namespace=request.namespace,
+                filters=request.filters,
+                clients=clients,
+            ):
+                yield format_sse(event, data)
+        except Exception as e:
+            logger.error(f"❌ Error en consulta en streaming: {e}")
+            yield format_sse("error", {"detail": f"Query error: {e!s}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Formatea un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @router.delete("/vectors/delete-all")
-async def delete_all_vectors_endpoint():
+async def delete_all_vectors_endpoint(clients: ClientsDep):
     """
     🗑️ ELIMINA TODOS los vectores del índice de Pinecone
 
@@ -109,7 +345,7 @@ async def delete_all_vectors_endpoint():
     """
     try:
         # Delegar a función pura de service
-        result = delete_all_vectors()
+        result = delete_all_vectors(clients.vector_store)
         return result
 
     except Exception as e:
@@ -117,3 +353,51 @@ async def delete_all_vectors_endpoint():
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Delete operation failed: {str(e)}",
         )
+
+
+@router.delete("/vectors/namespaces/{namespace}")
+async def delete_namespace_endpoint(namespace: str, clients: ClientsDep):
+    """
+    🗑️ Elimina todos los vectores de un namespace
+
+    ⚠️ **OPERACIÓN DESTRUCTIVA**: Esta acción NO se puede deshacer
+
+    El resto de los namespaces del índice no se modifica.
+    """
+    try:
+        await run_in_threadpool(delete_namespace, namespace, clients.vector_store)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Delete operation failed: {e!s}",
+        ) from e
+
+    return {
+        "status": "success",
+        "message": f"Namespace '{namespace}' deleted",
+        "namespace": namespace,
+        "operation": "delete_namespace",
+    }
+
+
+@router.get("/cache/stats")
+async def cache_stats_endpoint():
+    """
+    📊 Estadísticas de los caches
+
+    - Entradas, hits, misses y hit rate del cache de embeddings
+    - Lo mismo para el cache en memoria de embeddings de consultas
+    - Cache semántico de respuestas (incluye invalidaciones por cambios
+      en el índice)
+    - Consultas idénticas coalescidas con otra en curso
+    """
+    cache = get_embedding_cache()
+    query_cache = get_query_embedding_cache()
+    semantic_cache = get_semantic_cache()
+    single_flight = get_query_single_flight()
+    return {
+        "embeddings": cache.stats() if cache else None,
+        "query_embeddings": query_cache.stats() if query_cache else None,
+        "semantic_answers": semantic_cache.stats() if semantic_cache else None,
+        "coalesced_queries": single_flight.stats() if single_flight else None,
+    }
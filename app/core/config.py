@@ -8,13 +8,116 @@ class Settings(BaseSettings):
     # OPENAI
     OPENAI_API_KEY: str
 
-    # PINECONE
-    PINECONE_API_KEY: str
-    PINECONE_INDEX_NAME: str
+    # ALMACÉN DE VECTORES
+    VECTOR_STORE_BACKEND: str = "pinecone"  # "pinecone", "local" (exacto) o "ann"
+    LOCAL_VECTOR_STORE_PATH: str = ".cache/vectors"  # Directorio del almacén local
+
+    # ÍNDICE ANN LOCAL (IVF sobre archivos mapeados; VECTOR_STORE_BACKEND="ann")
+    ANN_INDEX_PATH: str = ".cache/ann"
+    ANN_NLIST: int = 0  # Listas del IVF (0 = 4 * raíz de la cantidad de vectores)
+    ANN_NPROBE: int = 32  # Listas revisadas por consulta (más recall, menos QPS)
+    ANN_TRAIN_MIN_VECTORS: int = 20_000  # Con menos vectores la búsqueda es exacta
+    ANN_QUANTIZATION: str = "none"  # "none", "float16", "int8" o "pq" (índices nuevos)
+    ANN_PQ_SUBVECTORS: int = 0  # Bytes por vector con "pq" (0 = dimensión / 8)
+    ANN_RESCORE_FACTOR: int = 4  # Candidatos re-puntuados en exacto por resultado
+
+    # PINECONE (solo con VECTOR_STORE_BACKEND="pinecone")
+    PINECONE_API_KEY: str = ""
+    PINECONE_INDEX_NAME: str = ""
+    PINECONE_POOL_MAXSIZE: int = 32  # Conexiones HTTP al índice (0 = por defecto)
+    PINECONE_UPSERT_MAX_BATCH_BYTES: int = 1_900_000  # Límite de request: 2 MB
+    PINECONE_UPSERT_MAX_BATCH_SIZE: int = 1000  # Máximo de vectores por lote
+    PINECONE_UPSERT_CONCURRENCY: int = 4  # Lotes enviados en paralelo
+    PINECONE_UPSERT_MAX_RETRIES: int = 3  # Reintentos por lote
+    PINECONE_UPSERT_RETRY_BACKOFF: float = 0.5  # Segundos (se duplica por intento)
+
+    # POOL HTTP (clientes compartidos de OpenAI)
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0  # Segundos
+    HTTP_TIMEOUT: float = 60.0  # Segundos
 
     # LANGSMITH
     LANGSMITH_API_KEY: str
 
+    # EMBEDDINGS
+    # Cambiar modelo o dimensiones exige reindexar todos los documentos
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    EMBEDDING_DIMENSIONS: int = 1536  # Solo text-embedding-3 acepta menos
+    EMBEDDING_BATCH_SIZE: int = 256  # Máximo de textos por request
+    EMBEDDING_BATCH_MAX_TOKENS: int = 100_000  # Máximo de tokens por request
+    EMBEDDING_MAX_CONCURRENCY: int = 4  # Requests de embeddings en paralelo
+
+    CHUNKING_WINDOW_CHARS: int = 64_000  # Texto acumulado por ventana de chunking
+
+    # CACHE DE EMBEDDINGS
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = ".cache/embeddings.sqlite3"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 200_000  # ~1.2 GB con 1536 dimensiones
+
+    # TEXTOS DE CHUNKS (SQLite comprimido en lugar de la metadata de los vectores)
+    # None = solo con los backends locales: con Pinecone, otros servidores que
+    # compartan el índice no tendrían los textos
+    CHUNK_TEXT_STORE_ENABLED: bool | None = None
+    CHUNK_TEXT_STORE_PATH: str = ".cache/chunk_texts.sqlite3"
+
+    # BÚSQUEDA HÍBRIDA (dispersa BM25 + densa; requiere índice dotproduct)
+    HYBRID_SEARCH_ENABLED: bool = False
+    HYBRID_ALPHA: float = 0.7  # Peso del vector denso (0 < alpha <= 1)
+    SPARSE_VOCAB_PATH: str = ".cache/sparse_vocab.sqlite3"
+
+    # RERANKING LOCAL (BM25 sobre los candidatos de Pinecone)
+    RERANK_ENABLED: bool = False
+    RERANK_OVERSAMPLE: int = 4  # Candidatos pedidos por cada resultado final
+    RERANK_DENSE_WEIGHT: float = 0.5  # Peso del score de Pinecone frente a BM25
+
+    # CONTEXTO DEL PROMPT
+    CONTEXT_MAX_TOKENS: int = 3000  # Tokens de contexto enviados al LLM
+
+    # DEDUPLICACIÓN DE CONSULTAS IDÉNTICAS EN CURSO
+    QUERY_COALESCING_ENABLED: bool = True
+
+    # CONSULTAS EN LOTE
+    QUERY_BATCH_MAX_SIZE: int = 500  # Consultas por request
+    QUERY_BATCH_LLM_CONCURRENCY: int = 8  # Llamadas al LLM en paralelo por lote
+
+    # CACHE DE EMBEDDINGS DE CONSULTAS (en memoria)
+    QUERY_EMBEDDING_CACHE_ENABLED: bool = True
+    QUERY_EMBEDDING_CACHE_MAX_ENTRIES: int = 10_000
+    QUERY_EMBEDDING_CACHE_TTL: float = 3600.0  # Segundos
+
+    # CACHE SEMÁNTICO DE RESPUESTAS (en memoria)
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_CAPACITY: int = 2048  # Consultas guardadas
+    SEMANTIC_CACHE_MAX_DISTANCE: float = 0.05  # Distancia coseno máxima
+    # Segundos que vive una respuesta (cubre escrituras de otros servidores)
+    SEMANTIC_CACHE_TTL: float = 600.0
+    # Generación del índice compartida entre workers (invalida el cache)
+    INDEX_GENERATION_PATH: str = ".cache/index_generation.sqlite3"
+
+    # INGESTA EN SEGUNDO PLANO
+    INGESTION_MAX_WORKERS: int = 2  # Documentos procesados en paralelo
+    INGESTION_QUEUE_SIZE: int = 100  # Documentos en espera antes de responder 503
+    INGESTION_JOB_RETENTION: int = 1000  # Trabajos terminados que se conservan
+    # Estado de los trabajos compartido entre workers de uvicorn (desactivado =
+    # solo en memoria, requiere un único worker)
+    INGESTION_JOB_STORE_ENABLED: bool = True
+    INGESTION_JOB_STORE_PATH: str = ".cache/ingestion_jobs.sqlite3"
+    INGESTION_JOB_PERSIST_INTERVAL: float = 1.0  # Segundos entre guardados del progreso
+    INGESTION_WINDOW_CHUNKS: int = 512  # Chunks vectorizados y almacenados a la vez
+    BULK_MAX_FILES: int = (
+        10_000  # Archivos por subida masiva (incluye archivos zip/tar)
+    )
+    BULK_MAX_ARCHIVE_MEMBERS: int = 10_000  # Archivos por zip/tar
+    BULK_MAX_MEMBER_BYTES: int = 200 * 1024 * 1024  # Descomprimido, por archivo
+    BULK_MAX_ARCHIVE_BYTES: int = 2 * 1024**3  # Descomprimido, por zip/tar
+    UPLOAD_SPOOL_MAX_BYTES: int = 1024 * 1024  # Subidas más grandes pasan a disco
+
+    # EXTRACCIÓN DE PDF
+    PDF_EXTRACTION_WORKERS: int = 4  # Procesos para PDFs grandes (1 = secuencial)
+    PDF_PARALLEL_MIN_PAGES: int = 64  # Páginas a partir de las cuales se paraleliza
+    PDF_PAGES_PER_TASK: int = 16  # Páginas por tarea del pool
+
     model_config = SettingsConfigDict(env_file=".env")
 
 
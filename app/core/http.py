@@ -0,0 +1,53 @@
+import threading
+
+import httpx
+
+from .config import settings
+
+_lock = threading.Lock()
+_http_client: httpx.Client | None = None
+_async_http_client: httpx.AsyncClient | None = None
+
+
+def _create_limits() -> httpx.Limits:
+    """Límites del pool de conexiones (tamaño y keep-alive)"""
+    return httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_http_client() -> httpx.Client:
+    """Cliente HTTP síncrono compartido por el proceso"""
+    global _http_client
+    with _lock:
+        if _http_client is None or _http_client.is_closed:
+            _http_client = httpx.Client(
+                limits=_create_limits(), timeout=settings.HTTP_TIMEOUT
+            )
+        return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Cliente HTTP asíncrono compartido por el proceso"""
+    global _async_http_client
+    with _lock:
+        if _async_http_client is None or _async_http_client.is_closed:
+            _async_http_client = httpx.AsyncClient(
+                limits=_create_limits(), timeout=settings.HTTP_TIMEOUT
+            )
+        return _async_http_client
+
+
+async def close_http_clients() -> None:
+    """Cierra los pools de conexiones compartidos"""
+    global _http_client, _async_http_client
+    with _lock:
+        client, _http_client = _http_client, None
+        async_client, _async_http_client = _async_http_client, None
+
+    if client is not None:
+        client.close()
+    if async_client is not None:
+        await async_client.aclose()
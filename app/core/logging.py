@@ -24,3 +24,6 @@ def configure_logging(log_level: str = LogLevel.error) -> None:
         logging.basicConfig(level=logging.DEBUG, format=LOG_FORMAT_DEBUG)
 
     logging.basicConfig(level=log_level)
+
+
+app_logger = logging.getLogger("app")
@@ -2,20 +2,32 @@ from fastapi import FastAPI, HTTPException, status
 from fastapi.concurrency import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from starlette.formparsers import MultiPartParser
 from .core.config import settings
-from .core.logging import configure_logging
+from .core.logging import app_logger as logger, configure_logging
 from .api.main import api_router
+from .services.clients import close_clients, init_clients
+from .services.jobs import shutdown_ingestion_workers
+from .utils.text_extraction import shutdown_pdf_workers
 
 # Configurar logging
-logger = configure_logging("INFO")
+configure_logging("INFO")
+
+# Tamaño a partir del cual los archivos subidos pasan de memoria a disco
+MultiPartParser.spool_max_size = settings.UPLOAD_SPOOL_MAX_BYTES
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("🚀 Iniciando aplicación RAG...")
     logger.info("📝 Documentación disponible en: /docs")
+    app.state.clients = init_clients()
     yield
     logger.info("🛑 Cerrando aplicación RAG...")
+    shutdown_ingestion_workers()
+    shutdown_pdf_workers()
+    await close_clients()
+    app.state.clients = None
 
 
 app = FastAPI(
@@ -76,6 +88,7 @@ async def root():
         "version": "0.0.1",
         "endpoints": {
             "upload": f"{settings.API}/documents/upload",
+            "jobs": f"{settings.API}/documents/jobs/{{job_id}}",
             "query": f"{settings.API}/documents/query",
             "health": f"{settings.API}/documents/health",
         },
@@ -32,8 +32,39 @@ class DocumentResponse(DocumentBase):
 
     id: int | None = None  # ID de base de datos (opcional)
     document_id: str  # UUID como string
+    namespace: str = ""  # Namespace de Pinecone ("" = por defecto)
+    content_hash: str | None = None  # sha256 del texto extraído
     text_length: int
     chunks_count: int
     vectors_count: int
+    chunks_new: int = 0  # Vectorizados y almacenados en esta subida
+    chunks_reused: int = 0  # Ya estaban en el índice (sin cambios)
+    chunks_deleted: int = 0  # De la versión anterior, eliminados
     status: str = "success"
     message: str = ""
+
+
+class BulkFileResult(SQLModel):
+    """Resultado de un archivo dentro de una ingesta masiva"""
+
+    filename: str
+    status: str  # completed, failed o skipped
+    result: DocumentResponse | None = None
+    error: str | None = None
+
+
+class BulkIngestionResponse(SQLModel):
+    """Resultado de una ingesta masiva con throughput total"""
+
+    files_total: int
+    files_completed: int
+    files_failed: int
+    files_skipped: int
+    chunks_total: int
+    chunks_new: int
+    chunks_reused: int
+    chunks_deleted: int
+    total_seconds: float
+    files_per_second: float
+    chunks_per_second: float
+    files: list[BulkFileResult] = []
@@ -0,0 +1,53 @@
+from datetime import datetime
+from enum import StrEnum
+
+from sqlmodel import SQLModel
+
+from app.schemas.document import BulkIngestionResponse, DocumentResponse
+
+
+class JobStatus(StrEnum):
+    queued = "queued"
+    running = "running"
+    completed = "completed"
+    failed = "failed"
+
+
+class JobStage(StrEnum):
+    queued = "queued"
+    extracting = "extracting"  # Incluye la división en chunks (en flujo)
+    embedding = "embedding"
+    upserting = "upserting"
+    done = "done"
+
+
+class IngestionJobResponse(SQLModel):
+    """Estado de un trabajo de ingesta"""
+
+    job_id: str
+    filename: str
+    namespace: str = ""  # Namespace de Pinecone ("" = por defecto)
+    status: JobStatus
+    stage: JobStage
+    status_url: str
+
+    # Progreso
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+
+    # Tiempos (segundos por etapa)
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    stage_timings: dict[str, float] = {}
+
+    # Resultado final
+    result: DocumentResponse | None = None
+    error: str | None = None
+
+
+class BulkIngestionJobResponse(IngestionJobResponse):
+    """Estado de un trabajo de ingesta masiva"""
+
+    files_total: int = 0  # Archivos subidos (un zip/tar cuenta como uno)
+    result: BulkIngestionResponse | None = None
@@ -3,12 +3,23 @@ from pydantic import field_validator
 from sqlmodel import SQLModel, Field
 
 
+class QueryFilters(SQLModel):
+    """Filtros de metadata de la búsqueda (se combinan con AND)"""
+
+    document_id: str | None = None
+    filename: str | None = None
+    uploaded_after: datetime | None = None
+    uploaded_before: datetime | None = None
+
+
 class QueryRequest(SQLModel):
     """Request para consultas"""
 
     query: str = Field(min_length=1, max_length=1000)
     max_results: int = Field(default=5, ge=1, le=20)
     similarity_threshold: float = Field(default=0.7, ge=0.0, le=1.0)
+    namespace: str = ""  # Namespace de Pinecone ("" = por defecto)
+    filters: QueryFilters | None = None
 
     @field_validator("query")
     @classmethod
@@ -41,6 +52,37 @@ class QueryResponse(SQLModel):
     average_similarity: float | None = None
     context_chunks_used: int | None = None
 
+    # Respuesta tomada del cache semántico (consulta parecida ya respondida)
+    cached: bool = False
+    cache_similarity: float | None = None
+
+
+class BatchQueryRequest(SQLModel):
+    """Request para varias consultas con los mismos parámetros"""
+
+    queries: list[str] = Field(min_length=1)
+    max_results: int = Field(default=5, ge=1, le=20)
+    similarity_threshold: float = Field(default=0.7, ge=0.0, le=1.0)
+    namespace: str = ""
+    filters: QueryFilters | None = None
+
+    @field_validator("queries")
+    @classmethod
+    def validate_queries(cls, v):
+        # Las consultas vacías o cortas no rechazan el lote: las responde
+        # el guard rail de cada una
+        if any(len(query) > 1000 for query in v):
+            raise ValueError("Cada query puede tener como máximo 1000 caracteres")
+        return [query.strip() for query in v]
+
+
+class BatchQueryResponse(SQLModel):
+    """Respuestas de un lote de consultas, en el orden recibido"""
+
+    results: list[QueryResponse]
+    total_seconds: float
+    queries_per_second: float
+
 
 class QueryStats(SQLModel):
     """Estadísticas de consultas (opcional para aprendizaje)"""
@@ -1,11 +1,17 @@
+from functools import lru_cache
+
 from langchain_openai import ChatOpenAI
 from ..core.config import settings
+from ..core.http import get_async_http_client, get_http_client
 
 
+@lru_cache(maxsize=8)
 def create_llm(temperature: float = 0.7) -> ChatOpenAI:
-    """Crea cliente LLM"""
+    """Obtiene el cliente LLM compartido (uno por temperatura)"""
     return ChatOpenAI(
         api_key=settings.OPENAI_API_KEY,
         model="gpt-4o-mini",
         temperature=temperature,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
     )
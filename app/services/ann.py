@@ -0,0 +1,982 @@
+import json
+import math
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import IO, Any
+
+import numpy as np
+
+from ..core.config import settings
+from ..core.logging import app_logger as logger
+from .local_vector_store import matches_filter, namespace_file_name, normalized_values
+from .pinecone import bump_index_generation
+from .quantization import Quantizer, create_quantizer
+from .vector_store import VectorStore
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+# Filas reservadas al crear un índice (los archivos se duplican al llenarse)
+INITIAL_CAPACITY = 1024
+
+# Filas leídas por bloque al asignar vectores a sus listas (acota la memoria)
+ASSIGN_BLOCK_ROWS = 65_536
+
+# Muestra usada para entrenar los centroides
+TRAIN_SAMPLES_PER_LIST = 64
+TRAIN_MAX_SAMPLES = 200_000
+KMEANS_ITERATIONS = 10
+
+# Se reentrena cuando los vectores vivos se multiplican por este factor
+RETRAIN_GROWTH = 4
+
+# Asignación de una fila eliminada
+DELETED = -1
+
+# SQLite limita la cantidad de parámetros por sentencia
+SQLITE_BATCH_SIZE = 500
+
+VECTORS_FILE = "vectors.f32"
+ASSIGNMENTS_FILE = "assignments.i32"
+CENTROIDS_FILE = "centroids.npy"
+CODES_FILE = "codes.bin"
+QUANTIZER_FILE = "quantizer.npz"
+DATABASE_FILE = "index.sqlite3"
+LOCK_FILE = "index.lock"
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Lista (centroide más parecido) de cada vector, por bloques"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start : start + ASSIGN_BLOCK_ROWS])
+        labels[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(
+    data: np.ndarray, nlist: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0
+) -> np.ndarray:
+    """
+    Centroides normalizados de `data` (k-means con similitud coseno)
+
+    Las listas que quedan vacías se vuelven a sembrar con puntos al azar.
+    """
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(data))
+    centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = nearest_centroids(data, centroids)
+        counts = np.bincount(labels, minlength=nlist)
+        order = np.argsort(labels, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        sums = np.zeros_like(centroids)
+        filled = counts > 0
+        sums[filled] = np.add.reduceat(data[order], starts[filled], axis=0)
+        empty = np.flatnonzero(~filled)
+        if empty.size:
+            sums[empty] = data[rng.choice(len(data), empty.size, replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms > 0, norms, 1.0)
+
+    return centroids.astype(np.float32)
+
+
+def encode_vectors(
+    quantizer: Quantizer,
+    centroids: np.ndarray | None,
+    vectors: np.ndarray,
+    labels: np.ndarray,
+) -> np.ndarray:
+    """Códigos de vectores asignados a las listas `labels`"""
+    if quantizer.residual:
+        vectors = vectors - centroids[labels]
+    return quantizer.encode(vectors)
+
+
+class IVFIndex:
+    """
+    Índice IVF (inverted file) de un namespace sobre archivos mapeados
+
+    Los vectores (normalizados) viven en `vectors.f32` y la lista de cada
+    fila en `assignments.i32`, ambos abiertos con `np.memmap`: abrir un
+    índice de varios GB solo lee las asignaciones (4 bytes por vector) y
+    el sistema operativo trae a memoria las filas que se consultan. Los
+    ids y la metadata se guardan en SQLite.
+
+    Una consulta compara contra los centroides, revisa las `nprobe` listas
+    más cercanas con un producto matriz-vector y devuelve el top-k; más
+    listas revisadas = mejor recall y menos consultas por segundo. Hasta
+    ANN_TRAIN_MIN_VECTORS no hay centroides y la búsqueda es exacta.
+
+    Con cuantización (ANN_QUANTIZATION: float16, int8 o pq) se guarda además
+    un código compacto por vector en `codes.bin`: la primera pasada puntúa
+    los códigos y solo los ANN_RESCORE_FACTOR * top_k mejores candidatos se
+    vuelven a puntuar con los vectores exactos del disco. El cuantizador se
+    ajusta al entrenar; antes la búsqueda es exacta.
+
+    Las inserciones agregan filas al final y las asignan a su lista; los
+    borrados marcan la fila como eliminada y, cuando las filas eliminadas
+    superan a las vivas, los archivos se compactan. El entrenamiento que
+    disparan las inserciones corre en un hilo aparte y sin el lock del
+    índice (ver train), así que ni las consultas ni la ingesta esperan.
+
+    Un índice admite un solo proceso: al abrirlo se toma un bloqueo
+    exclusivo sobre `index.lock`, y un segundo proceso falla en lugar de
+    escribir filas encima de las del primero.
+    """
+
+    def __init__(
+        self, path: str | Path, namespace: str = "", quantization: str | None = None
+    ):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        # Un entrenamiento a la vez; el lock del índice solo se toma para
+        # leer la muestra y para reemplazar centroides y asignaciones
+        self._train_lock = threading.Lock()
+        self._trainer: threading.Thread | None = None
+        # Cambia al compactar: las filas de un entrenamiento en curso ya no valen
+        self._layout = 0
+        self._lock_file = self._acquire_file_lock()
+
+        self._conn = sqlite3.connect(
+            str(self.path / DATABASE_FILE),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vectors (
+                id TEXT PRIMARY KEY,
+                row INTEGER NOT NULL UNIQUE,
+                metadata TEXT NOT NULL
+            )
+            """
+        )
+
+        meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        self.namespace = meta.get("namespace", namespace)
+        self.dimension = int(meta.get("dimension", 0))
+        self.capacity = int(meta.get("capacity", 0))
+        # Filas usadas, incluidas las eliminadas
+        self.count = int(meta.get("count", 0))
+        self.deleted = int(meta.get("deleted", 0))
+        self.trained_size = int(meta.get("trained_size", 0))
+        # La cuantización se fija al crear el índice
+        self.quantization = meta.get(
+            "quantization", quantization or settings.ANN_QUANTIZATION
+        )
+        if "namespace" not in meta:
+            self._set_meta(namespace=namespace, quantization=self.quantization)
+
+        # Cuantizador ajustado (None hasta entrenar o sin cuantización)
+        self.quantizer: Quantizer | None = None
+        quantizer = create_quantizer(self.quantization, settings.ANN_PQ_SUBVECTORS)
+        if quantizer is not None and (self.path / QUANTIZER_FILE).exists():
+            quantizer.load(self.path / QUANTIZER_FILE)
+            self.quantizer = quantizer
+
+        centroids_path = self.path / CENTROIDS_FILE
+        self.centroids = np.load(centroids_path) if centroids_path.exists() else None
+
+        self._vectors: np.memmap | None = None
+        self._assignments: np.memmap | None = None
+        self._codes: np.memmap | None = None
+        if self.capacity:
+            self._open_files()
+        self._build_lists()
+
+    @property
+    def size(self) -> int:
+        """Vectores vivos"""
+        return self.count - self.deleted
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids) if self.centroids is not None else 1
+
+    # Escritura
+
+    def upsert(self, ids: list[str], values: np.ndarray, metadata: list[dict]) -> None:
+        """Agrega vectores (ya normalizados); un id repetido reemplaza al anterior"""
+        # Dentro de un lote gana la última aparición de cada id
+        positions = list({vector_id: i for i, vector_id in enumerate(ids)}.values())
+        if len(positions) != len(ids):
+            ids = [ids[i] for i in positions]
+            values = values[positions]
+            metadata = [metadata[i] for i in positions]
+
+        with self._lock:
+            if not self.dimension:
+                self.dimension = values.shape[1]
+                self._set_meta(dimension=self.dimension)
+            if values.shape[1] != self.dimension:
+                raise ValueError(
+                    f"Dimensión {values.shape[1]} distinta a la del índice "
+                    f"({self.dimension})"
+                )
+
+            replaced = self._rows_of(ids)
+            if replaced:
+                self._assignments[list(replaced.values())] = DELETED
+
+            self._reserve(self.count + len(ids))
+            rows = np.arange(self.count, self.count + len(ids))
+            self._vectors[rows[0] : rows[-1] + 1] = values
+            labels = (
+                nearest_centroids(values, self.centroids)
+                if self.centroids is not None
+                else np.zeros(len(ids), dtype=np.int32)
+            )
+            self._assignments[rows[0] : rows[-1] + 1] = labels
+            if self.quantizer is not None:
+                self._codes[rows[0] : rows[-1] + 1] = self._encode(values, labels)
+            self._flush()
+
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (id, row, metadata) VALUES (?, ?, ?)",
+                zip(
+                    ids,
+                    rows.tolist(),
+                    (json.dumps(m, ensure_ascii=False) for m in metadata),
+                    strict=True,
+                ),
+            )
+            self.count += len(ids)
+            self.deleted += len(replaced)
+            self._set_meta(count=self.count, deleted=self.deleted)
+            self._conn.execute("COMMIT")
+
+            for label in np.unique(labels):
+                self._pending[label].extend(rows[labels == label].tolist())
+
+            if self._needs_training():
+                self._train_in_background()
+
+    def fetch_metadata(self, ids: list[str]) -> dict[str, dict[str, Any]]:
+        """Metadata de vectores existentes por id"""
+        with self._lock:
+            return {
+                vector_id: json.loads(metadata)
+                for vector_id, metadata in self._metadata_of(ids).items()
+            }
+
+    def update_metadata(self, metadata: dict[str, dict[str, Any]]) -> int:
+        """Combina campos en la metadata de vectores existentes"""
+        with self._lock:
+            current = self._metadata_of(list(metadata))
+            if not current:
+                return 0
+
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE vectors SET metadata = ? WHERE id = ?",
+                (
+                    (
+                        json.dumps(
+                            {**json.loads(current[vector_id]), **metadata[vector_id]},
+                            ensure_ascii=False,
+                        ),
+                        vector_id,
+                    )
+                    for vector_id in current
+                ),
+            )
+            self._conn.execute("COMMIT")
+            return len(current)
+
+    def delete(self, ids: list[str]) -> int:
+        """Marca vectores como eliminados; devuelve la cantidad eliminada"""
+        with self._lock:
+            rows = self._rows_of(ids)
+            if not rows:
+                return 0
+
+            self._assignments[list(rows.values())] = DELETED
+            self._flush()
+
+            self._conn.execute("BEGIN")
+            self._delete_ids(list(rows))
+            self.deleted += len(rows)
+            self._set_meta(deleted=self.deleted)
+            self._conn.execute("COMMIT")
+
+            if self.deleted > max(self.size, INITIAL_CAPACITY):
+                self.compact()
+            return len(rows)
+
+    def train(self, nlist: int | None = None) -> None:
+        """
+        Entrena los centroides con una muestra y reasigna todos los vectores
+
+        La muestra se lee con el lock del índice; el k-means, la
+        reasignación de las filas vivas y los códigos del cuantizador (en un
+        archivo aparte) se calculan sin él, así que las consultas y las
+        escrituras siguen mientras tanto. El reemplazo final toma el lock:
+        respeta las filas eliminadas entretanto y asigna las agregadas. Si
+        el índice se compactó o se cerró, el resultado se descarta.
+
+        Args:
+            nlist: Cantidad de listas (por defecto ANN_NLIST o 4 * √vectores)
+        """
+        with self._train_lock:
+            with self._lock:
+                live_rows = self._live_rows()
+                if not live_rows.size:
+                    return
+                count, layout, vectors = self.count, self._layout, self._vectors
+
+                nlist = (
+                    nlist or settings.ANN_NLIST or int(4 * math.sqrt(live_rows.size))
+                )
+                nlist = max(1, min(nlist, live_rows.size))
+                rng = np.random.default_rng(0)
+                samples = min(live_rows.size, nlist * TRAIN_SAMPLES_PER_LIST)
+                samples = max(min(samples, TRAIN_MAX_SAMPLES), nlist)
+                sample = vectors[np.sort(rng.choice(live_rows, samples, replace=False))]
+
+            start = time.perf_counter()
+            centroids = spherical_kmeans(np.asarray(sample), nlist)
+            labels = np.full(count, DELETED, dtype=np.int32)
+            for i in range(0, live_rows.size, ASSIGN_BLOCK_ROWS):
+                block = live_rows[i : i + ASSIGN_BLOCK_ROWS]
+                labels[block] = nearest_centroids(vectors[block], centroids)
+            quantizer = self._fit_quantizer(
+                np.asarray(sample), centroids, vectors, live_rows, labels
+            )
+
+            with self._lock:
+                if self._layout != layout or self._vectors is None:
+                    (self.path / f"{CODES_FILE}.tmp").unlink(missing_ok=True)
+                    logger.info(f"🧭 IVF '{self.namespace}': entrenamiento descartado")
+                    return
+                self._install_training(count, centroids, labels, quantizer)
+
+            logger.info(
+                f"🧭 IVF '{self.namespace}' entrenado: {nlist} listas para "
+                f"{live_rows.size} vectores ({self.quantization}) en "
+                f"{time.perf_counter() - start:.2f}s"
+            )
+
+    def wait_for_training(self, timeout: float | None = None) -> None:
+        """Espera al entrenamiento en segundo plano, si hay uno en curso"""
+        trainer = self._trainer
+        if trainer is not None:
+            trainer.join(timeout)
+
+    def _train_in_background(self) -> None:
+        """Lanza el entrenamiento en un hilo (si no hay otro en curso)"""
+        if self._trainer is not None and self._trainer.is_alive():
+            return
+        self._trainer = threading.Thread(
+            target=self._train_safely, name="ivf-train", daemon=True
+        )
+        self._trainer.start()
+
+    def _train_safely(self) -> None:
+        try:
+            self.train()
+        except Exception as e:
+            logger.error(f"❌ Error entrenando el IVF '{self.namespace}': {e}")
+
+    def _fit_quantizer(
+        self,
+        sample: np.ndarray,
+        centroids: np.ndarray,
+        vectors: np.ndarray,
+        live_rows: np.ndarray,
+        labels: np.ndarray,
+    ) -> Quantizer | None:
+        """
+        Ajusta el cuantizador y codifica las filas vivas en `codes.bin.tmp`
+
+        Corre sin el lock del índice; _install_training instala el archivo.
+        """
+        quantizer = create_quantizer(self.quantization, settings.ANN_PQ_SUBVECTORS)
+        if quantizer is None:
+            return None
+
+        if quantizer.residual:
+            sample = sample - centroids[nearest_centroids(sample, centroids)]
+        quantizer.fit(sample)
+
+        width = quantizer.width(self.dimension)
+        temporary = self.path / f"{CODES_FILE}.tmp"
+        with open(temporary, "wb") as f:
+            f.truncate(len(labels) * width * quantizer.dtype.itemsize)
+        if len(labels):
+            codes = np.memmap(
+                temporary, dtype=quantizer.dtype, mode="r+", shape=(len(labels), width)
+            )
+            for i in range(0, live_rows.size, ASSIGN_BLOCK_ROWS):
+                block = live_rows[i : i + ASSIGN_BLOCK_ROWS]
+                codes[block] = encode_vectors(
+                    quantizer, centroids, np.asarray(vectors[block]), labels[block]
+                )
+            codes.flush()
+            del codes
+        return quantizer
+
+    def _install_training(
+        self,
+        count: int,
+        centroids: np.ndarray,
+        labels: np.ndarray,
+        quantizer: Quantizer | None,
+    ) -> None:
+        """Reemplaza centroides, asignaciones y códigos (con el lock tomado)"""
+        # Filas eliminadas o reemplazadas durante el entrenamiento
+        labels[np.asarray(self._assignments[:count]) == DELETED] = DELETED
+        self._assignments[:count] = labels
+        added = np.arange(count, self.count)
+        added = added[np.asarray(self._assignments[count : self.count]) != DELETED]
+        added_labels = (
+            nearest_centroids(self._vectors[added], centroids)
+            if added.size
+            else np.zeros(0, dtype=np.int32)
+        )
+        self._assignments[added] = added_labels
+        self.centroids = centroids
+
+        if quantizer is not None:
+            self.quantizer = quantizer
+            self._codes = None
+            temporary = self.path / f"{CODES_FILE}.tmp"
+            with open(temporary, "ab") as f:
+                f.truncate(self.capacity * self.code_bytes)
+            os.replace(temporary, self.path / CODES_FILE)
+            self._open_codes()
+            if added.size:
+                self._codes[added] = self._encode(
+                    np.asarray(self._vectors[added]), added_labels
+                )
+            temporary = self.path / f"{QUANTIZER_FILE}.tmp"
+            quantizer.save(temporary)
+            os.replace(temporary, self.path / QUANTIZER_FILE)
+        self._flush()
+
+        temporary = self.path / f"{CENTROIDS_FILE}.tmp"
+        with open(temporary, "wb") as f:
+            np.save(f, centroids)
+        os.replace(temporary, self.path / CENTROIDS_FILE)
+        self.trained_size = self.size
+        self._set_meta(trained_size=self.trained_size)
+        self._build_lists()
+
+    def compact(self) -> None:
+        """Reescribe los archivos sin las filas eliminadas"""
+        with self._lock:
+            live_rows = self._live_rows()
+            # Cada fila baja a una posición menor o igual: copiando por
+            # bloques en orden creciente nunca se pisa una fila sin leer
+            for start in range(0, live_rows.size, ASSIGN_BLOCK_ROWS):
+                old = live_rows[start : start + ASSIGN_BLOCK_ROWS]
+                new = slice(start, start + old.size)
+                for data in (self._vectors, self._assignments, self._codes):
+                    if data is not None:
+                        data[new] = data[old]
+            self._flush()
+
+            # En orden creciente ninguna fila nueva choca con una vieja
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE vectors SET row = ? WHERE row = ?",
+                (
+                    (new_row, old_row)
+                    for new_row, old_row in enumerate(live_rows.tolist())
+                    if new_row != old_row
+                ),
+            )
+            self.count = int(live_rows.size)
+            self.deleted = 0
+            self._layout += 1
+            self._set_meta(count=self.count, deleted=0)
+            self._conn.execute("COMMIT")
+            self._build_lists()
+
+            logger.info(f"🧹 IVF '{self.namespace}' compactado: {self.count} vectores")
+
+    # Lectura
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        filter: dict[str, Any] | None = None,
+        nprobe: int | None = None,
+        include_metadata: bool = True,
+    ) -> list[dict[str, Any]]:
+        """
+        Los `top_k` vectores más parecidos a `query`
+
+        Con filtro, si las listas revisadas no alcanzan para `top_k`
+        resultados se revisan todas (un filtro muy selectivo puede dejar
+        sus vectores fuera de las listas más cercanas).
+        """
+        with self._lock:
+            if not self.size or top_k <= 0:
+                return []
+
+            probed = self._probe(query, nprobe or settings.ANN_NPROBE)
+            rows, scores = self._search_lists(query, probed, top_k, filter)
+            if filter and rows.size < top_k and len(probed) < self.nlist:
+                rows, scores = self._search_lists(
+                    query, np.arange(self.nlist), top_k, filter
+                )
+            return self._matches(rows, scores, include_metadata)
+
+    def list_ids(self, prefix: str) -> list[str]:
+        with self._lock:
+            return [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT id FROM vectors WHERE id >= ? AND id < ? ORDER BY id",
+                    (prefix, prefix + "\U0010ffff"),
+                )
+            ]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "vector_count": self.size,
+            "deleted": self.deleted,
+            "lists": self.nlist if self.centroids is not None else 0,
+            "quantization": self.quantization if self.quantizer is not None else "none",
+            "code_bytes": self.code_bytes,
+        }
+
+    @property
+    def code_bytes(self) -> int:
+        """Bytes por vector de la primera pasada (códigos o float32)"""
+        if self.quantizer is None:
+            return self.dimension * 4
+        return self.quantizer.width(self.dimension) * self.quantizer.dtype.itemsize
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._vectors = self._assignments = self._codes = None
+            self._conn.close()
+            # Libera el bloqueo entre procesos
+            self._lock_file.close()
+
+    # Internos
+
+    def _probe(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Listas más cercanas a la consulta"""
+        if self.centroids is None:
+            return np.zeros(1, dtype=np.int64)
+        nprobe = min(nprobe, self.nlist)
+        return np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+
+    def _search_lists(
+        self,
+        query: np.ndarray,
+        lists: np.ndarray,
+        top_k: int,
+        filter: dict[str, Any] | None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Mejores filas vivas de las listas indicadas y su score exacto
+
+        Con cuantización la primera pasada usa los códigos y se vuelven a
+        puntuar con los vectores exactos ANN_RESCORE_FACTOR * top_k
+        candidatos.
+        """
+        rows = np.sort(np.concatenate([self._list_rows(int(c)) for c in lists]))
+        rows = rows[self._assignments[rows] != DELETED]
+
+        if self.quantizer is None:
+            limit = top_k
+            scores = self._exact_scores(query, rows)
+        else:
+            limit = top_k * settings.ANN_RESCORE_FACTOR
+            scores = self._approximate_scores(query, rows)
+
+        if filter:
+            selected = self._filtered_positions(rows, scores, limit, filter)
+        else:
+            limit = min(limit, rows.size)
+            selected = np.argpartition(-scores, limit - 1)[:limit] if limit else []
+        rows, scores = rows[selected], scores[selected]
+
+        if self.quantizer is not None:
+            scores = self._exact_scores(query, rows)
+        top = np.argsort(-scores, kind="stable")[:top_k]
+        return rows[top], scores[top]
+
+    def _encode(self, vectors: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        """Códigos de vectores asignados a las listas `labels`"""
+        return encode_vectors(self.quantizer, self.centroids, vectors, labels)
+
+    def _acquire_file_lock(self) -> IO[bytes]:
+        """Bloqueo exclusivo del índice para este proceso"""
+        lock_file = open(self.path / LOCK_FILE, "ab")  # noqa: SIM115 - se cierra en close
+        if fcntl is None:
+            return lock_file
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise ValueError(
+                f"El índice {self.path} ya está abierto en otro proceso: "
+                "ANN_INDEX_PATH admite un único worker"
+            ) from None
+        return lock_file
+
+    def _approximate_scores(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Score de la primera pasada a partir de los códigos"""
+        scores = self.quantizer.scores(query, self._codes[rows])
+        if self.quantizer.residual:
+            # q·v = q·centroide + q·residuo
+            scores += (self.centroids @ query)[self._assignments[rows]]
+        return scores
+
+    def _exact_scores(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Producto punto con los vectores exactos (leídos del disco)"""
+        scores = np.empty(rows.size, dtype=np.float32)
+        for i in range(0, rows.size, ASSIGN_BLOCK_ROWS):
+            block = rows[i : i + ASSIGN_BLOCK_ROWS]
+            scores[i : i + block.size] = self._vectors[block] @ query
+        return scores
+
+    def _list_rows(self, label: int) -> np.ndarray:
+        """Filas de una lista (incluye las agregadas desde la última lectura)"""
+        if self._pending[label]:
+            self._lists[label] = np.concatenate(
+                (self._lists[label], np.asarray(self._pending[label], dtype=np.int64))
+            )
+            self._pending[label] = []
+        return self._lists[label]
+
+    def _filtered_positions(
+        self,
+        rows: np.ndarray,
+        scores: np.ndarray,
+        limit: int,
+        filter: dict[str, Any],
+    ) -> np.ndarray:
+        """Recorre los candidatos por score hasta juntar `limit` que cumplan"""
+        order = np.argsort(-scores, kind="stable")
+        selected: list[int] = []
+        step = max(limit * 4, 64)
+        for start in range(0, order.size, step):
+            block = order[start : start + step]
+            records = self._records(rows[block].tolist())
+            for position in block.tolist():
+                metadata = json.loads(records[int(rows[position])][1])
+                if matches_filter(metadata, filter):
+                    selected.append(position)
+                    if len(selected) == limit:
+                        return np.asarray(selected, dtype=np.int64)
+        return np.asarray(selected, dtype=np.int64)
+
+    def _matches(
+        self, rows: np.ndarray, scores: np.ndarray, include_metadata: bool
+    ) -> list[dict[str, Any]]:
+        """Resultados con id y metadata (de SQLite) en el orden de `rows`"""
+        records = self._records(rows.tolist())
+        return [
+            {
+                "id": records[row][0],
+                "score": float(score),
+                "metadata": json.loads(records[row][1]) if include_metadata else {},
+            }
+            for row, score in zip(rows.tolist(), scores.tolist(), strict=True)
+        ]
+
+    def _records(self, rows: list[int]) -> dict[int, tuple[str, str]]:
+        records = {}
+        for i in range(0, len(rows), SQLITE_BATCH_SIZE):
+            batch = rows[i : i + SQLITE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            for row, vector_id, metadata in self._conn.execute(
+                f"SELECT row, id, metadata FROM vectors WHERE row IN ({placeholders})",
+                batch,
+            ):
+                records[row] = (vector_id, metadata)
+        return records
+
+    def _rows_of(self, ids: list[str]) -> dict[str, int]:
+        rows = {}
+        for i in range(0, len(ids), SQLITE_BATCH_SIZE):
+            batch = ids[i : i + SQLITE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows.update(
+                self._conn.execute(
+                    f"SELECT id, row FROM vectors WHERE id IN ({placeholders})", batch
+                ).fetchall()
+            )
+        return rows
+
+    def _metadata_of(self, ids: list[str]) -> dict[str, str]:
+        metadata = {}
+        for i in range(0, len(ids), SQLITE_BATCH_SIZE):
+            batch = ids[i : i + SQLITE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            metadata.update(
+                self._conn.execute(
+                    f"SELECT id, metadata FROM vectors WHERE id IN ({placeholders})",
+                    batch,
+                ).fetchall()
+            )
+        return metadata
+
+    def _delete_ids(self, ids: list[str]) -> None:
+        for i in range(0, len(ids), SQLITE_BATCH_SIZE):
+            batch = ids[i : i + SQLITE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(
+                f"DELETE FROM vectors WHERE id IN ({placeholders})", batch
+            )
+
+    def _live_rows(self) -> np.ndarray:
+        if not self.count:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(np.asarray(self._assignments[: self.count]) != DELETED)
+
+    def _needs_training(self) -> bool:
+        if self.centroids is None:
+            return self.size >= settings.ANN_TRAIN_MIN_VECTORS
+        return self.size >= RETRAIN_GROWTH * self.trained_size
+
+    def _build_lists(self) -> None:
+        """Arma las filas de cada lista a partir de las asignaciones"""
+        live_rows = self._live_rows()
+        labels = (
+            np.asarray(self._assignments[live_rows])
+            if live_rows.size
+            else np.zeros(0, dtype=np.int32)
+        )
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(self.nlist + 1))
+        rows = live_rows[order]
+        self._lists = [rows[bounds[i] : bounds[i + 1]] for i in range(self.nlist)]
+        self._pending: list[list[int]] = [[] for _ in range(self.nlist)]
+
+    def _reserve(self, rows: int) -> None:
+        """Agranda los archivos para que entren `rows` filas"""
+        if rows <= self.capacity:
+            return
+        capacity = max(self.capacity, INITIAL_CAPACITY)
+        while capacity < rows:
+            capacity *= 2
+
+        self._flush()
+        self._vectors = self._assignments = self._codes = None
+        files = [(VECTORS_FILE, self.dimension * 4), (ASSIGNMENTS_FILE, 4)]
+        if self.quantizer is not None:
+            files.append((CODES_FILE, self.code_bytes))
+        for name, row_bytes in files:
+            with open(self.path / name, "ab") as f:
+                f.truncate(capacity * row_bytes)
+        self.capacity = capacity
+        self._set_meta(capacity=capacity)
+        self._open_files()
+
+    def _open_files(self) -> None:
+        self._vectors = np.memmap(
+            self.path / VECTORS_FILE,
+            dtype=np.float32,
+            mode="r+",
+            shape=(self.capacity, self.dimension),
+        )
+        self._assignments = np.memmap(
+            self.path / ASSIGNMENTS_FILE,
+            dtype=np.int32,
+            mode="r+",
+            shape=(self.capacity,),
+        )
+        if self.quantizer is not None:
+            self._open_codes()
+
+    def _open_codes(self, create: bool = False) -> None:
+        """Abre (o crea, vacío) el archivo de códigos del cuantizador"""
+        if create:
+            with open(self.path / CODES_FILE, "wb") as f:
+                f.truncate(self.capacity * self.code_bytes)
+        self._codes = np.memmap(
+            self.path / CODES_FILE,
+            dtype=self.quantizer.dtype,
+            mode="r+",
+            shape=(self.capacity, self.quantizer.width(self.dimension)),
+        )
+
+    def _flush(self) -> None:
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._assignments.flush()
+        if self._codes is not None:
+            self._codes.flush()
+
+    def _set_meta(self, **values: Any) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            ((key, str(value)) for key, value in values.items()),
+        )
+
+
+class ANNVectorStore(VectorStore):
+    """
+    Almacén de vectores local con un índice IVF por namespace
+
+    Cada namespace es un directorio dentro de `path` que se abre la
+    primera vez que se usa. Como el almacén local, ignora los vectores
+    dispersos.
+    """
+
+    def __init__(self, path: str | Path, nprobe: int | None = None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.nprobe = nprobe
+        self._indexes: dict[str, IVFIndex] = {}
+        self._lock = threading.Lock()
+
+    def index(self, namespace: str = "", create: bool = False) -> IVFIndex | None:
+        """Índice de un namespace (None si no existe y `create` es False)"""
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is None:
+                directory = self.path / namespace_file_name(namespace)
+                if not create and not directory.exists():
+                    return None
+                index = self._indexes[namespace] = IVFIndex(directory, namespace)
+            return index
+
+    def upsert(self, vectors: list[dict[str, Any]], namespace: str = "") -> list[str]:
+        if not vectors:
+            return []
+
+        start = time.perf_counter()
+        ids = [vector["id"] for vector in vectors]
+        metadata = [dict(vector.get("metadata") or {}) for vector in vectors]
+        self.index(namespace, create=True).upsert(
+            ids, normalized_values(vectors), metadata
+        )
+        bump_index_generation()
+
+        logger.info(
+            f"📤 Upsert IVF de {len(ids)} vectores en "
+            f"{(time.perf_counter() - start) * 1000:.2f} ms"
+        )
+        return ids
+
+    def query(
+        self,
+        vector: list[float],
+        top_k: int,
+        namespace: str = "",
+        filter: dict[str, Any] | None = None,
+        sparse_vector: dict[str, list] | None = None,
+        include_metadata: bool = True,
+    ) -> list[dict[str, Any]]:
+        index = self.index(namespace)
+        if index is None:
+            return []
+        return index.search(
+            np.asarray(vector, dtype=np.float32),
+            top_k,
+            filter=filter,
+            nprobe=self.nprobe,
+            include_metadata=include_metadata,
+        )
+
+    def list_ids(self, prefix: str, namespace: str = "") -> list[str]:
+        index = self.index(namespace)
+        return index.list_ids(prefix) if index is not None else []
+
+    def fetch_metadata(
+        self, ids: list[str], namespace: str = ""
+    ) -> dict[str, dict[str, Any]]:
+        index = self.index(namespace)
+        return index.fetch_metadata(ids) if index is not None else {}
+
+    def update_metadata(
+        self, metadata: dict[str, dict[str, Any]], namespace: str = ""
+    ) -> int:
+        index = self.index(namespace)
+        updated = index.update_metadata(metadata) if index is not None else 0
+        bump_index_generation()
+        return updated
+
+    def delete(self, ids: list[str], namespace: str = "") -> int:
+        index = self.index(namespace)
+        deleted = index.delete(ids) if index is not None else 0
+        bump_index_generation()
+
+        logger.info(f"🗑️ Eliminados {deleted} vectores del índice IVF")
+        return deleted
+
+    def delete_namespace(self, namespace: str) -> None:
+        with self._lock:
+            index = self._indexes.pop(namespace, None)
+            if index is not None:
+                index.close()
+            shutil.rmtree(
+                self.path / namespace_file_name(namespace), ignore_errors=True
+            )
+        bump_index_generation()
+
+        logger.info(f"🗑️ Namespace '{namespace}' eliminado")
+
+    def delete_all(self) -> None:
+        with self._lock:
+            for index in self._indexes.values():
+                index.close()
+            self._indexes.clear()
+            for directory in self.path.iterdir():
+                if directory.is_dir():
+                    shutil.rmtree(directory, ignore_errors=True)
+        bump_index_generation()
+
+    def stats(self) -> dict[str, Any]:
+        namespaces = {}
+        dimension = 0
+        for directory in sorted(self.path.iterdir()):
+            if not (directory / DATABASE_FILE).exists():
+                continue
+            namespace = self._namespace_of(directory)
+            index = self.index(namespace)
+            if index is None or not index.size:
+                continue
+            namespaces[namespace] = index.stats()
+            dimension = dimension or index.dimension
+        return {
+            "total_vector_count": sum(n["vector_count"] for n in namespaces.values()),
+            "dimension": dimension,
+            "namespaces": namespaces,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            for index in self._indexes.values():
+                index.close()
+            self._indexes.clear()
+
+    def _namespace_of(self, directory: Path) -> str:
+        for namespace, index in self._indexes.items():
+            if index.path == directory:
+                return namespace
+        conn = sqlite3.connect(str(directory / DATABASE_FILE))
+        try:
+            row = conn.execute(
+                "SELECT value FROM meta WHERE key = 'namespace'"
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else ""
@@ -0,0 +1,149 @@
+import sqlite3
+import threading
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from ..core.config import settings
+
+# SQLite limita la cantidad de parámetros por sentencia
+SQLITE_BATCH_SIZE = 500
+
+# Nivel de zlib: ~1.8x en chunks de ~1000 caracteres sin frenar la ingesta
+COMPRESSION_LEVEL = 6
+
+
+class ChunkTextStore:
+    """
+    Textos de los chunks comprimidos en SQLite, por namespace e id
+
+    Los vectores solo llevan ids y campos de filtro en su metadata; el
+    texto de cada chunk se guarda acá comprimido con zlib y se recupera en
+    bloque para los resultados de una búsqueda. Los ids de chunk derivan
+    del contenido, así que reescribir un id no cambia su texto.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+        if str(self.path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                namespace TEXT NOT NULL,
+                id TEXT NOT NULL,
+                text BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (namespace, id)
+            ) WITHOUT ROWID
+            """
+        )
+
+    def put_many(self, texts: dict[str, str], namespace: str = "") -> None:
+        """Guarda (o reemplaza) los textos de los chunks de un namespace"""
+        if not texts:
+            return
+
+        rows = []
+        for chunk_id, text in texts.items():
+            raw = text.encode("utf-8")
+            rows.append(
+                (namespace, chunk_id, zlib.compress(raw, COMPRESSION_LEVEL), len(raw))
+            )
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (namespace, id, text, size) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.execute("COMMIT")
+
+    def get_many(self, ids: list[str], namespace: str = "") -> dict[str, str]:
+        """
+        Busca los textos de varios chunks
+
+        Returns:
+            Dict id -> texto solo con los ids encontrados
+        """
+        unique_ids = list(dict.fromkeys(ids))
+        found: dict[str, str] = {}
+
+        with self._lock:
+            for i in range(0, len(unique_ids), SQLITE_BATCH_SIZE):
+                batch = unique_ids[i : i + SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT id, text FROM chunks "
+                    f"WHERE namespace = ? AND id IN ({placeholders})",
+                    [namespace, *batch],
+                ).fetchall()
+                for chunk_id, blob in rows:
+                    found[chunk_id] = zlib.decompress(blob).decode("utf-8")
+
+        return found
+
+    def delete(self, ids: list[str], namespace: str = "") -> None:
+        """Elimina los textos de varios chunks"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "DELETE FROM chunks WHERE namespace = ? AND id = ?",
+                [(namespace, chunk_id) for chunk_id in ids],
+            )
+            self._conn.execute("COMMIT")
+
+    def delete_namespace(self, namespace: str) -> None:
+        """Elimina los textos de un namespace"""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE namespace = ?", (namespace,))
+
+    def stats(self) -> dict[str, Any]:
+        """Cantidad de textos y bytes sin comprimir / comprimidos"""
+        with self._lock:
+            count, size, compressed = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), "
+                "COALESCE(SUM(LENGTH(text)), 0) FROM chunks"
+            ).fetchone()
+        return {
+            "entries": count,
+            "text_bytes": size,
+            "compressed_bytes": compressed,
+            "compression_ratio": size / compressed if compressed else 0.0,
+        }
+
+    def clear(self) -> None:
+        """Vacía el almacén"""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+
+    def close(self) -> None:
+        """Cierra la conexión a SQLite"""
+        with self._lock:
+            self._conn.close()
+
+
+@lru_cache
+def get_chunk_store() -> ChunkTextStore | None:
+    """
+    Obtiene el almacén de textos de chunks del proceso
+
+    None si está desactivado: el texto viaja en la metadata de cada vector.
+    Por defecto solo se activa con los backends locales ("local", "ann").
+    """
+    enabled = settings.CHUNK_TEXT_STORE_ENABLED
+    if enabled is None:
+        enabled = settings.VECTOR_STORE_BACKEND in ("local", "ann")
+    if not enabled:
+        return None
+    return ChunkTextStore(settings.CHUNK_TEXT_STORE_PATH)
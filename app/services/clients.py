@@ -0,0 +1,79 @@
+from dataclasses import dataclass
+
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from app.core.config import settings
+from app.core.http import close_http_clients
+from app.core.logging import app_logger as logger
+from app.services.agent import create_llm
+from app.services.embeddings import check_embedding_dimensions, create_embeddings
+from app.services.pinecone import get_async_pinecone_index, get_pinecone_index
+from app.services.vector_store import VectorStore, get_vector_store
+
+
+@dataclass(frozen=True)
+class Clients:
+    """
+    Clientes compartidos de la app (ver app.api.deps.get_clients)
+
+    Las rutas los reciben por dependencia y los pasan a los servicios. Son
+    los mismos objetos que devuelven create_embeddings, create_llm y
+    get_vector_store, que siguen siendo el valor por defecto fuera de una
+    request (p. ej. en los trabajos de ingesta).
+    """
+
+    embeddings: OpenAIEmbeddings
+    llm: ChatOpenAI
+    vector_store: VectorStore
+
+
+def init_clients() -> Clients:
+    """
+    Crea los clientes compartidos del proceso (se llama en el lifespan)
+
+    Los clientes de embeddings, LLM y Pinecone se crean una sola vez y
+    reutilizan sus pools de conexiones en todas las requests. El almacén
+    local carga sus vectores de disco al crearse. Si el índice ya tiene
+    vectores de otra dimensión que EMBEDDING_DIMENSIONS, falla el arranque.
+
+    Returns:
+        Los clientes, que el lifespan guarda en `app.state.clients`
+    """
+    embeddings = create_embeddings()
+    llm = create_llm()
+    if settings.VECTOR_STORE_BACKEND == "pinecone":
+        get_pinecone_index()
+        get_async_pinecone_index()
+    check_index_dimensions()
+    logger.info(
+        f"🔌 Clientes inicializados (almacén de vectores: "
+        f"{settings.VECTOR_STORE_BACKEND})"
+    )
+    return Clients(embeddings=embeddings, llm=llm, vector_store=get_vector_store())
+
+
+def check_index_dimensions() -> None:
+    """Compara la dimensión del índice con EMBEDDING_DIMENSIONS"""
+    try:
+        dimension = get_vector_store().stats().get("dimension") or 0
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo verificar la dimensión del índice: {e}")
+        return
+    # Un índice vacío todavía no tiene dimensión
+    if dimension:
+        check_embedding_dimensions(dimension, "El índice de vectores")
+
+
+async def close_clients() -> None:
+    """Cierra los pools de conexiones y descarta los clientes compartidos"""
+    await close_http_clients()
+    if get_async_pinecone_index.cache_info().currsize:
+        await get_async_pinecone_index().close()
+    get_async_pinecone_index.cache_clear()
+    if get_vector_store.cache_info().currsize:
+        get_vector_store().close()
+    get_vector_store.cache_clear()
+    create_embeddings.cache_clear()
+    create_llm.cache_clear()
+    get_pinecone_index.cache_clear()
+    logger.info("🔌 Clientes de OpenAI y Pinecone cerrados")
@@ -0,0 +1,129 @@
+from collections import defaultdict
+from typing import Any
+
+from ..core.logging import app_logger as logger
+from ..utils.tokens import CHARS_PER_TOKEN, count_tokens, get_tokenizer
+
+# Separador entre fragmentos del contexto
+CONTEXT_SEPARATOR = "\n\n"
+
+# Solapamiento máximo buscado entre chunks consecutivos (el splitter usa 200)
+MAX_OVERLAP_CHARS = 400
+
+# Solapamiento mínimo para considerar que dos chunks se repiten
+MIN_OVERLAP_CHARS = 8
+
+
+def build_context(results: list[dict[str, Any]], max_tokens: int) -> str:
+    """
+    Arma el contexto del prompt dentro de un presupuesto de tokens
+
+    1. Agrupa los resultados por documento y une los chunks con
+       `chunk_index` consecutivo en un solo fragmento, quitando el texto
+       que el splitter repite entre ellos
+    2. Ordena los fragmentos por el mejor score de sus chunks
+    3. Agrega fragmentos hasta llenar `max_tokens`; el primero que no
+       entra se recorta al presupuesto restante y se descarta el resto
+
+    Args:
+        results: Resultados de Pinecone (con metadata de texto y posición)
+        max_tokens: Tokens máximos del contexto
+
+    Returns:
+        Contexto combinado
+    """
+    segments = merge_adjacent_chunks(results)
+    segments.sort(key=lambda segment: segment["score"], reverse=True)
+
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    parts: list[str] = []
+    used = 0
+    for segment in segments:
+        budget = max_tokens - used - (separator_tokens if parts else 0)
+        if budget <= 0:
+            break
+
+        tokens = count_tokens(segment["text"])
+        if tokens > budget:
+            parts.append(trim_to_tokens(segment["text"], budget))
+            used = max_tokens
+            break
+
+        parts.append(segment["text"])
+        used += tokens + (separator_tokens if len(parts) > 1 else 0)
+
+    logger.debug(
+        f"🧩 Contexto: {len(results)} chunks → {len(segments)} fragmentos, "
+        f"{len(parts)} usados (~{used}/{max_tokens} tokens)"
+    )
+    return CONTEXT_SEPARATOR.join(parts)
+
+
+def merge_adjacent_chunks(results: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Une chunks consecutivos del mismo documento
+
+    Los chunks sin `document_id` o `chunk_index` quedan como fragmentos
+    sueltos. Los textos repetidos (mismo contenido en dos resultados) se
+    incluyen una sola vez.
+
+    Returns:
+        Fragmentos con "text" y "score" (el mejor de sus chunks)
+    """
+    runs: dict[str, list[tuple[int, str, float]]] = defaultdict(list)
+    segments: list[dict[str, Any]] = []
+    seen: set[str] = set()
+
+    for result in results:
+        metadata = result.get("metadata", {})
+        text = metadata.get("text", "").strip()
+        if not text or text in seen:
+            continue
+        seen.add(text)
+
+        score = result.get("score", 0.0)
+        document_id = metadata.get("document_id")
+        chunk_index = metadata.get("chunk_index")
+        if document_id is None or chunk_index is None:
+            segments.append({"text": text, "score": score})
+            continue
+        runs[document_id].append((int(chunk_index), text, score))
+
+    for chunks in runs.values():
+        chunks.sort(key=lambda chunk: chunk[0])
+        previous_index, text, score = chunks[0]
+        for chunk_index, chunk_text, chunk_score in chunks[1:]:
+            if chunk_index == previous_index + 1:
+                text = join_overlapping(text, chunk_text)
+                score = max(score, chunk_score)
+            else:
+                segments.append({"text": text, "score": score})
+                text, score = chunk_text, chunk_score
+            previous_index = chunk_index
+        segments.append({"text": text, "score": score})
+
+    return segments
+
+
+def join_overlapping(first: str, second: str) -> str:
+    """
+    Concatena dos chunks consecutivos sin repetir su solapamiento
+
+    Busca el prefijo más largo de `second` con el que termina `first`
+    (hasta MAX_OVERLAP_CHARS). Si no hay solapamiento claro, los une con
+    un salto de línea.
+    """
+    longest = min(len(first), len(second), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first}\n{second}"
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Recorta un texto a `max_tokens` tokens (aproximado sin tokenizer)"""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return text[: max_tokens * CHARS_PER_TOKEN]
+    tokens = tokenizer.encode(text, disallowed_special=())
+    return tokenizer.decode(tokens[:max_tokens])
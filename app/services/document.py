@@ -1,9 +1,30 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import nullcontext
 from typing import Any
 import logging
+from langchain_openai import ChatOpenAI
+from app.core.config import settings
+from app.core.logging import app_logger as logger
 from app.services.agent import create_llm
-from app.services.embeddings import create_embeddings
-from app.services.pinecone import get_pinecone_index
-from app.schemas.query import QueryResponse, QuerySource
+from app.services.chunk_store import get_chunk_store
+from app.services.clients import Clients
+from app.services.context import build_context
+from app.services.embeddings import (
+    aembed_queries_cached,
+    aembed_query_cached,
+    check_embedding_dimensions,
+    embed_query_cached,
+)
+from app.services.query_cache import normalize_query
+from app.services.pinecone import get_index_generation
+from app.services.rerank import rerank_results
+from app.services.semantic_cache import get_semantic_cache
+from app.services.single_flight import get_query_single_flight
+from app.services.sparse import get_sparse_encoder, hybrid_query_vectors
+from app.services.vector_store import VectorStore, get_vector_store
+from app.schemas.query import QueryFilters, QueryResponse, QuerySource
 
 
 # Setup
@@ -14,6 +35,8 @@ def query_documents(
     query: str,
     max_results: int = 5,
     similarity_threshold: float = 0.7,
+    namespace: str = "",
+    filters: QueryFilters | None = None,
 ) -> QueryResponse:
     """
     Procesa una consulta completa con guard rails
@@ -28,12 +51,349 @@ def query_documents(
         query: Pregunta del usuario
         max_results: Máximo de resultados
         similarity_threshold: Umbral de similitud
+        namespace: Namespace de Pinecone donde buscar
+        filters: Filtros de metadata (documento, archivo, fechas)
 
     Returns:
         QueryResponse con respuesta completa
     """
 
     # 1. Validaciones básicas (guard rails simples)
+    rejected = check_query(query)
+    if rejected:
+        return rejected
+
+    # 2. Respuesta de una consulta parecida (cache semántico)
+    generation = get_index_generation()
+    scope = search_scope(namespace, filters)
+    query_embedding = embed_query_cached(query)
+    cached = get_cached_answer(
+        query, query_embedding, max_results, similarity_threshold, scope
+    )
+    if cached:
+        return cached
+
+    # 3. Buscar documentos similares (en el namespace y con los filtros)
+    search_results = search_similar_documents(
+        query, max_results, query_embedding, namespace, filters
+    )
+
+    # 4. Filtrar por umbral (guard rail: sin resultados relevantes)
+    relevant_results = filter_by_similarity(search_results, similarity_threshold)
+    if not relevant_results:
+        return low_similarity_response(query, search_results, similarity_threshold)
+
+    # 5. Crear contexto y generar respuesta
+    context = create_context_from_results(relevant_results)
+    answer = generate_answer_with_llm(query, context)
+
+    # 6-7. Guard rail de respuesta genérica y respuesta final
+    response = build_answer_response(query, answer, relevant_results)
+    cache_answer(
+        query_embedding, max_results, similarity_threshold, response, generation, scope
+    )
+    return response
+
+
+async def aquery_documents(
+    query: str,
+    max_results: int = 5,
+    similarity_threshold: float = 0.7,
+    namespace: str = "",
+    filters: QueryFilters | None = None,
+    clients: Clients | None = None,
+) -> QueryResponse:
+    """
+    Versión asíncrona de query_documents
+
+    Usa embeddings, búsqueda en Pinecone y LLM asíncronos, así que una
+    consulta lenta no bloquea el event loop ni al resto de las requests
+    del worker. Aplica los mismos guard rails.
+
+    Las consultas idénticas (misma consulta normalizada y parámetros) que
+    llegan mientras otra está en curso esperan su resultado en lugar de
+    repetir embedding, búsqueda y LLM.
+
+    `clients` son los de la app (ver app.api.deps); por defecto, los
+    compartidos del proceso.
+    """
+    rejected = check_query(query)
+    if rejected:
+        return rejected
+
+    async def compute() -> QueryResponse:
+        generation = get_index_generation()
+        query_embedding = await aembed_query_cached(
+            query, clients.embeddings if clients else None
+        )
+        return await aanswer_query(
+            query,
+            query_embedding,
+            max_results,
+            similarity_threshold,
+            generation,
+            namespace=namespace,
+            filters=filters,
+            clients=clients,
+        )
+
+    return await coalesce_query(
+        query, max_results, similarity_threshold, namespace, filters, compute
+    )
+
+
+async def aquery_documents_batch(
+    queries: list[str],
+    max_results: int = 5,
+    similarity_threshold: float = 0.7,
+    llm_concurrency: int | None = None,
+    namespace: str = "",
+    filters: QueryFilters | None = None,
+    clients: Clients | None = None,
+) -> list[QueryResponse]:
+    """
+    Procesa varias consultas a la vez
+
+    1. Aplica los guard rails de entrada a cada consulta
+    2. Genera los embeddings de todas con una sola request
+    3. Busca y responde todas en paralelo, con a lo sumo
+       `llm_concurrency` llamadas al LLM simultáneas
+
+    Si una consulta falla, su respuesta lo indica con el guard rail
+    "error" y el resto del lote sigue.
+
+    Returns:
+        Una respuesta por consulta, en el mismo orden
+    """
+    responses: list[QueryResponse | None] = [check_query(q) for q in queries]
+    pending = [i for i, response in enumerate(responses) if response is None]
+    if not pending:
+        return responses
+
+    generation = get_index_generation()
+    embeddings = await aembed_queries_cached(
+        [queries[i] for i in pending], clients.embeddings if clients else None
+    )
+    llm_limit = asyncio.Semaphore(
+        llm_concurrency or settings.QUERY_BATCH_LLM_CONCURRENCY
+    )
+
+    def compute(query: str, embedding: list[float]):
+        return lambda: aanswer_query(
+            query,
+            embedding,
+            max_results,
+            similarity_threshold,
+            generation,
+            llm_limit,
+            namespace,
+            filters,
+            clients,
+        )
+
+    answers = await asyncio.gather(
+        *(
+            coalesce_query(
+                queries[i],
+                max_results,
+                similarity_threshold,
+                namespace,
+                filters,
+                compute(queries[i], embedding),
+            )
+            for i, embedding in zip(pending, embeddings, strict=True)
+        ),
+        return_exceptions=True,
+    )
+
+    for i, answer in zip(pending, answers, strict=True):
+        if isinstance(answer, Exception):
+            logger.error(f"❌ Error en consulta del lote '{queries[i][:50]}': {answer}")
+            answer = QueryResponse(
+                query=queries[i],
+                answer=f"Query error: {answer}",
+                confidence="none",
+                guard_rail_triggered="error",
+            )
+        responses[i] = answer
+    return responses
+
+
+async def coalesce_query(
+    query: str,
+    max_results: int,
+    similarity_threshold: float,
+    namespace: str,
+    filters: QueryFilters | None,
+    compute: Callable[[], Awaitable[QueryResponse]],
+) -> QueryResponse:
+    """
+    Ejecuta `compute` una sola vez por consulta idéntica en curso
+
+    La clave es la consulta normalizada más los parámetros y el alcance
+    de la búsqueda. Cada request recibe la respuesta con su propio texto
+    de consulta.
+    """
+    single_flight = get_query_single_flight()
+    if single_flight is None:
+        return await compute()
+
+    key = "|".join(
+        [
+            normalize_query(query),
+            str(max_results),
+            str(similarity_threshold),
+            search_scope(namespace, filters),
+        ]
+    )
+    response = await single_flight.run(key, compute)
+    if response.query != query:
+        response = response.model_copy(update={"query": query})
+    return response
+
+
+async def aanswer_query(
+    query: str,
+    query_embedding: list[float],
+    max_results: int,
+    similarity_threshold: float,
+    generation: int,
+    llm_limit: asyncio.Semaphore | None = None,
+    namespace: str = "",
+    filters: QueryFilters | None = None,
+    clients: Clients | None = None,
+) -> QueryResponse:
+    """
+    Responde una consulta ya validada a partir de su embedding
+
+    Cache semántico, búsqueda, guard rail de similitud y LLM (dentro de
+    `llm_limit` si se indica).
+    """
+    scope = search_scope(namespace, filters)
+    cached = get_cached_answer(
+        query, query_embedding, max_results, similarity_threshold, scope
+    )
+    if cached:
+        return cached
+
+    search_results = await asearch_similar_documents(
+        query,
+        max_results,
+        query_embedding,
+        namespace,
+        filters,
+        clients.vector_store if clients else None,
+    )
+
+    relevant_results = filter_by_similarity(search_results, similarity_threshold)
+    if not relevant_results:
+        return low_similarity_response(query, search_results, similarity_threshold)
+
+    context = create_context_from_results(relevant_results)
+    async with llm_limit or nullcontext():
+        answer = await agenerate_answer_with_llm(
+            query, context, clients.llm if clients else None
+        )
+
+    response = build_answer_response(query, answer, relevant_results)
+    cache_answer(
+        query_embedding, max_results, similarity_threshold, response, generation, scope
+    )
+    return response
+
+
+async def astream_query_documents(
+    query: str,
+    max_results: int = 5,
+    similarity_threshold: float = 0.7,
+    namespace: str = "",
+    filters: QueryFilters | None = None,
+    clients: Clients | None = None,
+) -> AsyncIterator[tuple[str, dict[str, Any]]]:
+    """
+    Versión en streaming de aquery_documents
+
+    Emite eventos (nombre, datos) en este orden:
+    1. "sources": fuentes usadas como contexto (vacía si no hay)
+    2. "token": fragmentos de la respuesta a medida que llegan del LLM
+    3. "done": QueryResponse final sin las fuentes (confianza, guard rails,
+       cache) más el tiempo hasta el primer token
+
+    Si un guard rail corta la consulta antes del LLM, no hay eventos
+    "token" y la respuesta va completa en "done". Si se activa después
+    (respuesta genérica), "done" trae la respuesta que reemplaza a la
+    emitida.
+    """
+    start = time.perf_counter()
+    first_token_ms: float | None = None
+
+    def done(response: QueryResponse) -> tuple[str, dict[str, Any]]:
+        data = response.model_dump(mode="json", exclude={"sources"})
+        data["time_to_first_token_ms"] = first_token_ms
+        return "done", data
+
+    rejected = check_query(query)
+    if rejected:
+        yield "sources", {"sources": []}
+        yield done(rejected)
+        return
+
+    generation = get_index_generation()
+    scope = search_scope(namespace, filters)
+    query_embedding = await aembed_query_cached(
+        query, clients.embeddings if clients else None
+    )
+    cached = get_cached_answer(
+        query, query_embedding, max_results, similarity_threshold, scope
+    )
+    if cached:
+        yield "sources", sources_event(cached.sources)
+        first_token_ms = round((time.perf_counter() - start) * 1000, 2)
+        yield "token", {"text": cached.answer}
+        yield done(cached)
+        return
+
+    search_results = await asearch_similar_documents(
+        query,
+        max_results,
+        query_embedding,
+        namespace,
+        filters,
+        clients.vector_store if clients else None,
+    )
+
+    relevant_results = filter_by_similarity(search_results, similarity_threshold)
+    if not relevant_results:
+        yield "sources", {"sources": []}
+        yield done(low_similarity_response(query, search_results, similarity_threshold))
+        return
+
+    yield "sources", sources_event(results_to_sources(relevant_results))
+
+    context = create_context_from_results(relevant_results)
+    parts = []
+    llm = clients.llm if clients else None
+    async for text in astream_answer_with_llm(query, context, llm):
+        if first_token_ms is None:
+            first_token_ms = round((time.perf_counter() - start) * 1000, 2)
+        parts.append(text)
+        yield "token", {"text": text}
+
+    response = build_answer_response(query, "".join(parts), relevant_results)
+    cache_answer(
+        query_embedding, max_results, similarity_threshold, response, generation, scope
+    )
+    logger.info(f"⚡ Primer token en {first_token_ms} ms")
+    yield done(response)
+
+
+def sources_event(sources: list[QuerySource]) -> dict[str, Any]:
+    """Datos del evento de fuentes"""
+    return {"sources": [source.model_dump(mode="json") for source in sources]}
+
+
+def check_query(query: str) -> QueryResponse | None:
+    """Guard rails de entrada: respuesta de rechazo o None si es válida"""
     if not query.strip():
         return QueryResponse(
             query=query,
@@ -50,27 +410,67 @@ def query_documents(
             guard_rail_triggered="short_query",
         )
 
-    # 2. Buscar documentos similares
-    search_results = search_similar_documents(query, max_results)
+    return None
 
-    # 3. Filtrar por umbral
-    relevant_results = filter_by_similarity(search_results, similarity_threshold)
 
-    # 4. Guard rail: sin resultados relevantes
-    if not relevant_results:
-        max_score = max([r.get("score", 0) for r in search_results], default=0)
-        return QueryResponse(
-            query=query,
-            answer=f"No encontré información suficientemente relevante (máx: {max_score:.3f}, requerido: {similarity_threshold:.3f})",
-            confidence="low",
-            guard_rail_triggered="low_similarity",
-        )
+def get_cached_answer(
+    query: str,
+    query_embedding: list[float],
+    max_results: int,
+    similarity_threshold: float,
+    scope: str = "",
+) -> QueryResponse | None:
+    """Respuesta guardada de una consulta parecida (marcada como cacheada)"""
+    cache = get_semantic_cache()
+    if cache is None:
+        return None
+
+    params = cache.make_params(max_results, similarity_threshold, scope)
+    found = cache.get(query_embedding, params)
+    if found is None:
+        return None
+
+    response, similarity = found
+    return response.model_copy(
+        update={"query": query, "cached": True, "cache_similarity": similarity}
+    )
 
-    # 5. Crear contexto y generar respuesta
-    context = create_context_from_results(relevant_results)
-    answer = generate_answer_with_llm(query, context)
 
-    # 6. Guard rail: respuesta demasiado genérica
+def cache_answer(
+    query_embedding: list[float],
+    max_results: int,
+    similarity_threshold: float,
+    response: QueryResponse,
+    generation: int,
+    scope: str = "",
+) -> None:
+    """Guarda una respuesta exitosa en el cache semántico"""
+    cache = get_semantic_cache()
+    if cache is None or response.guard_rail_triggered:
+        return
+
+    params = cache.make_params(max_results, similarity_threshold, scope)
+    cache.put(query_embedding, params, response, generation)
+
+
+def low_similarity_response(
+    query: str, search_results: list[dict[str, Any]], similarity_threshold: float
+) -> QueryResponse:
+    """Respuesta cuando ningún resultado supera el umbral de similitud"""
+    max_score = max([r.get("score", 0) for r in search_results], default=0)
+    return QueryResponse(
+        query=query,
+        answer=f"No encontré información suficientemente relevante (máx: {max_score:.3f}, requerido: {similarity_threshold:.3f})",
+        confidence="low",
+        guard_rail_triggered="low_similarity",
+    )
+
+
+def build_answer_response(
+    query: str, answer: str, relevant_results: list[dict[str, Any]]
+) -> QueryResponse:
+    """Arma la respuesta final aplicando el guard rail de respuesta genérica"""
+    # Guard rail: respuesta demasiado genérica
     if is_answer_too_generic(answer):
         return QueryResponse(
             query=query,
@@ -80,7 +480,7 @@ def query_documents(
             guard_rail_triggered="generic_response",
         )
 
-    # 7. Respuesta exitosa
+    # Respuesta exitosa
     confidence = calculate_confidence(relevant_results)
     sources = results_to_sources(relevant_results)
     avg_similarity = sum(r["score"] for r in relevant_results) / len(relevant_results)
@@ -95,18 +495,188 @@ def query_documents(
     )
 
 
-def search_similar_documents(query: str, k: int) -> list[dict[str, Any]]:
-    """Busca documentos similares en Pinecone"""
-    embeddings = create_embeddings()
-    index = get_pinecone_index()
+def search_similar_documents(
+    query: str,
+    k: int,
+    query_embedding: list[float] | None = None,
+    namespace: str = "",
+    filters: QueryFilters | None = None,
+) -> list[dict[str, Any]]:
+    """Busca documentos similares en el almacén de vectores"""
+    # Generar embedding de la query (o reutilizarlo del cache)
+    if query_embedding is None:
+        query_embedding = embed_query_cached(query)
+
+    # Buscar candidatos (más si se reordenan localmente)
+    arguments = query_arguments(query, query_embedding, k, namespace, filters)
+    matches = get_vector_store().query(**arguments)
+    matches = attach_chunk_texts(hybrid_matches(matches, arguments), namespace)
+
+    return rerank_matches(query, matches, k)
+
+
+async def asearch_similar_documents(
+    query: str,
+    k: int,
+    query_embedding: list[float] | None = None,
+    namespace: str = "",
+    filters: QueryFilters | None = None,
+    store: VectorStore | None = None,
+) -> list[dict[str, Any]]:
+    """Busca documentos similares en el almacén de vectores (asíncrono)"""
+    if query_embedding is None:
+        query_embedding = await aembed_query_cached(query)
+
+    arguments = query_arguments(query, query_embedding, k, namespace, filters)
+    store = store or get_vector_store()
+    matches = await store.aquery(**arguments)
+    matches = attach_chunk_texts(hybrid_matches(matches, arguments), namespace)
+
+    return rerank_matches(query, matches, k)
+
+
+def query_arguments(
+    query: str,
+    query_embedding: list[float],
+    k: int,
+    namespace: str = "",
+    filters: QueryFilters | None = None,
+) -> dict[str, Any]:
+    """
+    Argumentos de la búsqueda en el almacén de vectores
+
+    La búsqueda se limita al namespace y a los filtros de metadata. Con
+    búsqueda híbrida se agrega el vector disperso (BM25) de la consulta y
+    ambos vectores se ponderan con HYBRID_ALPHA.
+    """
+    check_embedding_dimensions(len(query_embedding), "El embedding de la consulta")
+    arguments = {
+        "vector": query_embedding,
+        "top_k": candidates_count(k),
+        "include_metadata": True,
+        "namespace": namespace,
+    }
+    metadata_filter = build_metadata_filter(filters)
+    if metadata_filter:
+        arguments["filter"] = metadata_filter
+
+    encoder = get_sparse_encoder()
+    if encoder is None:
+        return arguments
+
+    sparse = encoder.encode_query(query)
+    if sparse["indices"]:
+        dense, sparse = hybrid_query_vectors(
+            query_embedding, sparse, settings.HYBRID_ALPHA
+        )
+        arguments["vector"] = dense
+        arguments["sparse_vector"] = sparse
+    return arguments
+
+
+def build_metadata_filter(filters: QueryFilters | None) -> dict[str, Any] | None:
+    """Filtro de metadata de Pinecone (None si no hay filtros)"""
+    if filters is None:
+        return None
 
-    # Generar embedding de la query
-    query_embedding = embeddings.embed_query(query)
+    metadata_filter: dict[str, Any] = {}
+    if filters.document_id:
+        metadata_filter["document_id"] = {"$eq": filters.document_id}
+    if filters.filename:
+        metadata_filter["filename"] = {"$eq": filters.filename}
 
-    # Buscar en Pinecone
-    results = index.query(vector=query_embedding, top_k=k, include_metadata=True)
+    upload_range = {}
+    if filters.uploaded_after:
+        upload_range["$gte"] = int(filters.uploaded_after.timestamp())
+    if filters.uploaded_before:
+        upload_range["$lte"] = int(filters.uploaded_before.timestamp())
+    if upload_range:
+        metadata_filter["upload_timestamp"] = upload_range
 
-    return results.get("matches", [])
+    return metadata_filter or None
+
+
+def search_scope(namespace: str, filters: QueryFilters | None) -> str:
+    """Clave del alcance de la búsqueda (para el cache semántico)"""
+    metadata_filter = build_metadata_filter(filters)
+    return f"{namespace}|{metadata_filter or ''}"
+
+
+def hybrid_matches(
+    matches: list[dict[str, Any]], arguments: dict[str, Any]
+) -> list[dict[str, Any]]:
+    """
+    Expresa los scores híbridos en la escala del score denso
+
+    Pinecone devuelve `alpha * denso + (1 - alpha) * disperso`; al dividir
+    por alpha, un resultado sin términos en común conserva su similitud
+    coseno (y el mismo umbral sigue sirviendo) y las coincidencias
+    exactas suman `(1 - alpha) / alpha * bm25`.
+
+    Solo se reescala si la consulta se ponderó (ver query_arguments): una
+    consulta sin términos conocidos usa el vector denso tal cual.
+    """
+    if "sparse_vector" not in arguments:
+        return matches
+    alpha = settings.HYBRID_ALPHA
+    return [
+        {
+            "id": match.get("id", ""),
+            "score": match.get("score", 0.0) / alpha,
+            "metadata": match.get("metadata", {}),
+        }
+        for match in matches
+    ]
+
+
+def candidates_count(k: int) -> int:
+    """Candidatos a pedir a Pinecone para quedarse con `k`"""
+    if not settings.RERANK_ENABLED:
+        return k
+    return k * max(settings.RERANK_OVERSAMPLE, 1)
+
+
+def attach_chunk_texts(
+    matches: list[dict[str, Any]], namespace: str = ""
+) -> list[dict[str, Any]]:
+    """
+    Completa `metadata.text` de los resultados desde el almacén de textos
+
+    Una sola lectura en bloque por búsqueda, antes del reranking (BM25
+    necesita el texto). Los vectores indexados con el texto en la metadata
+    se dejan como están.
+    """
+    chunk_store = get_chunk_store()
+    if chunk_store is None:
+        return matches
+
+    missing = [
+        match["id"] for match in matches if "text" not in (match.get("metadata") or {})
+    ]
+    if not missing:
+        return matches
+
+    texts = chunk_store.get_many(missing, namespace)
+    if len(texts) < len(missing):
+        logger.warning(
+            f"⚠️ {len(missing) - len(texts)} chunks sin texto en el almacén "
+            f"(namespace '{namespace}'): ¿se indexaron desde otro servidor?"
+        )
+    for match in matches:
+        metadata = match.get("metadata") or {}
+        if "text" not in metadata and match["id"] in texts:
+            # Copia: el almacén local devuelve su propia metadata
+            match["metadata"] = {**metadata, "text": texts[match["id"]]}
+    return matches
+
+
+def rerank_matches(
+    query: str, matches: list[dict[str, Any]], k: int
+) -> list[dict[str, Any]]:
+    """Reordena los candidatos con BM25 si el reranking está activo"""
+    if not settings.RERANK_ENABLED:
+        return matches
+    return rerank_results(query, matches, k, settings.RERANK_DENSE_WEIGHT)
 
 
 def filter_by_similarity(
@@ -116,22 +686,21 @@ def filter_by_similarity(
     return [r for r in results if r.get("score", 0) >= threshold]
 
 
-def create_context_from_results(results: list[dict[str, Any]]) -> str:
-    """Crea contexto combinado de los resultados"""
-    contexts = []
-    for result in results:
-        text = result.get("metadata", {}).get("text", "")
-        if text.strip():
-            contexts.append(text.strip())
+def create_context_from_results(
+    results: list[dict[str, Any]], max_tokens: int | None = None
+) -> str:
+    """
+    Crea contexto combinado de los resultados
 
-    return "\n\n".join(contexts)
+    Une los chunks consecutivos de un mismo documento sin repetir el
+    solapamiento y recorta al presupuesto de tokens (ver build_context).
+    """
+    return build_context(results, max_tokens or settings.CONTEXT_MAX_TOKENS)
 
 
-def generate_answer_with_llm(query: str, context: str) -> str:
-    """Genera respuesta usando LLM con prompt estricto"""
-    llm = create_llm()
-
-    prompt = f"""Eres un asistente que SOLO responde basándose en el contexto proporcionado.
+def build_prompt(query: str, context: str) -> str:
+    """Prompt estricto: responder solo con el contexto"""
+    return f"""Eres un asistente que SOLO responde basándose en el contexto proporcionado.
 
 REGLAS ESTRICTAS:
 1. SOLO usa información del contexto
@@ -146,10 +715,37 @@ PREGUNTA: {query}
 
 RESPUESTA:"""
 
-    response = llm.invoke(prompt)
+
+def generate_answer_with_llm(query: str, context: str) -> str:
+    """Genera respuesta usando LLM con prompt estricto"""
+    llm = create_llm()
+
+    response = llm.invoke(build_prompt(query, context))
+    return response.content if hasattr(response, "content") else str(response)
+
+
+async def agenerate_answer_with_llm(
+    query: str, context: str, llm: ChatOpenAI | None = None
+) -> str:
+    """Genera respuesta usando LLM con prompt estricto (asíncrono)"""
+    llm = llm or create_llm()
+
+    response = await llm.ainvoke(build_prompt(query, context))
     return response.content if hasattr(response, "content") else str(response)
 
 
+async def astream_answer_with_llm(
+    query: str, context: str, llm: ChatOpenAI | None = None
+) -> AsyncIterator[str]:
+    """Genera la respuesta del LLM como flujo de fragmentos de texto"""
+    llm = llm or create_llm()
+
+    async for chunk in llm.astream(build_prompt(query, context)):
+        text = chunk.content if hasattr(chunk, "content") else str(chunk)
+        if text:
+            yield text
+
+
 def is_answer_too_generic(answer: str) -> bool:
     """Detecta respuestas demasiado genéricas"""
     generic_phrases = [
@@ -0,0 +1,167 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from ..core.config import settings
+
+# SQLite limita la cantidad de parámetros por sentencia
+SQLITE_BATCH_SIZE = 500
+
+
+class EmbeddingCache:
+    """
+    Cache persistente de embeddings direccionado por contenido
+
+    Guarda cada embedding como blob float32 en SQLite, con clave
+    (modelo, dimensiones, sha256 del texto). Cuando supera `max_entries`
+    elimina las entradas usadas hace más tiempo.
+    """
+
+    def __init__(self, path: str | Path, max_entries: int):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if str(self.path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access "
+            "ON embeddings (last_access)"
+        )
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, dimensions: int, text: str) -> str:
+        """Clave del cache para un texto"""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{dimensions}:{digest}"
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        """
+        Busca embeddings en el cache
+
+        Args:
+            keys: Claves a buscar
+
+        Returns:
+            Dict clave -> embedding solo con las claves encontradas
+        """
+        unique_keys = list(dict.fromkeys(keys))
+        found: dict[str, list[float]] = {}
+
+        with self._lock:
+            for i in range(0, len(unique_keys), SQLITE_BATCH_SIZE):
+                batch = unique_keys[i : i + SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.execute("COMMIT")
+
+            self.hits += len(found)
+            self.misses += len(unique_keys) - len(found)
+
+        return found
+
+    def put_many(self, items: dict[str, list[float]]) -> None:
+        """Guarda embeddings y aplica el límite de tamaño"""
+        if not items:
+            return
+
+        now = time.time()
+        rows = [
+            (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in items.items()
+        ]
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_access) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+            self._size += cursor.rowcount
+            self._evict()
+            self._conn.execute("COMMIT")
+
+    def _evict(self) -> None:
+        """Elimina las entradas menos usadas recientemente (LRU)"""
+        excess = self._size - self.max_entries
+        if excess <= 0:
+            return
+
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            "SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+            (excess,),
+        )
+        self._size -= excess
+
+    def stats(self) -> dict[str, Any]:
+        """Estadísticas de uso del cache"""
+        total = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self) -> None:
+        """Vacía el cache y reinicia los contadores"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def close(self) -> None:
+        """Cierra la conexión a SQLite"""
+        with self._lock:
+            self._conn.close()
+
+
+@lru_cache
+def get_embedding_cache() -> EmbeddingCache | None:
+    """Obtiene el cache de embeddings del proceso (None si está desactivado)"""
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    return EmbeddingCache(
+        settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MAX_ENTRIES
+    )
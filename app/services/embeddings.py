@@ -1,20 +1,73 @@
+import asyncio
+import hashlib
+import re
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from typing import Any
-from uuid import uuid4
+from uuid import NAMESPACE_URL, uuid5
 
 from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document as LangChainDocument
 from ..core.config import settings
+from ..core.http import get_async_http_client, get_http_client
+from ..utils.tokens import count_tokens
+from .embedding_cache import get_embedding_cache
+from .query_cache import get_query_embedding_cache, normalize_query
+from .sparse import get_sparse_encoder
 
+# Ventanas que puede ocupar un fragmento sin separador antes de cortarlo
+MAX_PENDING_WINDOWS = 4
 
+# Espacio de nombres para los ids deterministas de documentos
+DOCUMENT_ID_NAMESPACE = uuid5(NAMESPACE_URL, "rag/documents")
+
+
+@lru_cache(maxsize=1)
 def create_embeddings() -> OpenAIEmbeddings:
-    """Crea cliente de embeddings"""
+    """
+    Obtiene el cliente de embeddings compartido del proceso
+
+    Los modelos text-embedding-3 devuelven vectores recortados a
+    EMBEDDING_DIMENSIONS; los anteriores solo tienen su tamaño nativo.
+    """
     return OpenAIEmbeddings(
-        api_key=settings.OPENAI_API_KEY, model="text-embedding-3-small"
+        api_key=settings.OPENAI_API_KEY,
+        model=settings.EMBEDDING_MODEL,
+        dimensions=(
+            settings.EMBEDDING_DIMENSIONS
+            if supports_dimensions(settings.EMBEDDING_MODEL)
+            else None
+        ),
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
     )
 
 
+def supports_dimensions(model: str) -> bool:
+    """Si el modelo acepta embeddings recortados (parámetro `dimensions`)"""
+    return model.startswith("text-embedding-3")
+
+
+def check_embedding_dimensions(dimension: int, source: str) -> None:
+    """
+    Verifica que `dimension` coincida con EMBEDDING_DIMENSIONS
+
+    Vectores de otra dimensión vienen de otro modelo o configuración y
+    sus scores no son comparables con los de la consulta.
+
+    Raises:
+        ValueError: Si las dimensiones no coinciden
+    """
+    if dimension != settings.EMBEDDING_DIMENSIONS:
+        raise ValueError(
+            f"{source} tiene {dimension} dimensiones pero EMBEDDING_DIMENSIONS "
+            f"es {settings.EMBEDDING_DIMENSIONS} ({settings.EMBEDDING_MODEL}); "
+            "reindexa los documentos o corrige la configuración"
+        )
+
+
 def create_text_splitter(
     chunk_size: int = 1000,
     chunk_overlap: int = 200,
@@ -47,66 +100,566 @@ def create_text_chunks(text: str, filename: str) -> list[dict[str, Any]]:
     Returns:
         Lista de chunks con metadata
     """
-    splitter = create_text_splitter()
-    doc_id = str(uuid4())  # Convertir a string inmediatamente
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return list(iter_text_chunks([text], filename, make_document_id(content_hash)))
 
-    # Crear documento de LangChain
-    langchain_doc = LangChainDocument(
-        page_content=text,
-        metadata={
-            "filename": filename,
-            "document_id": doc_id,  # Ya es string
-            "upload_date": datetime.now().isoformat(),
-        },
-    )
 
-    # Dividir en chunks
-    chunks = splitter.split_documents([langchain_doc])
+def make_document_id(content_hash: str) -> str:
+    """
+    Id estable de un documento a partir del hash de su contenido
+
+    Dos archivos con el mismo contenido comparten id (y chunks) aunque se
+    llamen distinto, y un archivo distinto nunca reemplaza a otro por
+    tener el mismo nombre. Para actualizar un documento con una nueva
+    versión se indica su id explícitamente (ver process_document).
+    """
+    return str(uuid5(DOCUMENT_ID_NAMESPACE, content_hash))
+
+
+def make_chunk_id(document_id: str, text: str, occurrence: int = 0) -> str:
+    """
+    Id de un chunk derivado de su contenido
+
+    Formato `{document_id}#{hash}`; los textos repetidos dentro del mismo
+    documento llevan el número de aparición como sufijo.
+    """
+    suffix = f"-{occurrence}" if occurrence else ""
+    return f"{document_id}#{_chunk_digest(text)}{suffix}"
+
+
+def _chunk_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def iter_text_chunks(
+    segments: Iterable[str],
+    filename: str,
+    document_id: str,
+    window_size: int | None = None,
+) -> Iterator[dict[str, Any]]:
+    """
+    Divide un flujo de segmentos de texto en chunks con metadata
+
+    Los segmentos (páginas, párrafos, grupos de filas...) se concatenan en
+    una ventana acotada, así que la memoria no depende del tamaño del
+    documento. Los chunks e índices son los mismos que produce el
+    splitter sobre el texto completo, y cada id se deriva del contenido
+    del chunk (ver make_chunk_id).
+
+    Args:
+        segments: Segmentos de texto en orden
+        filename: Nombre del archivo
+        document_id: Id del documento (ver make_document_id)
+        window_size: Caracteres acumulados antes de dividir
+
+    Yields:
+        Chunks con metadata
+    """
+    splitter = create_text_splitter()
+    doc_id = document_id
+    metadata = {
+        "filename": filename,
+        "document_id": doc_id,  # Ya es string
+        "upload_date": datetime.now().isoformat(),
+    }
 
-    # Agregar metadata específica de chunk
-    result = []
-    for i, chunk in enumerate(chunks):
-        chunk_data = {
+    chunk_texts = _iter_split_text(
+        segments, splitter, window_size or settings.CHUNKING_WINDOW_CHARS
+    )
+    occurrences: dict[str, int] = {}
+    for i, text in enumerate(chunk_texts):
+        # Se cuentan por hash para no retener el texto de cada chunk
+        digest = _chunk_digest(text)
+        occurrence = occurrences.get(digest, 0)
+        occurrences[digest] = occurrence + 1
+        yield {
             "document_id": doc_id,  # Ya es string
-            "chunk_id": f"{doc_id}_{i}",
+            "chunk_id": make_chunk_id(doc_id, text, occurrence),
             "chunk_index": i,
-            "text": chunk.page_content,
+            "text": text,
             "filename": filename,
-            "metadata": chunk.metadata,
+            "metadata": dict(metadata),
+        }
+
+
+def _iter_split_text(
+    segments: Iterable[str],
+    splitter: RecursiveCharacterTextSplitter,
+    window_size: int,
+) -> Iterator[str]:
+    """
+    Aplica el splitter sobre un flujo de texto con memoria acotada
+
+    Reproduce `splitter.split_text` sobre el texto completo sin tenerlo en
+    memoria: el flujo se corta en los mismos fragmentos de primer nivel
+    (p. ej. párrafos) que usa el splitter, los fragmentos chicos se
+    combinan como en `_merge_splits` (ver _StreamingMerger) y los grandes se
+    dividen recursivamente igual que en el splitter. Solo se retiene el
+    fragmento en curso y el chunk que se está armando.
+
+    Si un fragmento (o el inicio de un documento sin "\\n\\n") supera
+    MAX_PENDING_WINDOWS ventanas, se corta en su último salto de línea y
+    los chunks alrededor de ese corte pueden diferir del texto completo.
+    """
+    separators = splitter._separators
+    pattern = re.compile(re.escape(separators[0]))
+    merger = _StreamingMerger(splitter)
+    max_pending = MAX_PENDING_WINDOWS * window_size
+
+    def split_piece(piece: str) -> list[str]:
+        # Mismo criterio que RecursiveCharacterTextSplitter._split_text
+        if splitter._length_function(piece) < splitter._chunk_size:
+            return merger.add(piece)
+        return merger.flush() + splitter._split_text(piece, separators[1:])
+
+    parts: list[str] = []
+    size = 0
+    scan_at = window_size
+    split_started = False  # Ya se procesó algún fragmento de primer nivel
+
+    for segment in segments:
+        parts.append(segment)
+        size += len(segment)
+        if size < scan_at:
+            continue
+
+        # El buffer empieza en el inicio del texto o en un separador, así
+        # que la búsqueda encuentra los mismos cortes que en el texto completo
+        buffer = "".join(parts)
+        boundaries = [match.start() for match in pattern.finditer(buffer)]
+        if boundaries and boundaries[0] == 0:
+            boundaries = boundaries[1:]
+        previous = 0
+        for boundary in boundaries:
+            yield from split_piece(buffer[previous:boundary])
+            split_started = True
+            previous = boundary
+        rest = buffer[previous:]
+
+        if len(rest) > max_pending:
+            cut = rest.rfind("\n")
+            if cut <= len(separators[0]):
+                cut = len(rest)
+            yield from split_piece(rest[:cut])
+            split_started = True
+            rest = rest[cut:]
+
+        parts, size = [rest], len(rest)
+        scan_at = size + window_size
+
+    buffer = "".join(parts)
+    if not split_started:
+        # Texto sin separador de primer nivel: se divide completo
+        yield from splitter.split_text(buffer)
+        return
+
+    previous = 0
+    for match in pattern.finditer(buffer):
+        if match.start() > previous:
+            yield from split_piece(buffer[previous : match.start()])
+        previous = match.start()
+    if buffer[previous:]:
+        yield from split_piece(buffer[previous:])
+    yield from merger.flush()
+
+
+class _StreamingMerger:
+    """
+    `_merge_splits` del splitter en forma incremental
+
+    Combina fragmentos chicos en chunks de hasta `chunk_size` con el mismo
+    solapamiento que el splitter, y devuelve cada chunk apenas se cierra.
+    """
+
+    def __init__(self, splitter: RecursiveCharacterTextSplitter):
+        self.splitter = splitter
+        # Con keep_separator el separador queda dentro de cada fragmento
+        self.separator = ""
+        self.current: list[str] = []
+        self.total = 0
+
+    def add(self, split: str) -> list[str]:
+        splitter = self.splitter
+        length = splitter._length_function(split)
+        separator_length = splitter._length_function(self.separator)
+        docs = []
+
+        def extra() -> int:
+            return separator_length if self.current else 0
+
+        if self.total + length + extra() > splitter._chunk_size and self.current:
+            doc = splitter._join_docs(self.current, self.separator)
+            if doc is not None:
+                docs.append(doc)
+            while self.total > splitter._chunk_overlap or (
+                self.total + length + extra() > splitter._chunk_size and self.total > 0
+            ):
+                self.total -= splitter._length_function(self.current[0]) + (
+                    separator_length if len(self.current) > 1 else 0
+                )
+                self.current = self.current[1:]
+
+        self.current.append(split)
+        self.total += length + (separator_length if len(self.current) > 1 else 0)
+        return docs
+
+    def flush(self) -> list[str]:
+        """Cierra el chunk en curso (fin de una serie de fragmentos chicos)"""
+        doc = self.splitter._join_docs(self.current, self.separator)
+        self.current, self.total = [], 0
+        return [doc] if doc is not None else []
+
+
+def create_embedding_batches(
+    texts: list[str],
+    max_batch_size: int | None = None,
+    max_batch_tokens: int | None = None,
+) -> list[list[str]]:
+    """
+    Agrupa textos consecutivos en lotes para la API de embeddings
+
+    Cada lote respeta un máximo de textos y de tokens, de modo que
+    concatenar los resultados de los lotes conserva el orden original.
+
+    Args:
+        texts: Textos a agrupar
+        max_batch_size: Máximo de textos por lote
+        max_batch_tokens: Máximo de tokens por lote
+
+    Returns:
+        Lista de lotes de textos
+    """
+    max_batch_size = max_batch_size or settings.EMBEDDING_BATCH_SIZE
+    max_batch_tokens = max_batch_tokens or settings.EMBEDDING_BATCH_MAX_TOKENS
+
+    batches = []
+    batch: list[str] = []
+    batch_tokens = 0
+
+    for text in texts:
+        tokens = count_tokens(text)
+        if batch and (
+            len(batch) >= max_batch_size or batch_tokens + tokens > max_batch_tokens
+        ):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+
+        batch.append(text)
+        batch_tokens += tokens
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def embed_texts(
+    texts: list[str],
+    embeddings: OpenAIEmbeddings | None = None,
+    max_batch_size: int | None = None,
+    max_batch_tokens: int | None = None,
+    max_concurrency: int | None = None,
+    on_progress: Callable[[int], None] | None = None,
+) -> list[list[float]]:
+    """
+    Genera embeddings en lotes, con varios lotes en paralelo
+
+    Args:
+        texts: Textos a vectorizar
+        embeddings: Cliente de embeddings (se crea uno si no se indica)
+        max_batch_size: Máximo de textos por request
+        max_batch_tokens: Máximo de tokens por request
+        max_concurrency: Máximo de requests simultáneos
+        on_progress: Callback con la cantidad de textos de cada lote terminado
+
+    Returns:
+        Embeddings en el mismo orden que los textos
+    """
+    batches = create_embedding_batches(texts, max_batch_size, max_batch_tokens)
+    if not batches:
+        return []
+
+    embeddings = embeddings or create_embeddings()
+    max_concurrency = max_concurrency or settings.EMBEDDING_MAX_CONCURRENCY
+
+    def embed_batch(batch: list[str]) -> list[list[float]]:
+        vectors = embeddings.embed_documents(batch)
+        if on_progress:
+            on_progress(len(batch))
+        return vectors
+
+    if len(batches) == 1 or max_concurrency <= 1:
+        results = [embed_batch(batch) for batch in batches]
+    else:
+        workers = min(max_concurrency, len(batches))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # map() devuelve los resultados en el orden de los lotes
+            results = list(executor.map(embed_batch, batches))
+
+    return [vector for batch_vectors in results for vector in batch_vectors]
+
+
+def embed_texts_cached(
+    texts: list[str], on_progress: Callable[[int], None] | None = None
+) -> list[list[float]]:
+    """
+    Genera embeddings consultando primero el cache persistente
+
+    Solo los textos que no están en cache (sin repetir) se envían a OpenAI.
+
+    Args:
+        texts: Textos a vectorizar
+        on_progress: Callback con la cantidad de textos ya resueltos
+
+    Returns:
+        Embeddings en el mismo orden que los textos
+    """
+    cache = get_embedding_cache()
+    if cache is None:
+        return embed_texts(texts, on_progress=on_progress)
+
+    keys = [
+        cache.make_key(settings.EMBEDDING_MODEL, settings.EMBEDDING_DIMENSIONS, text)
+        for text in texts
+    ]
+    found = cache.get_many(keys)
+
+    # Textos pendientes, sin duplicados
+    missing = {
+        key: text for key, text in zip(keys, texts, strict=True) if key not in found
+    }
+    if on_progress:
+        on_progress(sum(key in found for key in keys))
+
+    if missing:
+        new_vectors = dict(
+            zip(
+                missing,
+                embed_texts(list(missing.values()), on_progress=on_progress),
+                strict=True,
+            )
+        )
+        cache.put_many(new_vectors)
+        found.update(new_vectors)
+
+        # Textos repetidos que se resolvieron con el mismo embedding
+        if on_progress:
+            on_progress(sum(key in missing for key in keys) - len(missing))
+
+    return [found[key] for key in keys]
+
+
+def embed_query_cached(query: str) -> list[float]:
+    """
+    Genera el embedding de una consulta consultando primero los caches
+
+    Primero el cache en memoria (consulta normalizada), después el
+    persistente y, si no está en ninguno, OpenAI.
+    """
+    query_cache = get_query_embedding_cache()
+    query_key = (
+        query_cache.make_key(settings.EMBEDDING_MODEL, query) if query_cache else None
+    )
+    if query_cache:
+        vector = query_cache.get(query_key)
+        if vector is not None:
+            return vector
+
+    cache = get_embedding_cache()
+    if cache is None:
+        vector = create_embeddings().embed_query(query)
+    else:
+        key = cache.make_key(
+            settings.EMBEDDING_MODEL, settings.EMBEDDING_DIMENSIONS, query
+        )
+        vector = cache.get_many([key]).get(key)
+        if vector is None:
+            vector = create_embeddings().embed_query(query)
+            cache.put_many({key: vector})
+
+    if query_cache:
+        query_cache.put(query_key, vector)
+    return vector
+
+
+async def aembed_query_cached(
+    query: str, embeddings: OpenAIEmbeddings | None = None
+) -> list[float]:
+    """Versión asíncrona de embed_query_cached (no bloquea el event loop)"""
+    query_cache = get_query_embedding_cache()
+    query_key = (
+        query_cache.make_key(settings.EMBEDDING_MODEL, query) if query_cache else None
+    )
+    if query_cache:
+        vector = query_cache.get(query_key)
+        if vector is not None:
+            return vector
+
+    cache = get_embedding_cache()
+    if cache is None:
+        vector = await (embeddings or create_embeddings()).aembed_query(query)
+    else:
+        # SQLite es síncrono: las lecturas y escrituras van a un hilo
+        key = cache.make_key(
+            settings.EMBEDDING_MODEL, settings.EMBEDDING_DIMENSIONS, query
+        )
+        found = await asyncio.to_thread(cache.get_many, [key])
+        vector = found.get(key)
+        if vector is None:
+            vector = await (embeddings or create_embeddings()).aembed_query(query)
+            await asyncio.to_thread(cache.put_many, {key: vector})
+
+    if query_cache:
+        query_cache.put(query_key, vector)
+    return vector
+
+
+async def aembed_queries_cached(
+    queries: list[str], embeddings: OpenAIEmbeddings | None = None
+) -> list[list[float]]:
+    """
+    Embeddings de varias consultas con una sola request a OpenAI
+
+    Consulta los mismos caches que aembed_query_cached; las consultas
+    que no están en ninguno (sin repetir las que normalizan igual) se
+    vectorizan juntas.
+
+    Returns:
+        Un embedding por consulta, en el mismo orden
+    """
+    query_cache = get_query_embedding_cache()
+    vectors: dict[str, list[float]] = {}  # consulta normalizada -> vector
+    missing: dict[str, str] = {}  # consulta normalizada -> texto a vectorizar
+
+    for query in queries:
+        normalized = normalize_query(query)
+        if normalized in vectors or normalized in missing:
+            continue
+        vector = (
+            query_cache.get(query_cache.make_key(settings.EMBEDDING_MODEL, query))
+            if query_cache
+            else None
+        )
+        if vector is not None:
+            vectors[normalized] = vector
+        else:
+            missing[normalized] = query
+
+    cache = get_embedding_cache()
+    if missing and cache is not None:
+        keys = {
+            normalized: cache.make_key(
+                settings.EMBEDDING_MODEL, settings.EMBEDDING_DIMENSIONS, query
+            )
+            for normalized, query in missing.items()
         }
-        result.append(chunk_data)
+        found = await asyncio.to_thread(cache.get_many, list(keys.values()))
+        for normalized, key in keys.items():
+            if key in found:
+                vectors[normalized] = found[key]
+                del missing[normalized]
 
-    return result
+    if missing:
+        embeddings = embeddings or create_embeddings()
+        embedded = await embeddings.aembed_documents(list(missing.values()))
+        new_vectors = dict(zip(missing, embedded, strict=True))
+        vectors.update(new_vectors)
+        if cache is not None:
+            await asyncio.to_thread(
+                cache.put_many,
+                {
+                    cache.make_key(
+                        settings.EMBEDDING_MODEL,
+                        settings.EMBEDDING_DIMENSIONS,
+                        missing[normalized],
+                    ): vector
+                    for normalized, vector in new_vectors.items()
+                },
+            )
 
+    if query_cache:
+        for query in queries:
+            query_cache.put(
+                query_cache.make_key(settings.EMBEDDING_MODEL, query),
+                vectors[normalize_query(query)],
+            )
+    return [vectors[normalize_query(query)] for query in queries]
 
-def create_vectors_from_chunks(chunks: list[dict[str, Any]]):
+
+def chunk_metadata(chunk: dict[str, Any]) -> dict[str, Any]:
+    """
+    Metadata de un chunk que depende de la versión subida del documento
+
+    Es la parte que se actualiza en los chunks reutilizados: nombre del
+    archivo, posición dentro del documento y fecha de subida (y el hash
+    del archivo en el primer chunk, ver DocumentIngestion).
+    """
+    metadata = {
+        "filename": chunk["filename"],
+        "document_id": str(chunk["document_id"]),  # Asegurar que sea string
+        "chunk_index": chunk["chunk_index"],
+    }
+    content_hash = chunk.get("metadata", {}).get("content_hash")
+    if content_hash:
+        metadata["content_hash"] = content_hash
+    upload_date = chunk.get("metadata", {}).get("upload_date")
+    if upload_date:
+        # Numérico para poder filtrar por rango de fechas
+        metadata["upload_timestamp"] = int(
+            datetime.fromisoformat(upload_date).timestamp()
+        )
+    return metadata
+
+
+def create_vectors_from_chunks(
+    chunks: list[dict[str, Any]],
+    on_progress: Callable[[int], None] | None = None,
+    namespace: str = "",
+):
     """
     Convierte chunks en vectores para Pinecone
 
     Args:
         chunks: Lista de chunks con metadata
+        on_progress: Callback con la cantidad de chunks vectorizados
+        namespace: Namespace donde se almacenarán (estadísticas de BM25)
 
     Returns:
         Lista de vectores para Pinecone
     """
-    embeddings = create_embeddings()
-    vectors = []
+    # Generar embeddings en lotes (reutilizando los que ya están en cache)
+    embeddings = embed_texts_cached(
+        [chunk["text"] for chunk in chunks], on_progress=on_progress
+    )
 
-    for chunk in chunks:
-        # Generar embedding
-        embedding = embeddings.embed_query(chunk["text"])
+    # Vectores dispersos (BM25) para búsqueda híbrida
+    encoder = get_sparse_encoder()
+    sparse_vectors = (
+        encoder.encode_documents(
+            [chunk["text"] for chunk in chunks],
+            ids=[chunk["chunk_id"] for chunk in chunks],
+            namespace=namespace,
+        )
+        if encoder
+        else [None] * len(chunks)
+    )
 
+    vectors = []
+    for chunk, embedding, sparse in zip(
+        chunks, embeddings, sparse_vectors, strict=True
+    ):
         # Crear vector para Pinecone
         vector = {
             "id": chunk["chunk_id"],
             "values": embedding,
             "metadata": {
                 "text": chunk["text"],
-                "filename": chunk["filename"],
-                "document_id": str(chunk["document_id"]),  # Asegurar que sea string
-                "chunk_index": chunk["chunk_index"],
+                **chunk_metadata(chunk),
+                "embedding_dimensions": len(embedding),
             },
         }
+        if sparse and sparse["indices"]:
+            vector["sparse_values"] = sparse
         vectors.append(vector)
 
     return vectors
@@ -0,0 +1,88 @@
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from ..core.config import settings
+
+
+class JobStore:
+    """
+    Estado de los trabajos de ingesta en SQLite, compartido entre procesos
+
+    Cada worker de uvicorn procesa sus trabajos en su propio pool, pero
+    guarda acá el estado (la respuesta serializada) para que cualquier
+    worker pueda responder `GET /documents/jobs/{job_id}`.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+        if str(self.path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                finished INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                data TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished, updated_at)"
+        )
+
+    def put(self, job_id: str, kind: str, finished: bool, data: str) -> None:
+        """Guarda (o reemplaza) el estado serializado de un trabajo"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, kind, finished, updated_at, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, int(finished), time.time(), data),
+            )
+
+    def get(self, job_id: str) -> tuple[str, str] | None:
+        """Tipo y estado serializado de un trabajo (None si no existe)"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT kind, data FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+
+    def prune(self, retention: int) -> None:
+        """Descarta los trabajos terminados más antiguos, conservando `retention`"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE finished = 1 AND id NOT IN ("
+                "SELECT id FROM jobs WHERE finished = 1 "
+                "ORDER BY updated_at DESC LIMIT ?)",
+                (retention,),
+            )
+
+    def close(self) -> None:
+        """Cierra la conexión a SQLite"""
+        with self._lock:
+            self._conn.close()
+
+
+@lru_cache
+def get_job_store() -> JobStore | None:
+    """
+    Obtiene el almacén de trabajos del proceso
+
+    None si está desactivado: el estado solo vive en memoria y la API debe
+    correr con un único worker.
+    """
+    if not settings.INGESTION_JOB_STORE_ENABLED:
+        return None
+    return JobStore(settings.INGESTION_JOB_STORE_PATH)
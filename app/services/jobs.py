@@ -0,0 +1,443 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any
+from uuid import uuid4
+
+from fastapi import HTTPException, UploadFile, status
+
+from app.core.config import settings
+from app.core.logging import app_logger as logger
+from app.schemas.document import BulkIngestionResponse, DocumentResponse
+from app.schemas.job import (
+    BulkIngestionJobResponse,
+    IngestionJobResponse,
+    JobStage,
+    JobStatus,
+)
+from app.services.job_store import get_job_store
+from app.utils.bulk_ingestion import process_documents_bulk
+from app.utils.doc_to_vectores import process_document
+
+
+@dataclass
+class IngestionJob:
+    """Trabajo de ingesta con su progreso y tiempos por etapa"""
+
+    filename: str
+    namespace: str = ""
+    document_id: str | None = None
+    id: str = field(default_factory=lambda: str(uuid4()))
+    status: JobStatus = JobStatus.queued
+    stage: JobStage = JobStage.queued
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    stage_timings: dict[str, float] = field(default_factory=dict)
+    result: dict[str, Any] | None = None
+    error: str | None = None
+    _stage_started: float = field(default=0.0, repr=False)
+    _persisted: float = field(default=0.0, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    kind = "document"
+
+    def set_stage(self, stage: JobStage) -> None:
+        """Pasa a una nueva etapa acumulando la duración de la anterior"""
+        with self._lock:
+            now = time.perf_counter()
+            if self.status == JobStatus.running:
+                elapsed = now - self._stage_started
+                total = self.stage_timings.get(self.stage, 0.0) + elapsed
+                self.stage_timings[self.stage] = round(total, 4)
+            self.stage = stage
+            self._stage_started = now
+        self.persist()
+
+    def add_chunks_total(self, count: int) -> None:
+        with self._lock:
+            self.chunks_total += count
+        self.persist(force=False)
+
+    def add_chunks_embedded(self, count: int) -> None:
+        with self._lock:
+            self.chunks_embedded += count
+        self.persist(force=False)
+
+    def start(self) -> None:
+        self.started_at = datetime.now()
+        self._stage_started = time.perf_counter()
+        self.status = JobStatus.running
+        self.persist()
+
+    def finish(self, result: dict[str, Any] | None = None, error: str | None = None):
+        # Si falla, la etapa queda en la que se produjo el error
+        self.set_stage(self.stage if error else JobStage.done)
+        self.finished_at = datetime.now()
+        self.result = result
+        self.error = error
+        self.status = JobStatus.failed if error else JobStatus.completed
+        self.persist()
+
+    def persist(self, force: bool = True) -> None:
+        """
+        Guarda el estado en el almacén compartido entre workers
+
+        El progreso de chunks se guarda como mucho cada
+        INGESTION_JOB_PERSIST_INTERVAL segundos; los cambios de estado y de
+        etapa siempre. Un error al guardar no interrumpe la ingesta.
+        """
+        job_store = get_job_store()
+        if job_store is None:
+            return
+
+        now = time.monotonic()
+        if (
+            not force
+            and now - self._persisted < settings.INGESTION_JOB_PERSIST_INTERVAL
+        ):
+            return
+        self._persisted = now
+
+        try:
+            job_store.put(
+                self.id,
+                self.kind,
+                self.is_finished,
+                self.to_response().model_dump_json(),
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar el estado del job {self.id}: {e}")
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (JobStatus.completed, JobStatus.failed)
+
+    def run(self, uploads: list[UploadFile]) -> dict[str, Any]:
+        """Procesa los archivos del trabajo"""
+        return process_document(
+            uploads[0],
+            progress=self,
+            namespace=self.namespace,
+            document_id=self.document_id,
+        )
+
+    def to_response(self) -> IngestionJobResponse:
+        """Convierte el trabajo a su modelo de respuesta"""
+        with self._lock:
+            return IngestionJobResponse(
+                **self._response_fields(),
+                result=DocumentResponse(**self.result) if self.result else None,
+            )
+
+    def _response_fields(self) -> dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "namespace": self.namespace,
+            "status": self.status,
+            "stage": self.stage,
+            "status_url": f"{settings.API}/documents/jobs/{self.id}",
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "stage_timings": dict(self.stage_timings),
+            "error": self.error,
+        }
+
+
+@dataclass
+class BulkIngestionJob(IngestionJob):
+    """Trabajo de ingesta de varios archivos en un pipeline compartido"""
+
+    files_total: int = 0
+    document_ids: dict[str, str] = field(default_factory=dict)
+
+    kind = "bulk"
+
+    def run(self, uploads: list[UploadFile]) -> dict[str, Any]:
+        return process_documents_bulk(
+            uploads,
+            progress=self,
+            namespace=self.namespace,
+            document_ids=self.document_ids,
+        )
+
+    def to_response(self) -> BulkIngestionJobResponse:
+        with self._lock:
+            return BulkIngestionJobResponse(
+                **self._response_fields(),
+                files_total=self.files_total,
+                result=BulkIngestionResponse(**self.result) if self.result else None,
+            )
+
+
+# Estado del pool de ingesta (por proceso; el estado de los trabajos se
+# comparte entre procesos a través de get_job_store)
+_jobs: OrderedDict[str, IngestionJob] = OrderedDict()
+_jobs_lock = threading.Lock()
+_executor: ThreadPoolExecutor | None = None
+_slots: threading.BoundedSemaphore | None = None
+
+
+def _get_executor() -> tuple[ThreadPoolExecutor, threading.BoundedSemaphore]:
+    """Crea el pool de workers y el límite de la cola la primera vez"""
+    global _executor, _slots
+    with _jobs_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.INGESTION_MAX_WORKERS,
+                thread_name_prefix="ingestion",
+            )
+            _slots = threading.BoundedSemaphore(
+                settings.INGESTION_MAX_WORKERS + settings.INGESTION_QUEUE_SIZE
+            )
+        return _executor, _slots
+
+
+def _register_job(job: IngestionJob) -> None:
+    """Registra un trabajo y descarta los terminados más antiguos"""
+    with _jobs_lock:
+        _jobs[job.id] = job
+        excess = len(_jobs) - settings.INGESTION_JOB_RETENTION
+        for job_id in [j.id for j in _jobs.values() if j.is_finished][:excess]:
+            del _jobs[job_id]
+
+    job.persist()
+    job_store = get_job_store()
+    if job_store is not None:
+        job_store.prune(settings.INGESTION_JOB_RETENTION)
+
+
+def _spool_upload(file: UploadFile) -> IO[bytes]:
+    """
+    Toma posesión del archivo subido para el trabajo
+
+    FastAPI cierra el archivo de la request al responder, así que el
+    trabajo se queda con el archivo temporal de la request (en memoria
+    hasta UPLOAD_SPOOL_MAX_BYTES, en disco por encima) y deja uno vacío en
+    su lugar: el contenido no se copia.
+
+    La excepción son los PDFs de más de UPLOAD_SPOOL_MAX_BYTES, que se
+    copian a un archivo con nombre para que el pool de extracción pueda
+    abrirlos desde otros procesos.
+    """
+    source = file.file
+    source.seek(0)
+
+    suffix = Path(file.filename or "").suffix
+    if (
+        suffix.lower() == ".pdf"
+        and _file_size(source) > settings.UPLOAD_SPOOL_MAX_BYTES
+    ):
+        with tempfile.NamedTemporaryFile(
+            prefix="ingestion-", suffix=suffix, delete=False
+        ) as tmp:
+            try:
+                shutil.copyfileobj(source, tmp)
+            except Exception:
+                os.remove(tmp.name)
+                raise
+        # La copia se cierra y se borra en _close_spooled
+        return open(tmp.name, "rb")
+
+    file.file = io.BytesIO()
+    return source
+
+
+def _file_size(fh: IO[bytes]) -> int:
+    """Tamaño de un archivo seekable (vuelve al inicio)"""
+    size = fh.seek(0, io.SEEK_END)
+    fh.seek(0)
+    return size
+
+
+def _run_job(
+    job: IngestionJob,
+    spooled: list[tuple[str, IO[bytes]]],
+    slots: threading.BoundedSemaphore,
+):
+    """Procesa un trabajo de ingesta en un worker del pool"""
+    job.start()
+    try:
+        uploads = [UploadFile(file=fh, filename=name) for name, fh in spooled]
+        result = job.run(uploads)
+        job.finish(result=result)
+        logger.info(f"✅ Job {job.id} completado: {job.filename}")
+
+    except HTTPException as e:
+        job.finish(error=str(e.detail))
+        logger.error(f"❌ Job {job.id} falló: {e.detail}")
+    except Exception as e:
+        job.finish(error=str(e))
+        logger.error(f"❌ Job {job.id} falló: {e}")
+    finally:
+        slots.release()
+        _close_spooled(spooled)
+
+
+def _cancel_job(
+    future: Future,
+    job: IngestionJob,
+    spooled: list[tuple[str, IO[bytes]]],
+    slots: threading.BoundedSemaphore,
+) -> None:
+    """Marca como fallido un trabajo cancelado antes de empezar y libera sus archivos"""
+    if not future.cancelled():
+        return
+    job.finish(error="Ingestion stopped before the job started")
+    logger.warning(f"⚠️ Job {job.id} cancelado al detener la ingesta: {job.filename}")
+    slots.release()
+    _close_spooled(spooled)
+
+
+def _close_spooled(spooled: list[tuple[str, IO[bytes]]]) -> None:
+    """Cierra los archivos del trabajo y borra las copias con nombre"""
+    for _, fh in spooled:
+        fh.close()
+        # Copia con nombre creada por _spool_upload
+        path = getattr(fh, "name", None)
+        if isinstance(path, str) and os.path.isfile(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _submit_job(job: IngestionJob, files: list[UploadFile]) -> IngestionJob:
+    """Toma los archivos y encola el trabajo (503 si la cola está llena)"""
+    executor, slots = _get_executor()
+
+    if not slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Ingestion queue is full, try again later",
+        )
+
+    spooled: list[tuple[str, IO[bytes]]] = []
+    try:
+        for file in files:
+            spooled.append((file.filename, _spool_upload(file)))
+        _register_job(job)
+        future = executor.submit(_run_job, job, spooled, slots)
+        future.add_done_callback(
+            lambda future: _cancel_job(future, job, spooled, slots)
+        )
+    except Exception:
+        slots.release()
+        _close_spooled(spooled)
+        raise
+
+    logger.info(f"📥 Job {job.id} encolado: {job.filename}")
+    return job
+
+
+def submit_ingestion_job(
+    file: UploadFile, namespace: str = "", document_id: str | None = None
+) -> IngestionJob:
+    """
+    Encola un documento para ser procesado en segundo plano
+
+    Args:
+        file: Archivo subido
+        namespace: Namespace de Pinecone donde se guarda el documento
+        document_id: Documento del que el archivo es una nueva versión
+
+    Returns:
+        Trabajo creado (en estado 'queued')
+
+    Raises:
+        HTTPException 503: Si la cola de ingesta está llena
+    """
+    return _submit_job(
+        IngestionJob(
+            filename=file.filename, namespace=namespace, document_id=document_id
+        ),
+        [file],
+    )
+
+
+def submit_bulk_ingestion_job(
+    files: list[UploadFile],
+    namespace: str = "",
+    document_ids: dict[str, str] | None = None,
+) -> BulkIngestionJob:
+    """
+    Encola varios documentos (o archivos zip/tar) como un solo trabajo
+
+    Args:
+        files: Archivos subidos
+        namespace: Namespace de Pinecone donde se guardan los documentos
+        document_ids: Nombre de archivo -> documento del que es una nueva
+            versión (ver process_documents_bulk)
+
+    Returns:
+        Trabajo creado (en estado 'queued')
+
+    Raises:
+        HTTPException 503: Si la cola de ingesta está llena
+    """
+    job = BulkIngestionJob(
+        filename=", ".join(file.filename for file in files[:3])
+        + (f" (+{len(files) - 3})" if len(files) > 3 else ""),
+        namespace=namespace,
+        files_total=len(files),
+        document_ids=document_ids or {},
+    )
+    return _submit_job(job, files)
+
+
+def get_ingestion_job(job_id: str) -> IngestionJob | None:
+    """Obtiene un trabajo de este proceso por id"""
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def get_ingestion_job_response(
+    job_id: str,
+) -> IngestionJobResponse | BulkIngestionJobResponse | None:
+    """
+    Estado de un trabajo por id, sin importar qué proceso lo ejecuta
+
+    Los trabajos de este proceso se leen de memoria (progreso al día); los
+    de otros workers, del almacén compartido.
+    """
+    job = get_ingestion_job(job_id)
+    if job is not None:
+        return job.to_response()
+
+    job_store = get_job_store()
+    stored = job_store.get(job_id) if job_store is not None else None
+    if stored is None:
+        return None
+
+    kind, data = stored
+    if kind == BulkIngestionJob.kind:
+        return BulkIngestionJobResponse.model_validate_json(data)
+    return IngestionJobResponse.model_validate_json(data)
+
+
+def shutdown_ingestion_workers() -> None:
+    """
+    Detiene el pool de ingesta
+
+    Los trabajos que no empezaron se cancelan: quedan como fallidos y se
+    liberan sus archivos (ver _cancel_job).
+    """
+    global _executor, _slots
+    with _jobs_lock:
+        executor, _executor, _slots = _executor, None, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,496 @@
+import json
+import operator
+import os
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from ..core.logging import app_logger as logger
+from .pinecone import bump_index_generation
+from .vector_store import VectorStore
+
+# Filas reservadas al crear un namespace (la matriz se duplica al llenarse)
+INITIAL_CAPACITY = 1024
+
+# Nombre de archivo del namespace por defecto ("")
+DEFAULT_NAMESPACE_FILE = "default"
+
+# Filas escritas en el log antes de compactar, como mínimo (si no, el tamaño
+# del namespace): cada escritura cuesta O(lote) amortizado
+COMPACT_MIN_LOG_ROWS = 1024
+
+_COMPARISONS = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+}
+
+
+def matches_filter(metadata: dict[str, Any], filter: dict[str, Any]) -> bool:
+    """
+    Evalúa un filtro de metadata con la sintaxis de Pinecone
+
+    Soporta $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, $and, $or y
+    valores sueltos (equivale a $eq).
+    """
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_filter(metadata, clause) for clause in condition):
+                return False
+            continue
+
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        for op, operand in condition.items():
+            if op == "$in":
+                matched = value in operand
+            elif op == "$nin":
+                matched = value not in operand
+            elif op in _COMPARISONS:
+                if value is None:
+                    matched = op == "$ne"
+                else:
+                    try:
+                        matched = _COMPARISONS[op](value, operand)
+                    except TypeError:
+                        matched = False
+            else:
+                raise ValueError(f"Operador de filtro no soportado: {op}")
+            if not matched:
+                return False
+    return True
+
+
+def normalized_values(vectors: list[dict[str, Any]]) -> np.ndarray:
+    """Matriz float32 con los valores de cada vector normalizados a norma 1"""
+    values = np.asarray([vector["values"] for vector in vectors], dtype=np.float32)
+    if values.ndim != 2:
+        raise ValueError("Todos los vectores deben tener la misma dimensión")
+    norms = np.linalg.norm(values, axis=1, keepdims=True)
+    values /= np.where(norms > 0, norms, 1.0)
+    return values
+
+
+def namespace_file_name(namespace: str) -> str:
+    """Nombre de archivo de un namespace (puede tener caracteres inválidos)"""
+    return namespace.encode("utf-8").hex() if namespace else DEFAULT_NAMESPACE_FILE
+
+
+class _Namespace:
+    """Vectores de un namespace: matriz float32 con filas normalizadas"""
+
+    def __init__(self, dimension: int, capacity: int = INITIAL_CAPACITY):
+        self.matrix = np.zeros((capacity, dimension), dtype=np.float32)
+        self.ids: list[str] = []
+        self.metadata: list[dict[str, Any]] = []
+        self.rows: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def upsert(self, ids: list[str], values: np.ndarray, metadata: list[dict]) -> None:
+        for vector_id, row_values, row_metadata in zip(
+            ids, values, metadata, strict=True
+        ):
+            row = self.rows.get(vector_id)
+            if row is None:
+                row = len(self.ids)
+                if row == len(self.matrix):
+                    self._grow()
+                self.rows[vector_id] = row
+                self.ids.append(vector_id)
+                self.metadata.append(row_metadata)
+            else:
+                self.metadata[row] = row_metadata
+            self.matrix[row] = row_values
+
+    def update_metadata(self, metadata: dict[str, dict[str, Any]]) -> int:
+        updated = 0
+        for vector_id, fields in metadata.items():
+            row = self.rows.get(vector_id)
+            if row is not None:
+                self.metadata[row] = {**self.metadata[row], **fields}
+                updated += 1
+        return updated
+
+    def delete(self, ids: list[str]) -> int:
+        """Elimina filas moviendo la última a cada hueco"""
+        deleted = 0
+        for vector_id in ids:
+            row = self.rows.pop(vector_id, None)
+            if row is None:
+                continue
+            last = len(self.ids) - 1
+            if row != last:
+                self.matrix[row] = self.matrix[last]
+                self.ids[row] = self.ids[last]
+                self.metadata[row] = self.metadata[last]
+                self.rows[self.ids[row]] = row
+            self.ids.pop()
+            self.metadata.pop()
+            deleted += 1
+        return deleted
+
+    def _grow(self) -> None:
+        grown = np.zeros(
+            (max(len(self.matrix) * 2, 1), self.matrix.shape[1]), dtype=np.float32
+        )
+        grown[: len(self.matrix)] = self.matrix
+        self.matrix = grown
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Almacén de vectores en memoria con búsqueda exacta (NumPy)
+
+    Cada namespace es una matriz float32 con los vectores normalizados; una
+    consulta es un producto matriz-vector (similitud coseno si la consulta
+    también está normalizada, como los embeddings de OpenAI) seguido de
+    `np.argpartition` para el top-k. Los filtros de metadata se evalúan
+    antes de elegir el top-k.
+
+    Cada namespace se guarda en `path` como una instantánea, `<nombre>.npz`
+    (vectores, ids y metadata en un solo archivo que se reemplaza de forma
+    atómica), más un log de las escrituras posteriores: `<nombre>.log` (una
+    operación JSON por línea) y `<nombre>.vec` (los vectores insertados,
+    float32 crudos). Cada escritura solo agrega al log; cuando el log supera
+    al namespace (o COMPACT_MIN_LOG_ROWS) se reescribe la instantánea y se
+    vacía el log. Al crear el almacén se carga la instantánea y se aplica el
+    log (una línea incompleta al final se descarta); una instantánea ilegible
+    es un error, no un namespace vacío.
+
+    Es de un solo proceso: cada instancia tiene su propia copia en memoria
+    y agrega a los mismos archivos, así que la API debe correr con un único
+    worker. Los vectores dispersos se ignoran: la búsqueda es solo densa.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dimension = 0
+        self._namespaces: dict[str, _Namespace] = {}
+        # Filas escritas en el log de cada namespace desde la última compactación
+        self._log_rows: dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._load()
+
+    def upsert(self, vectors: list[dict[str, Any]], namespace: str = "") -> list[str]:
+        if not vectors:
+            return []
+
+        start = time.perf_counter()
+        ids = [vector["id"] for vector in vectors]
+        values = normalized_values(vectors)
+        metadata = [dict(vector.get("metadata") or {}) for vector in vectors]
+
+        with self._lock:
+            if not self.dimension:
+                self.dimension = values.shape[1]
+            if values.shape[1] != self.dimension:
+                raise ValueError(
+                    f"Dimensión {values.shape[1]} distinta a la del almacén "
+                    f"({self.dimension})"
+                )
+            store = self._namespaces.get(namespace)
+            if store is None:
+                store = self._namespaces[namespace] = _Namespace(self.dimension)
+                store.upsert(ids, values, metadata)
+                self._compact(namespace)
+            else:
+                store.upsert(ids, values, metadata)
+                self._append(
+                    namespace,
+                    {"op": "upsert", "ids": ids, "metadata": metadata},
+                    values,
+                )
+        bump_index_generation()
+
+        logger.info(
+            f"📤 Upsert local de {len(ids)} vectores en "
+            f"{(time.perf_counter() - start) * 1000:.2f} ms"
+        )
+        return ids
+
+    def query(
+        self,
+        vector: list[float],
+        top_k: int,
+        namespace: str = "",
+        filter: dict[str, Any] | None = None,
+        sparse_vector: dict[str, list] | None = None,
+        include_metadata: bool = True,
+    ) -> list[dict[str, Any]]:
+        with self._lock:
+            store = self._namespaces.get(namespace)
+            if store is None or not len(store) or top_k <= 0:
+                return []
+
+            query = np.asarray(vector, dtype=np.float32)
+            scores = store.matrix[: len(store)] @ query
+            if filter:
+                mask = np.fromiter(
+                    (matches_filter(metadata, filter) for metadata in store.metadata),
+                    dtype=bool,
+                    count=len(store),
+                )
+                candidates = np.flatnonzero(mask)
+                scores = scores[candidates]
+            else:
+                candidates = None
+
+            k = min(top_k, len(scores))
+            if not k:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            rows = candidates[top] if candidates is not None else top
+
+            return [
+                {
+                    "id": store.ids[row],
+                    "score": float(scores[i]),
+                    "metadata": store.metadata[row] if include_metadata else {},
+                }
+                for i, row in zip(top, rows, strict=True)
+            ]
+
+    def list_ids(self, prefix: str, namespace: str = "") -> list[str]:
+        with self._lock:
+            store = self._namespaces.get(namespace)
+            if store is None:
+                return []
+            return [
+                vector_id for vector_id in store.ids if vector_id.startswith(prefix)
+            ]
+
+    def fetch_metadata(
+        self, ids: list[str], namespace: str = ""
+    ) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            store = self._namespaces.get(namespace)
+            if store is None:
+                return {}
+            return {
+                vector_id: dict(store.metadata[store.rows[vector_id]])
+                for vector_id in ids
+                if vector_id in store.rows
+            }
+
+    def update_metadata(
+        self, metadata: dict[str, dict[str, Any]], namespace: str = ""
+    ) -> int:
+        with self._lock:
+            store = self._namespaces.get(namespace)
+            updated = store.update_metadata(metadata) if store is not None else 0
+            if updated:
+                self._append(namespace, {"op": "update", "metadata": metadata})
+        bump_index_generation()
+        return updated
+
+    def delete(self, ids: list[str], namespace: str = "") -> int:
+        with self._lock:
+            store = self._namespaces.get(namespace)
+            deleted = store.delete(ids) if store is not None else 0
+            if deleted:
+                self._append(namespace, {"op": "delete", "ids": ids})
+        bump_index_generation()
+
+        logger.info(f"🗑️ Eliminados {deleted} vectores locales")
+        return deleted
+
+    def delete_namespace(self, namespace: str) -> None:
+        with self._lock:
+            self._namespaces.pop(namespace, None)
+            self._log_rows.pop(namespace, None)
+            self._remove_files(namespace)
+        bump_index_generation()
+
+        logger.info(f"🗑️ Namespace '{namespace}' eliminado")
+
+    def delete_all(self) -> None:
+        with self._lock:
+            for namespace in list(self._namespaces):
+                self._remove_files(namespace)
+            self._namespaces.clear()
+            self._log_rows.clear()
+            self.dimension = 0
+        bump_index_generation()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            namespaces = {
+                name: {"vector_count": len(store)}
+                for name, store in self._namespaces.items()
+                if len(store)
+            }
+            return {
+                "total_vector_count": sum(
+                    summary["vector_count"] for summary in namespaces.values()
+                ),
+                "dimension": self.dimension,
+                "namespaces": namespaces,
+            }
+
+    def close(self) -> None:
+        # Cada escritura ya quedó en disco
+        pass
+
+    # Persistencia
+
+    def _file_stem(self, namespace: str) -> Path:
+        return self.path / namespace_file_name(namespace)
+
+    def _append(
+        self,
+        namespace: str,
+        operation: dict[str, Any],
+        values: np.ndarray | None = None,
+    ) -> None:
+        """Agrega una escritura al log del namespace (y compacta si creció)"""
+        stem = self._file_stem(namespace)
+        rows = len(operation.get("ids") or operation.get("metadata") or ())
+
+        if values is not None:
+            row_bytes = self.dimension * 4
+            with open(stem.with_suffix(".vec"), "ab") as f:
+                # Descarta una fila incompleta de una escritura interrumpida
+                end = f.tell() - f.tell() % row_bytes
+                f.truncate(end)
+                operation["offset"] = end // row_bytes
+                f.write(np.ascontiguousarray(values, dtype=np.float32).tobytes())
+
+        with open(stem.with_suffix(".log"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(operation, ensure_ascii=False) + "\n")
+
+        self._log_rows[namespace] = self._log_rows.get(namespace, 0) + rows
+        store = self._namespaces[namespace]
+        if self._log_rows[namespace] > max(len(store), COMPACT_MIN_LOG_ROWS):
+            self._compact(namespace)
+
+    def _compact(self, namespace: str) -> None:
+        """Reescribe la instantánea del namespace y vacía su log"""
+        store = self._namespaces[namespace]
+        stem = self._file_stem(namespace)
+
+        records = json.dumps(
+            {"namespace": namespace, "ids": store.ids, "metadata": store.metadata},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        snapshot_tmp = stem.with_suffix(".npz.tmp")
+        with open(snapshot_tmp, "wb") as f:
+            np.savez(
+                f,
+                vectors=store.matrix[: len(store)],
+                records=np.frombuffer(records, dtype=np.uint8),
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        # Un solo reemplazo: vectores y registros nunca quedan desparejos
+        os.replace(snapshot_tmp, stem.with_suffix(".npz"))
+
+        # Si se corta antes de vaciar el log, volver a aplicarlo da el mismo
+        # resultado: cada operación reemplaza, borra o combina por id
+        for suffix in (".log", ".vec"):
+            stem.with_suffix(suffix).unlink(missing_ok=True)
+        self._log_rows[namespace] = 0
+
+    def _remove_files(self, namespace: str) -> None:
+        stem = self._file_stem(namespace)
+        for suffix in (".npz", ".log", ".vec"):
+            stem.with_suffix(suffix).unlink(missing_ok=True)
+
+    def _load(self) -> None:
+        """
+        Carga los namespaces guardados en `path` y aplica sus logs
+
+        Raises:
+            ValueError: Si una instantánea no se puede leer o sus vectores no
+                coinciden con sus ids (seguir sin ella perdería el namespace
+                en la siguiente compactación)
+        """
+        for snapshot_path in sorted(self.path.glob("*.npz")):
+            try:
+                with np.load(snapshot_path, allow_pickle=False) as snapshot:
+                    matrix = snapshot["vectors"].astype(np.float32, copy=False)
+                    records = json.loads(snapshot["records"].tobytes())
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                raise ValueError(f"No se pudo cargar {snapshot_path}: {e}") from e
+            if len(matrix) != len(records["ids"]):
+                raise ValueError(
+                    f"{snapshot_path} tiene {len(matrix)} vectores y "
+                    f"{len(records['ids'])} ids"
+                )
+
+            if not self.dimension:
+                self.dimension = matrix.shape[1]
+            store = _Namespace(
+                matrix.shape[1], capacity=max(len(matrix), INITIAL_CAPACITY)
+            )
+            store.upsert(records["ids"], matrix, records["metadata"])
+            namespace = records["namespace"]
+            self._namespaces[namespace] = store
+            self._log_rows[namespace] = self._replay_log(store, snapshot_path)
+
+        if self._namespaces:
+            logger.info(
+                f"📂 Almacén local cargado: "
+                f"{self.stats()['total_vector_count']} vectores en "
+                f"{len(self._namespaces)} namespaces"
+            )
+
+    def _replay_log(self, store: _Namespace, snapshot_path: Path) -> int:
+        """Aplica el log de un namespace; devuelve las filas aplicadas"""
+        log_path = snapshot_path.with_suffix(".log")
+        if not log_path.exists():
+            return 0
+
+        vectors_path = snapshot_path.with_suffix(".vec")
+        logged = (
+            np.fromfile(vectors_path, dtype=np.float32)
+            if vectors_path.exists()
+            else np.zeros(0, dtype=np.float32)
+        )
+        dimension = store.matrix.shape[1]
+        logged = logged[: len(logged) - len(logged) % dimension].reshape(-1, dimension)
+
+        rows = 0
+        valid_bytes = 0
+        with open(log_path, "r+b") as f:
+            for line in f:
+                try:
+                    operation = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError:
+                    operation = None
+                if operation is None:
+                    break
+                if operation["op"] == "upsert":
+                    start = operation["offset"]
+                    values = logged[start : start + len(operation["ids"])]
+                    if len(values) != len(operation["ids"]):
+                        break
+                    store.upsert(operation["ids"], values, operation["metadata"])
+                    rows += len(operation["ids"])
+                elif operation["op"] == "delete":
+                    store.delete(operation["ids"])
+                    rows += len(operation["ids"])
+                elif operation["op"] == "update":
+                    store.update_metadata(operation["metadata"])
+                    rows += len(operation["metadata"])
+                valid_bytes += len(line)
+            # Descarta lo que dejó una escritura interrumpida, para que las
+            # siguientes líneas no queden pegadas a ella
+            f.truncate(valid_bytes)
+        return rows
@@ -1,33 +1,404 @@
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
 from typing import Any
-from pinecone import Pinecone
+from pinecone import AsyncIndex, Pinecone
+from pinecone.exceptions import PineconeApiException
 from ..core.config import settings
+from ..core.logging import app_logger as logger
 
+# Máximo de ids por request de borrado
+PINECONE_DELETE_BATCH_SIZE = 1000
 
+# Máximo de ids por request de fetch
+PINECONE_FETCH_BATCH_SIZE = 1000
+
+
+class IndexGeneration:
+    """
+    Generación del índice compartida entre procesos (SQLite)
+
+    Aumenta con cada escritura (upsert o borrado) hecha desde cualquier
+    worker que comparta INDEX_GENERATION_PATH; los caches de respuestas la
+    leen en cada acceso para invalidarse. Las escrituras de otros
+    servidores en el mismo índice de Pinecone no se ven: para eso está
+    SEMANTIC_CACHE_TTL.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+        if str(self.path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS generation (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                value INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute("INSERT OR IGNORE INTO generation (id, value) VALUES (0, 0)")
+
+    def get(self) -> int:
+        """Generación actual"""
+        with self._lock:
+            return self._conn.execute("SELECT value FROM generation").fetchone()[0]
+
+    def bump(self) -> int:
+        """Incrementa la generación y devuelve la nueva"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("UPDATE generation SET value = value + 1")
+            value = self._conn.execute("SELECT value FROM generation").fetchone()[0]
+            self._conn.execute("COMMIT")
+            return value
+
+
+@lru_cache
+def get_index_generation_store() -> IndexGeneration:
+    """Obtiene la generación del índice compartida del proceso"""
+    return IndexGeneration(settings.INDEX_GENERATION_PATH)
+
+
+def get_index_generation() -> int:
+    """Generación actual del índice"""
+    return get_index_generation_store().get()
+
+
+def bump_index_generation() -> int:
+    """Marca que el contenido del índice cambió"""
+    return get_index_generation_store().bump()
+
+
+@lru_cache(maxsize=1)
 def get_pinecone_index():
-    """Obtiene índice de Pinecone"""
-    pc = Pinecone(api_key=settings.PINECONE_API_KEY)  # Corregido: usar PINECONE_API_KEY
+    """Obtiene el índice de Pinecone compartido del proceso"""
+    pc = Pinecone(
+        api_key=settings.PINECONE_API_KEY,
+        connection_pool_maxsize=settings.PINECONE_POOL_MAXSIZE,
+    )
     return pc.Index(settings.PINECONE_INDEX_NAME)
 
 
-def store_vectors_in_pinecone(vectors: list[dict[str, Any]]) -> list[str]:
+@lru_cache(maxsize=1)
+def get_async_pinecone_index() -> AsyncIndex:
+    """
+    Obtiene el índice asíncrono de Pinecone compartido del proceso
+
+    Reutiliza el host ya resuelto por el índice síncrono.
+    """
+    return AsyncIndex(
+        host=get_pinecone_index().host,
+        api_key=settings.PINECONE_API_KEY,
+        connection_pool_maxsize=settings.PINECONE_POOL_MAXSIZE,
+    )
+
+
+def create_upsert_batches(
+    vectors: list[dict[str, Any]],
+    max_batch_bytes: int | None = None,
+    max_batch_size: int | None = None,
+) -> list[list[dict[str, Any]]]:
+    """
+    Agrupa vectores en lotes según su tamaño serializado
+
+    Cada lote queda por debajo del límite de bytes del request de Pinecone
+    y del máximo de vectores por lote.
+
+    Args:
+        vectors: Lista de vectores
+        max_batch_bytes: Máximo de bytes (JSON) por lote
+        max_batch_size: Máximo de vectores por lote
+
+    Returns:
+        Lista de lotes de vectores
+    """
+    max_batch_bytes = max_batch_bytes or settings.PINECONE_UPSERT_MAX_BATCH_BYTES
+    max_batch_size = max_batch_size or settings.PINECONE_UPSERT_MAX_BATCH_SIZE
+
+    batches = []
+    batch: list[dict[str, Any]] = []
+    batch_bytes = 0
+
+    for vector in vectors:
+        vector_bytes = len(json.dumps(vector, separators=(",", ":")).encode())
+        if vector_bytes > max_batch_bytes:
+            logger.warning(
+                f"⚠️ Vector {vector['id']} ocupa {vector_bytes} bytes "
+                f"(límite por lote: {max_batch_bytes})"
+            )
+
+        if batch and (
+            len(batch) >= max_batch_size or batch_bytes + vector_bytes > max_batch_bytes
+        ):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+
+        batch.append(vector)
+        batch_bytes += vector_bytes
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def _upsert_batch_with_retry(
+    index, batch: list[dict[str, Any]], namespace: str = ""
+) -> dict[str, Any]:
+    """Hace upsert de un lote reintentando con backoff exponencial"""
+    max_retries = settings.PINECONE_UPSERT_MAX_RETRIES
+    start = time.perf_counter()
+
+    attempt = 1
+    while True:
+        try:
+            index.upsert(vectors=batch, namespace=namespace)
+            return {
+                "vectors": len(batch),
+                "attempts": attempt,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+            }
+        except Exception as e:
+            if attempt > max_retries:
+                raise
+            delay = settings.PINECONE_UPSERT_RETRY_BACKOFF * 2 ** (attempt - 1)
+            logger.warning(
+                f"⚠️ Upsert de {len(batch)} vectores falló (intento {attempt}): {e}. "
+                f"Reintentando en {delay:.1f}s"
+            )
+            time.sleep(delay)
+            attempt += 1
+
+
+def upsert_vectors(
+    vectors: list[dict[str, Any]], index=None, namespace: str = ""
+) -> dict[str, Any]:
+    """
+    Almacena vectores en Pinecone con lotes concurrentes
+
+    Los lotes se arman por tamaño serializado y se envían en paralelo
+    (hasta PINECONE_UPSERT_CONCURRENCY a la vez); cada lote se reintenta
+    por separado.
+
+    Args:
+        vectors: Lista de vectores
+        index: Índice de Pinecone (se obtiene uno si no se indica)
+        namespace: Namespace de destino ("" = namespace por defecto)
+
+    Returns:
+        Dict con los IDs almacenados y métricas por lote
+    """
+    batches = create_upsert_batches(vectors)
+    if not batches:
+        return {"ids": [], "batches": [], "total_ms": 0.0}
+
+    index = index or get_pinecone_index()
+    start = time.perf_counter()
+
+    try:
+        reports = _upsert_batches(index, batches, namespace)
+    finally:
+        # Aun si falla, algunos lotes pueden haberse escrito
+        bump_index_generation()
+
+    total_ms = round((time.perf_counter() - start) * 1000, 2)
+    latencies = [report["latency_ms"] for report in reports]
+    logger.info(
+        f"📤 Upsert de {len(vectors)} vectores en {len(batches)} lotes: "
+        f"{total_ms} ms (lote máx: {max(latencies)} ms)"
+    )
+
+    return {
+        "ids": [vector["id"] for vector in vectors],
+        "batches": reports,
+        "total_ms": total_ms,
+    }
+
+
+def _upsert_batches(
+    index, batches: list[list[dict[str, Any]]], namespace: str = ""
+) -> list[dict]:
+    """Envía los lotes en paralelo (hasta PINECONE_UPSERT_CONCURRENCY)"""
+    workers = min(settings.PINECONE_UPSERT_CONCURRENCY, len(batches))
+    if workers <= 1:
+        return [_upsert_batch_with_retry(index, batch, namespace) for batch in batches]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(
+            executor.map(
+                lambda batch: _upsert_batch_with_retry(index, batch, namespace),
+                batches,
+            )
+        )
+
+
+def store_vectors_in_pinecone(
+    vectors: list[dict[str, Any]], namespace: str = ""
+) -> list[str]:
     """
     Almacena vectores en Pinecone
 
     Args:
         vectors: Lista de vectores
+        namespace: Namespace de destino
 
     Returns:
         Lista de IDs almacenados
     """
-    index = get_pinecone_index()
+    return upsert_vectors(vectors, namespace=namespace)["ids"]
+
+
+def list_vector_ids(prefix: str, index=None, namespace: str = "") -> list[str]:
+    """
+    Lista los ids del índice que empiezan con un prefijo
+
+    Args:
+        prefix: Prefijo de los ids (p. ej. "{document_id}#")
+        index: Índice de Pinecone (se obtiene uno si no se indica)
+        namespace: Namespace donde buscar
+
+    Returns:
+        Lista de ids (vacía si el índice no permite listarlos)
+
+    Raises:
+        PineconeApiException: Si el listado falla por otro motivo (un
+            listado vacío haría duplicar los chunks de una nueva versión)
+    """
+    index = index or get_pinecone_index()
+    ids = []
+    try:
+        for page in index.list(prefix=prefix, namespace=namespace):
+            # Según la versión del cliente, cada página es una lista de ids
+            # o un ListResponse con `vectors`
+            if isinstance(page, list):
+                ids.extend(page)
+            else:
+                ids.extend(item.id for item in page.vectors)
+    except PineconeApiException as e:
+        # Los índices pod-based responden 400 "not supported"
+        if "not supported" not in str(e).lower():
+            raise
+        logger.warning(f"⚠️ El índice no permite listar ids ({prefix}): {e}")
+        return []
+    return ids
+
 
-    # Upsert en lotes si hay muchos vectores
-    batch_size = 100
-    stored_ids = []
+def fetch_metadata(
+    ids: list[str], index=None, namespace: str = ""
+) -> dict[str, dict[str, Any]]:
+    """
+    Obtiene la metadata de vectores por id
+
+    Args:
+        ids: Ids a buscar (los que no existen se omiten)
+        index: Índice de Pinecone (se obtiene uno si no se indica)
+        namespace: Namespace de los vectores
+
+    Returns:
+        Metadata por id
+    """
+    index = index or get_pinecone_index()
+    metadata = {}
+    for i in range(0, len(ids), PINECONE_FETCH_BATCH_SIZE):
+        batch = ids[i : i + PINECONE_FETCH_BATCH_SIZE]
+        response = index.fetch(ids=batch, namespace=namespace)
+        for vector_id, vector in response.vectors.items():
+            metadata[vector_id] = dict(vector.metadata or {})
+    return metadata
+
+
+def update_metadata(
+    metadata: dict[str, dict[str, Any]], index=None, namespace: str = ""
+) -> int:
+    """
+    Actualiza la metadata de vectores existentes
 
-    for i in range(0, len(vectors), batch_size):
-        batch = vectors[i : i + batch_size]
-        index.upsert(vectors=batch)
-        stored_ids.extend([v["id"] for v in batch])
+    Pinecone combina `set_metadata` con la metadata actual y no toca los
+    valores del vector. La API actualiza un id por request, así que se
+    envían en paralelo (hasta PINECONE_UPSERT_CONCURRENCY a la vez).
+
+    Args:
+        metadata: Campos a actualizar por id
+        index: Índice de Pinecone (se obtiene uno si no se indica)
+        namespace: Namespace de los vectores
+
+    Returns:
+        Cantidad de ids actualizados
+    """
+    if not metadata:
+        return 0
+
+    index = index or get_pinecone_index()
+
+    def update(item: tuple[str, dict[str, Any]]) -> None:
+        vector_id, fields = item
+        index.update(id=vector_id, set_metadata=fields, namespace=namespace)
+
+    workers = min(settings.PINECONE_UPSERT_CONCURRENCY, len(metadata))
+    try:
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            # list() propaga el primer error
+            list(executor.map(update, metadata.items()))
+    finally:
+        bump_index_generation()
+
+    logger.info(f"🏷️ Metadata actualizada en {len(metadata)} vectores")
+    return len(metadata)
+
+
+def delete_vectors(ids: list[str], index=None, namespace: str = "") -> int:
+    """
+    Elimina vectores por id en lotes
+
+    Args:
+        ids: Ids a eliminar
+        index: Índice de Pinecone (se obtiene uno si no se indica)
+        namespace: Namespace de los vectores
+
+    Returns:
+        Cantidad de ids eliminados
+    """
+    if not ids:
+        return 0
+
+    index = index or get_pinecone_index()
+    try:
+        for i in range(0, len(ids), PINECONE_DELETE_BATCH_SIZE):
+            index.delete(
+                ids=ids[i : i + PINECONE_DELETE_BATCH_SIZE], namespace=namespace
+            )
+    finally:
+        bump_index_generation()
+
+    logger.info(f"🗑️ Eliminados {len(ids)} vectores")
+    return len(ids)
+
+
+def delete_namespace(namespace: str, index=None) -> None:
+    """
+    Elimina todos los vectores de un namespace
+
+    Args:
+        namespace: Namespace a vaciar
+        index: Índice de Pinecone (se obtiene uno si no se indica)
+    """
+    index = index or get_pinecone_index()
+    try:
+        index.delete(delete_all=True, namespace=namespace)
+    finally:
+        bump_index_generation()
 
-    return stored_ids
+    logger.info(f"🗑️ Namespace '{namespace}' eliminado")
@@ -0,0 +1,245 @@
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import numpy as np
+
+# Filas procesadas por bloque al codificar o puntuar (acota la memoria)
+BLOCK_ROWS = 65_536
+
+# Centroides por subespacio de product quantization (un byte por código)
+PQ_CENTROIDS = 256
+
+# Dimensiones por subespacio si no se indica la cantidad de subvectores
+PQ_DIMENSIONS_PER_SUBVECTOR = 8
+
+# Muestra e iteraciones del entrenamiento de cada subespacio
+PQ_TRAIN_SAMPLES = 16_384
+PQ_KMEANS_ITERATIONS = 10
+
+QUANTIZATIONS = ("none", "float16", "int8", "pq")
+
+
+class Quantizer(ABC):
+    """
+    Codificación compacta de vectores para la primera pasada de búsqueda
+
+    `scores` devuelve una aproximación del producto punto entre la consulta
+    y cada vector codificado; los mejores candidatos se vuelven a puntuar
+    con los vectores exactos. Con `residual` el índice codifica la
+    diferencia entre cada vector y el centroide de su lista.
+    """
+
+    name: str
+    dtype: np.dtype
+    residual = False
+
+    @abstractmethod
+    def width(self, dimension: int) -> int:
+        """Valores (de `dtype`) por vector codificado"""
+
+    @abstractmethod
+    def fit(self, sample: np.ndarray) -> None:
+        """Ajusta los parámetros a una muestra de vectores"""
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Códigos de los vectores"""
+
+    @abstractmethod
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Producto punto aproximado de la consulta con cada código"""
+
+    @abstractmethod
+    def state(self) -> dict[str, np.ndarray]:
+        """Parámetros ajustados (se guardan junto al índice)"""
+
+    @abstractmethod
+    def load_state(self, state: dict[str, np.ndarray]) -> None:
+        """Restaura los parámetros guardados"""
+
+    def save(self, path: Path) -> None:
+        with open(path, "wb") as f:
+            np.savez(f, **self.state())
+
+    def load(self, path: Path) -> None:
+        with np.load(path) as state:
+            self.load_state(dict(state))
+
+
+class Float16Quantizer(Quantizer):
+    """Vectores en float16 (2x más chicos que float32)"""
+
+    name = "float16"
+    dtype = np.dtype(np.float16)
+
+    def width(self, dimension: int) -> int:
+        return dimension
+
+    def fit(self, sample: np.ndarray) -> None:
+        # float16 no tiene parámetros
+        pass
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float16)
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        return _blockwise(codes, lambda block: block.astype(np.float32) @ query)
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {}
+
+    def load_state(self, state: dict[str, np.ndarray]) -> None:
+        pass
+
+
+class Int8Quantizer(Quantizer):
+    """
+    Cuantización escalar a int8 por dimensión (4x más chica que float32)
+
+    Cada dimensión se escala por el máximo absoluto visto en la muestra;
+    los valores fuera de rango se recortan.
+    """
+
+    name = "int8"
+    dtype = np.dtype(np.int8)
+
+    def __init__(self):
+        self.scale: np.ndarray | None = None
+
+    def width(self, dimension: int) -> int:
+        return dimension
+
+    def fit(self, sample: np.ndarray) -> None:
+        self.scale = (np.abs(sample).max(axis=0) / 127).astype(np.float32)
+        self.scale[self.scale == 0] = 1.0
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        scaled = (query * self.scale).astype(np.float32)
+        return _blockwise(codes, lambda block: block.astype(np.float32) @ scaled)
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {"scale": self.scale}
+
+    def load_state(self, state: dict[str, np.ndarray]) -> None:
+        self.scale = state["scale"]
+
+
+class ProductQuantizer(Quantizer):
+    """
+    Product quantization: un byte por subvector
+
+    El vector se divide en `subvectors` partes y cada una se reemplaza por
+    el índice de su centroide más cercano (k-means de 256 centroides por
+    subespacio). Con 8 dimensiones por subvector un vector float32 ocupa
+    32 veces menos. El score de una consulta se arma sumando productos
+    punto precalculados contra cada centroide (tabla de 256 por subespacio).
+    Se codifican residuos (vector - centroide de su lista), que con los
+    mismos bytes dan scores más precisos que los vectores completos.
+    """
+
+    name = "pq"
+    dtype = np.dtype(np.uint8)
+    residual = True
+
+    def __init__(self, subvectors: int = 0):
+        self.subvectors = subvectors
+        self.codebooks: np.ndarray | None = None  # (subvectors, 256, dims)
+
+    def width(self, dimension: int) -> int:
+        if not self.subvectors:
+            self.subvectors = pq_subvectors(dimension)
+        if dimension % self.subvectors:
+            raise ValueError(
+                f"La dimensión {dimension} no se divide en {self.subvectors} subvectores"
+            )
+        return self.subvectors
+
+    def fit(self, sample: np.ndarray) -> None:
+        dimension = sample.shape[1]
+        subvectors = self.width(dimension)
+        rng = np.random.default_rng(0)
+        if len(sample) > PQ_TRAIN_SAMPLES:
+            sample = sample[rng.choice(len(sample), PQ_TRAIN_SAMPLES, replace=False)]
+
+        parts = sample.reshape(len(sample), subvectors, -1)
+        self.codebooks = np.stack(
+            [_kmeans(parts[:, j], PQ_CENTROIDS, rng) for j in range(subvectors)]
+        )
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        parts = vectors.reshape(len(vectors), self.subvectors, -1)
+        codes = np.empty((len(vectors), self.subvectors), dtype=np.uint8)
+        for j, codebook in enumerate(self.codebooks):
+            codes[:, j] = _nearest(parts[:, j], codebook)
+        return codes
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        table = np.einsum(
+            "jkd,jd->jk", self.codebooks, query.reshape(self.subvectors, -1)
+        )
+        subspaces = np.arange(self.subvectors)
+        return _blockwise(
+            codes, lambda block: table[subspaces, block.astype(np.intp)].sum(axis=1)
+        )
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+    def load_state(self, state: dict[str, np.ndarray]) -> None:
+        self.codebooks = state["codebooks"]
+        self.subvectors = len(self.codebooks)
+
+
+def pq_subvectors(dimension: int) -> int:
+    """Subvectores de ~8 dimensiones que dividen exactamente a `dimension`"""
+    subvectors = max(dimension // PQ_DIMENSIONS_PER_SUBVECTOR, 1)
+    while dimension % subvectors:
+        subvectors -= 1
+    return subvectors
+
+
+def create_quantizer(name: str, pq_subvectors: int = 0) -> Quantizer | None:
+    """Cuantizador por nombre (None = sin cuantización)"""
+    if name == "none":
+        return None
+    if name == "float16":
+        return Float16Quantizer()
+    if name == "int8":
+        return Int8Quantizer()
+    if name == "pq":
+        return ProductQuantizer(pq_subvectors)
+    raise ValueError(
+        f"Cuantización desconocida: {name} (opciones: {', '.join(QUANTIZATIONS)})"
+    )
+
+
+def _blockwise(codes: np.ndarray, score) -> np.ndarray:
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), BLOCK_ROWS):
+        block = np.asarray(codes[start : start + BLOCK_ROWS])
+        scores[start : start + len(block)] = score(block)
+    return scores
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Centroide más cercano (distancia euclídea) de cada vector"""
+    distances = (centroids**2).sum(axis=1) - 2 * vectors @ centroids.T
+    return np.argmin(distances, axis=1)
+
+
+def _kmeans(data: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """k-means euclídeo; con menos puntos que `k` se repiten centroides"""
+    initial = rng.choice(len(data), k, replace=len(data) < k)
+    centroids = data[initial].astype(np.float32)
+    for _ in range(PQ_KMEANS_ITERATIONS):
+        labels = _nearest(data, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
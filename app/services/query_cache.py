@@ -0,0 +1,96 @@
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any
+
+from ..core.config import settings
+
+
+def normalize_query(query: str) -> str:
+    """Normaliza una consulta: Unicode NFC, minúsculas y espacios colapsados"""
+    return " ".join(unicodedata.normalize("NFC", query).casefold().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Cache LRU en memoria de embeddings de consultas
+
+    La clave es (modelo, consulta normalizada), así que "¿Qué es RAG?" y
+    "  ¿qué es  rag? " comparten embedding. Las entradas vencen a los
+    `ttl_seconds` y, al superar `max_entries`, se descartan las usadas
+    hace más tiempo.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._entries: OrderedDict[str, tuple[float, list[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model: str, query: str) -> str:
+        """Clave del cache para una consulta"""
+        return f"{model}:{normalize_query(query)}"
+
+    def get(self, key: str) -> list[float] | None:
+        """Embedding de la consulta (None si no está o venció)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, vector: list[float]) -> None:
+        """Guarda un embedding descartando el menos usado si hace falta"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, Any]:
+        """Estadísticas de uso del cache"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self) -> None:
+        """Vacía el cache y reinicia los contadores"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.expired = 0
+
+
+@lru_cache
+def get_query_embedding_cache() -> QueryEmbeddingCache | None:
+    """Obtiene el cache de consultas del proceso (None si está desactivado)"""
+    if not settings.QUERY_EMBEDDING_CACHE_ENABLED:
+        return None
+    return QueryEmbeddingCache(
+        settings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES,
+        settings.QUERY_EMBEDDING_CACHE_TTL,
+    )
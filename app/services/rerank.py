@@ -0,0 +1,98 @@
+import re
+import time
+from collections import Counter
+from typing import Any
+
+import numpy as np
+
+from ..core.logging import app_logger as logger
+
+# Parámetros estándar de BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Palabras en minúsculas (incluye números y códigos como 'E1234')"""
+    return _TOKEN_PATTERN.findall(text.casefold())
+
+
+def bm25_scores(query: str, texts: list[str]) -> np.ndarray:
+    """
+    Scores BM25 de la consulta contra un conjunto de textos
+
+    Las estadísticas (IDF, largo promedio) se calculan sobre los mismos
+    textos candidatos, así que no hace falta un corpus global.
+
+    Returns:
+        Un score por texto (float32)
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms or not texts:
+        return np.zeros(len(texts), dtype=np.float32)
+
+    # Frecuencia de cada término de la consulta en cada texto
+    tf = np.zeros((len(texts), len(terms)), dtype=np.float32)
+    lengths = np.empty(len(texts), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        counts = Counter(tokens)
+        tf[row] = [counts.get(term, 0) for term in terms]
+        lengths[row] = len(tokens)
+
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((len(texts) - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(lengths.mean(), 1.0))
+    return (idf * tf * (BM25_K1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+
+def rerank_results(
+    query: str, results: list[dict[str, Any]], k: int, dense_weight: float
+) -> list[dict[str, Any]]:
+    """
+    Reordena candidatos combinando el score denso con BM25
+
+    El score BM25 se normaliza a [0, 1] dentro de los candidatos y se
+    combina con el de Pinecone: `dense_weight * denso + (1 - dense_weight)
+    * bm25`. Cada resultado conserva su "score" original (lo usan el
+    umbral de similitud y la confianza) y suma "rerank_score".
+
+    Args:
+        query: Consulta del usuario
+        results: Candidatos de Pinecone
+        k: Resultados a conservar
+        dense_weight: Peso del score denso (0 = solo BM25, 1 = solo denso)
+
+    Returns:
+        Los `k` mejores candidatos, del más al menos relevante
+    """
+    if not results:
+        return []
+
+    start = time.perf_counter()
+    texts = [r.get("metadata", {}).get("text", "") for r in results]
+    lexical = bm25_scores(query, texts)
+    if lexical.max() > 0:
+        lexical = lexical / lexical.max()
+
+    dense = np.array([r.get("score", 0.0) for r in results], dtype=np.float32)
+    combined = dense_weight * dense + (1 - dense_weight) * lexical
+
+    order = np.argsort(-combined, kind="stable")[:k]
+    reranked = [
+        {
+            "id": results[i].get("id", ""),
+            "score": results[i].get("score", 0.0),
+            "metadata": results[i].get("metadata", {}),
+            "rerank_score": float(combined[i]),
+        }
+        for i in order
+    ]
+
+    logger.debug(
+        f"🔀 Rerank de {len(results)} candidatos en "
+        f"{(time.perf_counter() - start) * 1000:.2f} ms"
+    )
+    return reranked
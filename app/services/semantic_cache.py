@@ -0,0 +1,179 @@
+import threading
+import time
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+
+from ..core.config import settings
+from ..schemas.query import QueryResponse
+from .pinecone import get_index_generation
+
+
+class SemanticAnswerCache:
+    """
+    Cache de respuestas por similitud semántica de la consulta
+
+    Guarda el embedding normalizado de cada consulta respondida en una
+    matriz float32 de capacidad fija; al llegar a la capacidad se
+    reemplazan las entradas más antiguas. Una búsqueda es un solo
+    producto matriz-vector: si la consulta más parecida está a una
+    distancia coseno menor o igual a `max_distance` (y se pidió con los
+    mismos parámetros) se devuelve su respuesta.
+
+    Todas las entradas se descartan cuando cambia la generación del índice
+    (ver app.services.pinecone.get_index_generation), que se lee en cada
+    acceso porque la comparten todos los workers. Además cada entrada vence
+    a los `ttl` segundos, por las escrituras que la generación no ve.
+    """
+
+    def __init__(self, capacity: int, max_distance: float, ttl: float | None = None):
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._matrix: np.ndarray | None = None  # Se crea con la 1ª dimensión vista
+        self._params = np.empty(capacity, dtype=object)
+        self._stored_at = np.zeros(capacity, dtype=np.float64)
+        self._responses: list[QueryResponse | None] = [None] * capacity
+        self._size = 0
+        self._next = 0
+        self._generation = get_index_generation()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_params(
+        max_results: int, similarity_threshold: float, scope: str = ""
+    ) -> str:
+        """Parámetros de la consulta que deben coincidir además del embedding"""
+        return f"{max_results}:{similarity_threshold}:{scope}"
+
+    def _check_generation(self) -> None:
+        """Vacía el cache si el índice cambió desde que se llenó"""
+        generation = get_index_generation()
+        if generation != self._generation:
+            if self._size:
+                self.invalidations += 1
+            self._size = 0
+            self._next = 0
+            self._responses = [None] * self.capacity
+            self._generation = generation
+
+    def get(
+        self, embedding: list[float], params: str
+    ) -> tuple[QueryResponse, float] | None:
+        """
+        Busca una respuesta para una consulta parecida
+
+        Returns:
+            (respuesta, similitud) o None si no hay ninguna lo bastante cerca
+        """
+        with self._lock:
+            self._check_generation()
+            if not self._size:
+                self.misses += 1
+                return None
+
+            query = _normalize(embedding)
+            if query is None or query.shape[0] != self._matrix.shape[1]:
+                self.misses += 1
+                return None
+
+            similarities = self._matrix[: self._size] @ query
+            similarities[self._params[: self._size] != params] = -np.inf
+            if self.ttl is not None:
+                expired = self._stored_at[: self._size] < time.monotonic() - self.ttl
+                similarities[expired] = -np.inf
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+
+            if 1.0 - similarity > self.max_distance:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return self._responses[best], similarity
+
+    def put(
+        self,
+        embedding: list[float],
+        params: str,
+        response: QueryResponse,
+        generation: int,
+    ) -> None:
+        """
+        Guarda la respuesta de una consulta (reemplaza la más antigua)
+
+        `generation` es la generación del índice al empezar la consulta: si
+        el índice cambió mientras se respondía, la respuesta no se guarda.
+        """
+        vector = _normalize(embedding)
+        if vector is None:
+            return
+
+        with self._lock:
+            self._check_generation()
+            if generation != self._generation:
+                return
+            if self._matrix is None:
+                self._matrix = np.zeros(
+                    (self.capacity, vector.shape[0]), dtype=np.float32
+                )
+            if vector.shape[0] != self._matrix.shape[1]:
+                return
+
+            slot = self._next
+            self._matrix[slot] = vector
+            self._params[slot] = params
+            self._stored_at[slot] = time.monotonic()
+            self._responses[slot] = response
+            self._next = (slot + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def stats(self) -> dict[str, Any]:
+        """Estadísticas de uso del cache"""
+        total = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "capacity": self.capacity,
+            "max_distance": self.max_distance,
+            "ttl": self.ttl,
+            "index_generation": self._generation,
+            "invalidations": self.invalidations,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self) -> None:
+        """Vacía el cache y reinicia los contadores"""
+        with self._lock:
+            self._size = 0
+            self._next = 0
+            self._responses = [None] * self.capacity
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+
+def _normalize(embedding: list[float]) -> np.ndarray | None:
+    """Vector float32 de norma 1 (None si es nulo)"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if not norm:
+        return None
+    return vector / norm
+
+
+@lru_cache
+def get_semantic_cache() -> SemanticAnswerCache | None:
+    """Obtiene el cache semántico del proceso (None si está desactivado)"""
+    if not settings.SEMANTIC_CACHE_ENABLED:
+        return None
+    return SemanticAnswerCache(
+        settings.SEMANTIC_CACHE_CAPACITY,
+        settings.SEMANTIC_CACHE_MAX_DISTANCE,
+        settings.SEMANTIC_CACHE_TTL,
+    )
@@ -0,0 +1,65 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from functools import lru_cache
+from typing import Any, TypeVar
+
+from ..core.config import settings
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Deduplicación de consultas idénticas en curso
+
+    La primera llamada con una clave lanza el cálculo como tarea; las que
+    llegan con la misma clave mientras sigue en curso esperan esa tarea y
+    reciben el mismo resultado (o la misma excepción). Si una request se
+    cancela (p. ej. el cliente se desconecta) el cálculo sigue para las
+    demás.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._in_flight: dict[str, asyncio.Task] = {}
+
+    async def run(self, key: str, compute: Callable[[], Awaitable[T]]) -> T:
+        """Ejecuta `compute` o se une al cálculo en curso con la misma clave"""
+        task = self._in_flight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            self.leaders += 1
+            task = asyncio.ensure_future(compute())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    def stats(self) -> dict[str, Any]:
+        """Requests coalescidas y cálculos en curso"""
+        total = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._in_flight),
+            "computations": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / total if total else 0.0,
+        }
+
+    def clear(self) -> None:
+        """Reinicia los contadores"""
+        self.leaders = 0
+        self.coalesced = 0
+
+
+@lru_cache
+def get_query_single_flight() -> SingleFlight | None:
+    """Obtiene el deduplicador de consultas (None si está desactivado)"""
+    if not settings.QUERY_COALESCING_ENABLED:
+        return None
+    return SingleFlight()
@@ -0,0 +1,326 @@
+import sqlite3
+import threading
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from ..core.config import settings
+from .rerank import BM25_B, BM25_K1, tokenize
+
+# SQLite limita la cantidad de parámetros por sentencia
+SQLITE_BATCH_SIZE = 500
+
+
+def term_ids(tokens: list[str]) -> np.ndarray:
+    """Índice estable (uint32) de cada término, igual en todos los procesos"""
+    return np.fromiter(
+        (zlib.crc32(token.encode("utf-8")) for token in tokens),
+        dtype=np.uint32,
+        count=len(tokens),
+    )
+
+
+class SparseEncoder:
+    """
+    Codificador BM25 de vectores dispersos para búsqueda híbrida
+
+    Los documentos llevan la parte de frecuencia de BM25 (normalizada a
+    [0, 1]) y las consultas el IDF de cada término (normalizado a suma 1),
+    así que el producto punto es un score BM25 en [0, 1] y los vectores
+    ya almacenados no cambian cuando cambian las estadísticas.
+
+    El vocabulario (índice de cada término -> cantidad de chunks que lo
+    contienen), la cantidad de chunks y el largo total se guardan en
+    SQLite y se actualizan de forma incremental en cada ingesta. Los
+    términos de cada chunk se registran por namespace e id, así que al
+    eliminar chunks (o volver a codificar un id) se restan sus aportes.
+    Las estadísticas se leen de SQLite en cada uso (no se guardan en el
+    objeto), así que reflejan las ingestas de todos los workers.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+        if str(self.path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vocabulary (
+                term_id INTEGER PRIMARY KEY,
+                df INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS corpus (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                documents INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                namespace TEXT NOT NULL,
+                id TEXT NOT NULL,
+                terms BLOB NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (namespace, id)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO corpus (id, documents, total_length) VALUES (0, 0, 0)"
+        )
+
+    @property
+    def documents(self) -> int:
+        """Cantidad de chunks vistos"""
+        with self._lock:
+            return self._corpus()[0]
+
+    @property
+    def average_length(self) -> float:
+        """Largo promedio (en términos) de los chunks vistos"""
+        with self._lock:
+            return self._average_length()
+
+    def encode_documents(
+        self,
+        texts: list[str],
+        ids: list[str] | None = None,
+        namespace: str = "",
+    ) -> list[dict[str, list]]:
+        """
+        Vectores dispersos de chunks nuevos (actualiza las estadísticas)
+
+        Args:
+            texts: Textos de los chunks
+            ids: Ids de los chunks, para poder restar sus términos al
+                eliminarlos (ver remove)
+            namespace: Namespace donde se almacenan los chunks
+
+        Returns:
+            Un dict {"indices", "values"} por texto, listo para Pinecone
+        """
+        counted = []
+        for text in texts:
+            terms, tf = np.unique(term_ids(tokenize(text)), return_counts=True)
+            counted.append((terms, tf.astype(np.float32)))
+
+        average_length = self._update_statistics(counted, ids, namespace)
+
+        vectors = []
+        for terms, tf in counted:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * tf.sum() / average_length)
+            values = tf * (BM25_K1 + 1) / (tf + norm) / (BM25_K1 + 1)
+            vectors.append({"indices": terms.tolist(), "values": values.tolist()})
+        return vectors
+
+    def encode_query(self, query: str) -> dict[str, list]:
+        """Vector disperso de una consulta: IDF de sus términos (suma 1)"""
+        ids = np.unique(term_ids(tokenize(query)))
+        if not ids.size:
+            return {"indices": [], "values": []}
+
+        documents, df = self._document_frequencies(ids)
+        idf = np.log1p((documents - df + 0.5) / (df + 0.5)).astype(np.float32)
+        total = idf.sum()
+        if total <= 0:
+            return {"indices": [], "values": []}
+        return {"indices": ids.tolist(), "values": (idf / total).tolist()}
+
+    def remove(self, ids: list[str], namespace: str = "") -> int:
+        """Resta de las estadísticas los chunks eliminados; devuelve cuántos"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            removed = self._forget_chunks(ids, namespace)
+            self._conn.execute("COMMIT")
+        return removed
+
+    def remove_namespace(self, namespace: str) -> int:
+        """Resta de las estadísticas todos los chunks de un namespace"""
+        with self._lock:
+            ids = [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT id FROM chunks WHERE namespace = ?", (namespace,)
+                )
+            ]
+            self._conn.execute("BEGIN")
+            removed = self._forget_chunks(ids, namespace)
+            self._conn.execute("COMMIT")
+        return removed
+
+    def _update_statistics(
+        self,
+        counted: list[tuple[np.ndarray, np.ndarray]],
+        chunk_ids: list[str] | None = None,
+        namespace: str = "",
+    ) -> float:
+        """Suma los chunks nuevos al vocabulario; devuelve el largo promedio"""
+        if not counted:
+            return self.average_length
+
+        all_ids = np.concatenate([ids for ids, _ in counted])
+        ids, df = np.unique(all_ids, return_counts=True)
+        lengths = [int(tf.sum()) for _, tf in counted]
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            if chunk_ids is not None:
+                # Un id ya registrado se reemplaza: primero se restan sus términos
+                self._forget_chunks(chunk_ids, namespace)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (namespace, id, terms, length) "
+                    "VALUES (?, ?, ?, ?)",
+                    (
+                        (namespace, chunk_id, terms.astype(np.uint32).tobytes(), size)
+                        for chunk_id, (terms, _), size in zip(
+                            chunk_ids, counted, lengths, strict=True
+                        )
+                    ),
+                )
+            self._conn.executemany(
+                "INSERT INTO vocabulary (term_id, df) VALUES (?, ?) "
+                "ON CONFLICT(term_id) DO UPDATE SET df = df + excluded.df",
+                zip(ids.tolist(), df.tolist(), strict=True),
+            )
+            self._add_to_corpus(len(counted), sum(lengths))
+            average_length = self._average_length()
+            self._conn.execute("COMMIT")
+        return average_length
+
+    def _forget_chunks(self, chunk_ids: list[str], namespace: str) -> int:
+        """Resta los términos de chunks registrados (dentro de una transacción)"""
+        removed = 0
+        for i in range(0, len(chunk_ids), SQLITE_BATCH_SIZE):
+            batch = chunk_ids[i : i + SQLITE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                "SELECT terms, length FROM chunks "
+                f"WHERE namespace = ? AND id IN ({placeholders})",
+                [namespace, *batch],
+            ).fetchall()
+            if not rows:
+                continue
+
+            terms = np.concatenate(
+                [np.frombuffer(blob, dtype=np.uint32) for blob, _ in rows]
+            )
+            ids, df = np.unique(terms, return_counts=True)
+            self._conn.executemany(
+                "UPDATE vocabulary SET df = df - ? WHERE term_id = ?",
+                zip(df.tolist(), ids.tolist(), strict=True),
+            )
+            self._conn.execute(
+                f"DELETE FROM chunks WHERE namespace = ? AND id IN ({placeholders})",
+                [namespace, *batch],
+            )
+            self._add_to_corpus(-len(rows), -sum(length for _, length in rows))
+            removed += len(rows)
+
+        if removed:
+            self._conn.execute("DELETE FROM vocabulary WHERE df <= 0")
+        return removed
+
+    def _add_to_corpus(self, documents: int, length: int) -> None:
+        self._conn.execute(
+            "UPDATE corpus SET documents = MAX(documents + ?, 0), "
+            "total_length = MAX(total_length + ?, 0)",
+            (documents, length),
+        )
+
+    def _corpus(self) -> tuple[int, int]:
+        """Cantidad de chunks y largo total (con el lock tomado)"""
+        return self._conn.execute(
+            "SELECT documents, total_length FROM corpus"
+        ).fetchone()
+
+    def _average_length(self) -> float:
+        documents, total_length = self._corpus()
+        return total_length / documents if documents else 1.0
+
+    def _document_frequencies(self, ids: np.ndarray) -> tuple[int, np.ndarray]:
+        """Cantidad de chunks y chunks que contienen cada término (0 si no se vio)"""
+        found: dict[int, int] = {}
+        id_list = ids.tolist()
+        with self._lock:
+            # Una transacción: el corpus y el vocabulario de la misma ingesta
+            self._conn.execute("BEGIN")
+            documents = self._corpus()[0]
+            for i in range(0, len(id_list), SQLITE_BATCH_SIZE):
+                batch = id_list[i : i + SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                found.update(
+                    self._conn.execute(
+                        "SELECT term_id, df FROM vocabulary "
+                        f"WHERE term_id IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                )
+            self._conn.execute("COMMIT")
+        return documents, np.array([found.get(i, 0) for i in id_list], dtype=np.float32)
+
+    def stats(self) -> dict[str, Any]:
+        """Tamaño del vocabulario y del corpus"""
+        with self._lock:
+            terms = self._conn.execute("SELECT COUNT(*) FROM vocabulary").fetchone()[0]
+            documents = self._corpus()[0]
+            average_length = self._average_length()
+        return {
+            "terms": terms,
+            "documents": documents,
+            "average_length": round(average_length, 2),
+        }
+
+    def clear(self) -> None:
+        """Vacía el vocabulario (p. ej. al borrar todos los vectores)"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM vocabulary")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("UPDATE corpus SET documents = 0, total_length = 0")
+            self._conn.execute("COMMIT")
+
+    def close(self) -> None:
+        """Cierra la conexión a SQLite"""
+        with self._lock:
+            self._conn.close()
+
+
+def hybrid_query_vectors(
+    dense: list[float], sparse: dict[str, list], alpha: float
+) -> tuple[list[float], dict[str, list]]:
+    """
+    Pondera los vectores de una consulta híbrida
+
+    Con un índice de métrica dotproduct el score es
+    `alpha * denso + (1 - alpha) * disperso`.
+    """
+    dense_values = (np.asarray(dense, dtype=np.float32) * alpha).tolist()
+    sparse_values = {
+        "indices": sparse["indices"],
+        "values": [value * (1 - alpha) for value in sparse["values"]],
+    }
+    return dense_values, sparse_values
+
+
+@lru_cache
+def get_sparse_encoder() -> SparseEncoder | None:
+    """Obtiene el codificador disperso del proceso (None si está desactivado)"""
+    if not settings.HYBRID_SEARCH_ENABLED:
+        return None
+    return SparseEncoder(settings.SPARSE_VOCAB_PATH)
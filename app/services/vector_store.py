@@ -0,0 +1,311 @@
+import asyncio
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any
+
+from ..core.config import settings
+from .chunk_store import get_chunk_store
+from .pinecone import (
+    delete_namespace as pinecone_delete_namespace,
+)
+from .pinecone import (
+    delete_vectors as pinecone_delete_vectors,
+)
+from .pinecone import (
+    fetch_metadata as pinecone_fetch_metadata,
+)
+from .pinecone import (
+    get_async_pinecone_index,
+    get_pinecone_index,
+)
+from .pinecone import (
+    list_vector_ids as pinecone_list_vector_ids,
+)
+from .pinecone import (
+    update_metadata as pinecone_update_metadata,
+)
+from .pinecone import (
+    upsert_vectors as pinecone_upsert_vectors,
+)
+from .sparse import get_sparse_encoder
+
+VECTOR_STORE_BACKENDS = ("pinecone", "local", "ann")
+
+
+class VectorStore(ABC):
+    """
+    Almacén de vectores usado por la ingesta y las consultas
+
+    Los vectores tienen el formato de Pinecone: dict con "id", "values",
+    "metadata" y opcionalmente "sparse_values". Las búsquedas devuelven
+    resultados con "id", "score" y "metadata". Los filtros usan la sintaxis
+    de metadata de Pinecone ($eq, $in, $gte, ...).
+    """
+
+    @abstractmethod
+    def upsert(self, vectors: list[dict[str, Any]], namespace: str = "") -> list[str]:
+        """Inserta o reemplaza vectores; devuelve sus ids"""
+
+    @abstractmethod
+    def query(
+        self,
+        vector: list[float],
+        top_k: int,
+        namespace: str = "",
+        filter: dict[str, Any] | None = None,
+        sparse_vector: dict[str, list] | None = None,
+        include_metadata: bool = True,
+    ) -> list[dict[str, Any]]:
+        """Los `top_k` vectores más parecidos, del más al menos parecido"""
+
+    async def aquery(self, **arguments: Any) -> list[dict[str, Any]]:
+        """Versión asíncrona de query (por defecto, en un hilo)"""
+        return await asyncio.to_thread(lambda: self.query(**arguments))
+
+    @abstractmethod
+    def list_ids(self, prefix: str, namespace: str = "") -> list[str]:
+        """Ids que empiezan con un prefijo"""
+
+    @abstractmethod
+    def fetch_metadata(
+        self, ids: list[str], namespace: str = ""
+    ) -> dict[str, dict[str, Any]]:
+        """Metadata de vectores por id (los ids que no existen se omiten)"""
+
+    @abstractmethod
+    def update_metadata(
+        self, metadata: dict[str, dict[str, Any]], namespace: str = ""
+    ) -> int:
+        """
+        Actualiza la metadata de vectores existentes sin tocar sus valores
+
+        Los campos indicados para cada id se combinan con los que ya tiene;
+        los ids que no existen se ignoran. Devuelve la cantidad pedida.
+        """
+
+    @abstractmethod
+    def delete(self, ids: list[str], namespace: str = "") -> int:
+        """Elimina vectores por id; devuelve la cantidad pedida"""
+
+    @abstractmethod
+    def delete_namespace(self, namespace: str) -> None:
+        """Elimina todos los vectores de un namespace"""
+
+    @abstractmethod
+    def delete_all(self) -> None:
+        """Elimina todos los vectores de todos los namespaces"""
+
+    @abstractmethod
+    def stats(self) -> dict[str, Any]:
+        """Total de vectores, dimensión y vectores por namespace"""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Libera los recursos del almacén"""
+
+
+class PineconeVectorStore(VectorStore):
+    """Almacén sobre el índice de Pinecone compartido del proceso"""
+
+    def upsert(self, vectors: list[dict[str, Any]], namespace: str = "") -> list[str]:
+        return pinecone_upsert_vectors(vectors, namespace=namespace)["ids"]
+
+    def query(
+        self,
+        vector: list[float],
+        top_k: int,
+        namespace: str = "",
+        filter: dict[str, Any] | None = None,
+        sparse_vector: dict[str, list] | None = None,
+        include_metadata: bool = True,
+    ) -> list[dict[str, Any]]:
+        arguments = _pinecone_query_arguments(
+            vector, top_k, namespace, filter, sparse_vector, include_metadata
+        )
+        return get_pinecone_index().query(**arguments).get("matches", [])
+
+    async def aquery(self, **arguments: Any) -> list[dict[str, Any]]:
+        arguments = _pinecone_query_arguments(**arguments)
+        results = await get_async_pinecone_index().query(**arguments)
+        return results.get("matches", [])
+
+    def list_ids(self, prefix: str, namespace: str = "") -> list[str]:
+        return pinecone_list_vector_ids(prefix, namespace=namespace)
+
+    def fetch_metadata(
+        self, ids: list[str], namespace: str = ""
+    ) -> dict[str, dict[str, Any]]:
+        return pinecone_fetch_metadata(ids, namespace=namespace)
+
+    def update_metadata(
+        self, metadata: dict[str, dict[str, Any]], namespace: str = ""
+    ) -> int:
+        return pinecone_update_metadata(metadata, namespace=namespace)
+
+    def delete(self, ids: list[str], namespace: str = "") -> int:
+        return pinecone_delete_vectors(ids, namespace=namespace)
+
+    def delete_namespace(self, namespace: str) -> None:
+        pinecone_delete_namespace(namespace)
+
+    def delete_all(self) -> None:
+        # delete_all de Pinecone solo afecta a un namespace
+        for namespace in self.stats()["namespaces"] or {"": None}:
+            pinecone_delete_namespace(namespace)
+
+    def close(self) -> None:
+        # Los índices compartidos los cierra close_clients
+        pass
+
+    def stats(self) -> dict[str, Any]:
+        stats = get_pinecone_index().describe_index_stats()
+        namespaces = stats.get("namespaces") or {}
+        return {
+            "total_vector_count": stats.get("total_vector_count", 0),
+            "dimension": stats.get("dimension", 0),
+            "index_fullness": stats.get("index_fullness", 0.0),
+            "namespaces": {
+                name: {"vector_count": _vector_count(summary)}
+                for name, summary in namespaces.items()
+            },
+        }
+
+
+def _pinecone_query_arguments(
+    vector: list[float],
+    top_k: int,
+    namespace: str = "",
+    filter: dict[str, Any] | None = None,
+    sparse_vector: dict[str, list] | None = None,
+    include_metadata: bool = True,
+) -> dict[str, Any]:
+    arguments = {
+        "vector": vector,
+        "top_k": top_k,
+        "include_metadata": include_metadata,
+        "namespace": namespace,
+    }
+    if filter:
+        arguments["filter"] = filter
+    if sparse_vector:
+        arguments["sparse_vector"] = sparse_vector
+    return arguments
+
+
+def _vector_count(summary: Any) -> int:
+    if isinstance(summary, dict):
+        return summary.get("vector_count", 0)
+    return getattr(summary, "vector_count", 0)
+
+
+@lru_cache(maxsize=1)
+def get_vector_store() -> VectorStore:
+    """Obtiene el almacén de vectores del proceso (según VECTOR_STORE_BACKEND)"""
+    backend = settings.VECTOR_STORE_BACKEND
+    if backend == "pinecone":
+        return PineconeVectorStore()
+    if backend == "local":
+        from .local_vector_store import LocalVectorStore
+
+        return LocalVectorStore(settings.LOCAL_VECTOR_STORE_PATH)
+    if backend == "ann":
+        from .ann import ANNVectorStore
+
+        return ANNVectorStore(settings.ANN_INDEX_PATH)
+    raise ValueError(
+        f"VECTOR_STORE_BACKEND desconocido: {backend} "
+        f"(opciones: {', '.join(VECTOR_STORE_BACKENDS)})"
+    )
+
+
+def store_vectors(vectors: list[dict[str, Any]], namespace: str = "") -> list[str]:
+    """
+    Almacena vectores en el almacén configurado
+
+    Con el almacén de textos activo, el texto de cada chunk se guarda
+    localmente (antes del upsert, para que ninguna búsqueda encuentre un
+    vector sin texto) y los vectores se suben sin `metadata.text`.
+
+    Args:
+        vectors: Lista de vectores
+        namespace: Namespace de destino
+
+    Returns:
+        Lista de IDs almacenados
+    """
+    chunk_store = get_chunk_store()
+    if chunk_store is not None:
+        chunk_store.put_many(
+            {
+                vector["id"]: vector["metadata"]["text"]
+                for vector in vectors
+                if "text" in (vector.get("metadata") or {})
+            },
+            namespace,
+        )
+        vectors = [_without_text(vector) for vector in vectors]
+    return get_vector_store().upsert(vectors, namespace=namespace)
+
+
+def _without_text(vector: dict[str, Any]) -> dict[str, Any]:
+    metadata = vector.get("metadata") or {}
+    if "text" not in metadata:
+        return vector
+    return {
+        **vector,
+        "metadata": {key: value for key, value in metadata.items() if key != "text"},
+    }
+
+
+def list_vector_ids(prefix: str, namespace: str = "") -> list[str]:
+    """Ids del almacén que empiezan con un prefijo (p. ej. "{document_id}#")"""
+    return get_vector_store().list_ids(prefix, namespace=namespace)
+
+
+def fetch_vector_metadata(
+    ids: list[str], namespace: str = ""
+) -> dict[str, dict[str, Any]]:
+    """Metadata de vectores existentes por id"""
+    if not ids:
+        return {}
+    return get_vector_store().fetch_metadata(ids, namespace=namespace)
+
+
+def update_vector_metadata(
+    metadata: dict[str, dict[str, Any]], namespace: str = ""
+) -> int:
+    """Combina campos en la metadata de vectores existentes (id -> campos)"""
+    if not metadata:
+        return 0
+    return get_vector_store().update_metadata(metadata, namespace=namespace)
+
+
+def delete_vectors(ids: list[str], namespace: str = "") -> int:
+    """
+    Elimina vectores por id; devuelve la cantidad eliminada
+
+    También elimina sus textos y resta sus términos de las estadísticas
+    de BM25.
+    """
+    if not ids:
+        return 0
+    deleted = get_vector_store().delete(ids, namespace=namespace)
+    chunk_store = get_chunk_store()
+    if chunk_store is not None:
+        chunk_store.delete(ids, namespace)
+    encoder = get_sparse_encoder()
+    if encoder is not None:
+        encoder.remove(ids, namespace)
+    return deleted
+
+
+def delete_namespace(namespace: str, store: VectorStore | None = None) -> None:
+    """Elimina todos los vectores de un namespace (y sus textos y términos)"""
+    store = store or get_vector_store()
+    store.delete_namespace(namespace)
+    chunk_store = get_chunk_store()
+    if chunk_store is not None:
+        chunk_store.delete_namespace(namespace)
+    encoder = get_sparse_encoder()
+    if encoder is not None:
+        encoder.remove_namespace(namespace)
@@ -0,0 +1,184 @@
+import tarfile
+import tempfile
+import zipfile
+import zlib
+from collections.abc import Callable, Iterator
+from io import BytesIO
+from pathlib import PurePosixPath
+from typing import IO
+
+from fastapi import UploadFile
+
+from app.core.config import settings
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+# Bloque de copia al descomprimir un miembro
+COPY_BLOCK_SIZE = 1024 * 1024
+
+# Errores de un archivo comprimido dañado o truncado
+CORRUPT_ARCHIVE_ERRORS = (
+    zipfile.BadZipFile,
+    tarfile.TarError,
+    zlib.error,
+    EOFError,
+    OSError,
+)
+
+# Errores al leer un miembro de un zip (CRC, cifrado, compresión no soportada)
+CORRUPT_MEMBER_ERRORS = (
+    zipfile.BadZipFile,
+    zlib.error,
+    EOFError,
+    RuntimeError,
+    NotImplementedError,
+)
+
+
+class ArchiveError(ValueError):
+    """Archivo comprimido (o miembro) que no se pudo leer"""
+
+    def __init__(self, filename: str, message: str):
+        super().__init__(message)
+        self.filename = filename
+
+
+class _MemberTooLargeError(Exception):
+    def __init__(self, size: int):
+        super().__init__(size)
+        self.size = size
+
+
+def is_archive(filename: str) -> bool:
+    """Si el archivo es un zip o tar soportado"""
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def iter_archive_members(
+    file: UploadFile, supported: Callable[[str], bool] | None = None
+) -> Iterator[UploadFile | ArchiveError]:
+    """
+    Recorre los archivos de un zip o tar sin extraerlos a disco
+
+    Cada miembro se descomprime a un archivo temporal (en memoria hasta
+    UPLOAD_SPOOL_MAX_BYTES, en disco por encima), seekable como necesitan
+    los extractores, que se cierra al pedir el siguiente. Se omiten
+    directorios, archivos ocultos y metadatos de macOS.
+
+    Los límites de cantidad de miembros (BULK_MAX_ARCHIVE_MEMBERS) y de
+    tamaño descomprimido por miembro y total (BULK_MAX_MEMBER_BYTES,
+    BULK_MAX_ARCHIVE_BYTES) se aplican mientras se lee, sin confiar en los
+    tamaños declarados. Los errores no se lanzan: un miembro ilegible o
+    demasiado grande, o un archivo dañado o que supera los límites, se
+    entrega como ArchiveError y el recorrido sigue con lo que se pueda leer.
+
+    Args:
+        file: Archivo zip o tar subido
+        supported: Filtro por nombre; los miembros que no lo cumplen se
+            entregan vacíos, sin descomprimirlos
+
+    Yields:
+        Un UploadFile por miembro, con la ruta dentro del archivo como
+        nombre, o un ArchiveError
+    """
+    file.file.seek(0)
+    members = 0
+    total_bytes = 0
+
+    try:
+        for name, source, declared_size in _iter_raw_members(file):
+            if supported is not None and not supported(name):
+                yield UploadFile(file=BytesIO(), filename=name)
+                continue
+
+            members += 1
+            if members > settings.BULK_MAX_ARCHIVE_MEMBERS:
+                yield ArchiveError(
+                    file.filename,
+                    f"Archive has more than {settings.BULK_MAX_ARCHIVE_MEMBERS} files",
+                )
+                return
+
+            limit = min(
+                settings.BULK_MAX_MEMBER_BYTES,
+                settings.BULK_MAX_ARCHIVE_BYTES - total_bytes,
+            )
+            with tempfile.SpooledTemporaryFile(
+                max_size=settings.UPLOAD_SPOOL_MAX_BYTES, prefix="archive-"
+            ) as spooled:
+                try:
+                    if declared_size is not None and declared_size > limit:
+                        raise _MemberTooLargeError(declared_size)
+                    size = _copy_member(source, spooled, limit)
+                except _MemberTooLargeError as e:
+                    # Lo leído (o lo que un tar tiene que saltear) cuenta para el total
+                    total_bytes += e.size
+                    if total_bytes > settings.BULK_MAX_ARCHIVE_BYTES:
+                        yield ArchiveError(
+                            file.filename,
+                            f"Archive exceeds {settings.BULK_MAX_ARCHIVE_BYTES} "
+                            "bytes uncompressed",
+                        )
+                        return
+                    yield ArchiveError(
+                        name,
+                        f"File exceeds {settings.BULK_MAX_MEMBER_BYTES} "
+                        "bytes uncompressed",
+                    )
+                    continue
+                except CORRUPT_MEMBER_ERRORS as e:
+                    yield ArchiveError(name, f"Corrupt file in archive: {e}")
+                    continue
+
+                total_bytes += size
+                yield UploadFile(file=spooled, filename=name, size=size)
+
+    except CORRUPT_ARCHIVE_ERRORS as e:
+        yield ArchiveError(file.filename, f"Corrupt archive: {e}")
+
+
+def _iter_raw_members(
+    file: UploadFile,
+) -> Iterator[tuple[str, IO[bytes], int | None]]:
+    """
+    Nombre, flujo comprimido y tamaño de cada archivo regular del zip o tar
+
+    El tamaño de un miembro de tar es el que ocupa en el flujo, así que es
+    confiable; el declarado en un zip no, y se devuelve None.
+    """
+    if file.filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(file.file) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or _is_hidden(info.filename):
+                    continue
+                with archive.open(info) as member:
+                    yield info.filename, member, None
+        return
+
+    with tarfile.open(fileobj=file.file, mode="r:*") as archive:
+        for info in archive:
+            if not info.isfile() or _is_hidden(info.name):
+                continue
+            member = archive.extractfile(info)
+            if member is None:
+                continue
+            with member:
+                yield info.name, member, info.size
+
+
+def _copy_member(source: IO[bytes], target: IO[bytes], limit: int) -> int:
+    """Copia un miembro descomprimido, cortando al superar `limit` bytes"""
+    size = 0
+    # Nunca se descomprime más de un byte por encima del límite
+    while block := source.read(min(COPY_BLOCK_SIZE, limit - size + 1)):
+        size += len(block)
+        if size > limit:
+            raise _MemberTooLargeError(size)
+        target.write(block)
+    target.seek(0)
+    return size
+
+
+def _is_hidden(name: str) -> bool:
+    parts = PurePosixPath(name).parts
+    return any(part.startswith(".") or part == "__MACOSX" for part in parts)
@@ -0,0 +1,238 @@
+import queue
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from typing import Any
+
+from fastapi import HTTPException, UploadFile
+
+from app.core.config import settings
+from app.core.logging import app_logger as logger
+from app.schemas.job import JobStage
+from app.services.embeddings import create_vectors_from_chunks
+from app.services.vector_store import store_vectors
+from app.utils.archives import ArchiveError, is_archive, iter_archive_members
+from app.utils.doc_to_vectores import DocumentIngestion, discard_partial_ingestion
+from app.utils.text_extraction import SUPPORTED_EXTENSIONS
+
+# Ventanas en espera entre etapas del pipeline
+PIPELINE_QUEUE_SIZE = 2
+
+# Marca de fin de flujo entre etapas
+_DONE = object()
+
+
+def is_supported_file(filename: str | None) -> bool:
+    """Si el archivo tiene un formato del que se puede extraer texto"""
+    return bool(filename) and filename.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def iter_bulk_files(
+    files: Iterable[UploadFile],
+) -> Iterator[UploadFile | ArchiveError]:
+    """
+    Recorre los archivos subidos expandiendo los zip/tar
+
+    Los archivos dañados o que superan los límites de los zip/tar se
+    entregan como ArchiveError (ver iter_archive_members).
+    """
+    for file in files:
+        if file.filename and is_archive(file.filename):
+            yield from iter_archive_members(file, supported=is_supported_file)
+        else:
+            yield file
+
+
+def process_documents_bulk(
+    files: Iterable[UploadFile],
+    progress: Any | None = None,
+    namespace: str = "",
+    document_ids: dict[str, str] | None = None,
+) -> dict[str, Any]:
+    """
+    Procesa muchos documentos con un pipeline compartido
+
+    Tres etapas corren en paralelo, comunicadas por colas acotadas:
+    1. Extracción y chunking (hilo actual), documento tras documento
+    2. Embeddings
+    3. Upsert en el almacén de vectores
+
+    Los chunks nuevos de todos los documentos se agrupan en ventanas de
+    INGESTION_WINDOW_CHUNKS, así que los lotes de embeddings y de upsert
+    se llenan aunque los documentos sean pequeños. Cada documento se
+    procesa de forma incremental (ver DocumentIngestion).
+
+    Un archivo que falla a mitad de camino no deja vectores: al terminar se
+    eliminan los chunks nuevos que ya se habían guardado.
+
+    Args:
+        files: Archivos subidos (los zip/tar se expanden)
+        progress: Trabajo de ingesta a actualizar (ver app.services.jobs)
+        namespace: Namespace de Pinecone donde se guardan los documentos
+        document_ids: Nombre de archivo (ruta dentro del zip/tar) -> id del
+            documento del que es una nueva versión; el resto toma el id
+            derivado de su contenido
+
+    Returns:
+        Dict con el resultado por archivo y el throughput total
+    """
+    start = time.perf_counter()
+    window_size = settings.INGESTION_WINDOW_CHUNKS
+    document_ids = document_ids or {}
+
+    entries: list[dict[str, Any]] = []
+    documents: dict[str, tuple[dict[str, Any], DocumentIngestion]] = {}
+    failed_documents: dict[str, str] = {}  # document_id -> error
+    failed_lock = threading.Lock()
+
+    embed_queue: queue.Queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    upsert_queue: queue.Queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    def mark_failed(window: list[dict[str, Any]], error: Exception) -> None:
+        with failed_lock:
+            for chunk in window:
+                failed_documents.setdefault(chunk["document_id"], str(error))
+
+    def embed_stage() -> None:
+        while (window := embed_queue.get()) is not _DONE:
+            try:
+                vectors = create_vectors_from_chunks(
+                    window,
+                    on_progress=progress.add_chunks_embedded if progress else None,
+                    namespace=namespace,
+                )
+            except Exception as e:
+                logger.error(f"❌ Error vectorizando {len(window)} chunks: {e}")
+                mark_failed(window, e)
+                continue
+            upsert_queue.put((window, vectors))
+        upsert_queue.put(_DONE)
+
+    def upsert_stage() -> None:
+        while (item := upsert_queue.get()) is not _DONE:
+            window, vectors = item
+            try:
+                store_vectors(vectors, namespace=namespace)
+            except Exception as e:
+                logger.error(f"❌ Error almacenando {len(vectors)} vectores: {e}")
+                mark_failed(window, e)
+
+    stages = [
+        threading.Thread(target=embed_stage, name="bulk-embed", daemon=True),
+        threading.Thread(target=upsert_stage, name="bulk-upsert", daemon=True),
+    ]
+    for stage in stages:
+        stage.start()
+
+    if progress:
+        progress.set_stage(JobStage.extracting)
+
+    # 1. Extraer y dividir cada documento, enviando ventanas compartidas
+    pending: list[dict[str, Any]] = []
+    try:
+        for file in iter_bulk_files(files):
+            if isinstance(file, ArchiveError):
+                logger.warning(f"⚠️ {file.filename}: {file}")
+                entries.append(
+                    {"filename": file.filename, "status": "failed", "error": str(file)}
+                )
+                continue
+
+            entry = {"filename": file.filename, "status": "skipped"}
+            entries.append(entry)
+
+            if len(entries) > settings.BULK_MAX_FILES:
+                entry["error"] = "File limit per bulk upload reached"
+                continue
+            if not is_supported_file(file.filename):
+                entry["error"] = "Unsupported file type"
+                continue
+
+            try:
+                document = DocumentIngestion(
+                    file, namespace, document_ids.get(file.filename)
+                )
+                if document.document_id in documents:
+                    # Mismo documento que otro archivo del lote: ya se indexa
+                    original = documents[document.document_id][1]
+                    if original.content_hash == document.content_hash:
+                        entry["error"] = f"Same content as {original.filename}"
+                    else:
+                        entry["error"] = f"Same document_id as {original.filename}"
+                    continue
+                documents[document.document_id] = (entry, document)
+
+                while window := list(islice(document.chunks, window_size)):
+                    new_chunks = document.select_new_chunks(window)
+                    if progress:
+                        progress.add_chunks_total(len(window))
+                        progress.add_chunks_embedded(len(window) - len(new_chunks))
+
+                    pending.extend(new_chunks)
+                    while len(pending) >= window_size:
+                        embed_queue.put(pending[:window_size])
+                        pending = pending[window_size:]
+
+                document.check_text()
+
+            except Exception as e:
+                # Un archivo ilegible no corta el resto del lote
+                entry["status"] = "failed"
+                entry["error"] = str(e.detail if isinstance(e, HTTPException) else e)
+                if not isinstance(e, HTTPException | ValueError):
+                    logger.error(f"❌ Error procesando {file.filename}: {e}")
+
+        if pending:
+            embed_queue.put(pending)
+    finally:
+        embed_queue.put(_DONE)
+        for stage in stages:
+            stage.join()
+
+    # 2. Cerrar cada documento: eliminar chunks obsoletos y armar resultado
+    for document_id, (entry, document) in documents.items():
+        if document_id in failed_documents and entry["status"] != "failed":
+            entry["status"] = "failed"
+            entry["error"] = failed_documents[document_id]
+        if entry["status"] == "failed":
+            # Las ventanas ya encoladas se guardaron igual: se descartan
+            discard_partial_ingestion(document)
+            continue
+
+        try:
+            chunks_deleted = document.finish()
+        except Exception as e:
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+            continue
+
+        chunks_new = document.chunks_count - document.chunks_reused
+        entry["status"] = "completed"
+        entry["result"] = document.result(chunks_new, chunks_deleted)
+
+    # 3. Totales y throughput
+    elapsed = time.perf_counter() - start
+    results = [entry["result"] for entry in entries if entry.get("result")]
+    chunks_total = sum(result["chunks_count"] for result in results)
+
+    summary = {
+        "files_total": len(entries),
+        "files_completed": len(results),
+        "files_failed": sum(entry["status"] == "failed" for entry in entries),
+        "files_skipped": sum(entry["status"] == "skipped" for entry in entries),
+        "chunks_total": chunks_total,
+        "chunks_new": sum(result["chunks_new"] for result in results),
+        "chunks_reused": sum(result["chunks_reused"] for result in results),
+        "chunks_deleted": sum(result["chunks_deleted"] for result in results),
+        "total_seconds": round(elapsed, 3),
+        "files_per_second": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "chunks_per_second": round(chunks_total / elapsed, 2) if elapsed else 0.0,
+        "files": entries,
+    }
+    logger.info(
+        f"📦 Ingesta masiva: {summary['files_completed']}/{len(entries)} archivos, "
+        f"{chunks_total} chunks en {summary['total_seconds']}s "
+        f"({summary['chunks_per_second']} chunks/s)"
+    )
+    return summary
@@ -1,37 +1,204 @@
+import hashlib
+from collections.abc import Iterator
+from itertools import islice
 from typing import Any
 from fastapi import HTTPException, UploadFile, status
 
+from app.core.config import settings
 from app.core.logging import app_logger as logger
-from app.services.embeddings import create_text_chunks, create_vectors_from_chunks
-from app.services.pinecone import get_pinecone_index
-from app.utils.text_extraction import extract_text_from_file
-
-
-def store_vectors_in_pinecone(vectors: list[dict[str, Any]]) -> list[str]:
+from app.schemas.job import JobStage
+from app.services.chunk_store import get_chunk_store
+from app.services.embeddings import (
+    chunk_metadata,
+    create_vectors_from_chunks,
+    iter_text_chunks,
+    make_document_id,
+)
+from app.services.sparse import get_sparse_encoder
+from app.services.vector_store import (
+    VectorStore,
+    delete_vectors,
+    fetch_vector_metadata,
+    get_vector_store,
+    list_vector_ids,
+    store_vectors,
+    update_vector_metadata,
+)
+from app.utils.text_extraction import iter_text_from_file
+
+# Bloque de lectura para calcular el hash del archivo
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_content_hash(file: UploadFile) -> str:
+    """SHA-256 del contenido del archivo (deja el puntero al inicio)"""
+    digest = hashlib.sha256()
+    file.file.seek(0)
+    while block := file.file.read(HASH_BLOCK_SIZE):
+        digest.update(block)
+    file.file.seek(0)
+    return digest.hexdigest()
+
+
+class DocumentIngestion:
     """
-    Almacena vectores en Pinecone
+    Estado de la ingesta incremental de un documento
 
-    Args:
-        vectors: Lista de vectores con metadata
+    Extrae el texto y lo divide en chunks como flujo (`chunks`), separa
+    los chunks que ya están en el índice de los nuevos y, al terminar,
+    actualiza la metadata de los reutilizados y elimina los de la versión
+    anterior que ya no existen. Hasta entonces la versión indexada no se
+    modifica: si la ingesta falla, basta con eliminar los chunks nuevos.
 
-    Returns:
-        Lista de IDs de vectores almacenados
+    El primer chunk de cada versión completa guarda el `content_hash` del
+    archivo: si se vuelve a subir el mismo contenido, no se escribe nada.
     """
-    index = get_pinecone_index()
 
-    # Upsert en batches de 100 vectores
-    batch_size = 100
-    vector_ids = []
+    def __init__(
+        self, file: UploadFile, namespace: str = "", document_id: str | None = None
+    ):
+        if not file.filename:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Filename required"
+            )
+
+        self.filename = file.filename
+        self.namespace = namespace
+        self.content_hash = file_content_hash(file)
+        self.document_id = document_id or make_document_id(self.content_hash)
+        self.text_length = 0
+        self.has_text = False
+        self.chunks_count = 0
+        self.chunks_reused = 0
+        self._existing_ids: set[str] | None = None
+        self._seen_ids: set[str] = set()
+        self._new_ids: set[str] = set()
+        self._unchanged = False
+        # Metadata de esta versión para los chunks reutilizados (ver finish)
+        self._reused_metadata: dict[str, dict[str, Any]] = {}
+
+        self.chunks = iter_text_chunks(
+            self._counted_segments(file), file.filename, document_id=self.document_id
+        )
+
+    def _counted_segments(self, file: UploadFile) -> Iterator[str]:
+        for segment in iter_text_from_file(file):
+            self.text_length += len(segment)
+            self.has_text = self.has_text or bool(segment.strip())
+            yield segment
+
+    def select_new_chunks(self, window: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Registra una ventana de chunks y devuelve los que no están en el índice
+
+        Los chunks reutilizados conservan su vector, pero su posición, nombre
+        de archivo y fecha de subida pasan a ser los de esta versión.
+        """
+        # Chunks de una versión anterior del documento (se listan una vez)
+        if self._existing_ids is None:
+            self._existing_ids = set(
+                list_vector_ids(f"{self.document_id}#", namespace=self.namespace)
+            )
+            # El primer chunk lleva el hash del archivo
+            window[0]["metadata"]["content_hash"] = self.content_hash
+            self._unchanged = self._is_stored_version(window[0]["chunk_id"])
+
+        self.chunks_count += len(window)
+        self._seen_ids.update(chunk["chunk_id"] for chunk in window)
+        new_chunks = [c for c in window if c["chunk_id"] not in self._existing_ids]
+        self.chunks_reused += len(window) - len(new_chunks)
+        self._new_ids.update(chunk["chunk_id"] for chunk in new_chunks)
+
+        if not self._unchanged:
+            self._reused_metadata.update(
+                (chunk["chunk_id"], chunk_metadata(chunk))
+                for chunk in window
+                if chunk["chunk_id"] in self._existing_ids
+            )
+        return new_chunks
+
+    def _is_stored_version(self, first_chunk_id: str) -> bool:
+        """Si el archivo es la última versión indexada completa del documento"""
+        if first_chunk_id not in self._existing_ids:
+            return False
+        stored = fetch_vector_metadata([first_chunk_id], namespace=self.namespace).get(
+            first_chunk_id, {}
+        )
+        # Un primer chunk anterior conserva su hash, pero no la posición 0
+        return (
+            stored.get("content_hash") == self.content_hash
+            and stored.get("chunk_index") == 0
+        )
 
-    for i in range(0, len(vectors), batch_size):
-        batch = vectors[i : i + batch_size]
-        index.upsert(vectors=batch)
-        vector_ids.extend([vector["id"] for vector in batch])
+    def check_text(self) -> None:
+        """Valida que el documento tenía texto y produjo chunks"""
+        if not self.has_text:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Document contains no valid text",
+            )
+        if not self.chunks_count:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Could not create text chunks",
+            )
+
+    def finish(self) -> int:
+        """
+        Cierra una ingesta completa y devuelve los chunks eliminados
+
+        Actualiza la metadata de los chunks reutilizados y elimina los que
+        ya no están en la nueva versión.
+        """
+        if self._reused_metadata:
+            update_vector_metadata(self._reused_metadata, namespace=self.namespace)
+            self._reused_metadata = {}
+
+        stale_ids = sorted((self._existing_ids or set()) - self._seen_ids)
+        if not stale_ids:
+            return 0
+        return delete_vectors(stale_ids, namespace=self.namespace)
+
+    def delete_new_chunks(self) -> int:
+        """
+        Elimina los chunks que agregó esta ingesta (si falló a mitad de camino)
+
+        Los de la versión anterior se conservan: el documento queda como
+        estaba antes de subir el archivo.
+        """
+        new_ids = sorted(self._new_ids)
+        if not new_ids:
+            return 0
+        deleted = delete_vectors(new_ids, namespace=self.namespace)
+        logger.warning(
+            f"⚠️ {self.filename}: eliminados {deleted} chunks de una ingesta fallida"
+        )
+        return deleted
 
-    return vector_ids
+    def result(self, chunks_new: int, chunks_deleted: int) -> dict[str, Any]:
+        """Resultado del procesamiento del documento"""
+        return {
+            "document_id": self.document_id,
+            "filename": self.filename,
+            "namespace": self.namespace,
+            "content_hash": self.content_hash,
+            "text_length": self.text_length,
+            "chunks_count": self.chunks_count,
+            "vectors_count": chunks_new,
+            "chunks_new": chunks_new,
+            "chunks_reused": self.chunks_reused,
+            "chunks_deleted": chunks_deleted,
+            "status": "success",
+            "message": f"Document '{self.filename}' processed successfully",
+        }
 
 
-def process_document(file: UploadFile) -> dict[str, Any]:
+def process_document(
+    file: UploadFile,
+    progress: Any | None = None,
+    namespace: str = "",
+    document_id: str | None = None,
+) -> dict[str, Any]:
     """
     Procesa un documento completo
 
@@ -39,73 +206,108 @@ def process_document(file: UploadFile) -> dict[str, Any]:
     1. Extrae texto
     2. Divide en chunks
     3. Genera embeddings
-    4. Almacena en Pinecone
+    4. Almacena en el almacén de vectores
+
+    El texto se procesa como flujo: los chunks se vectorizan y almacenan
+    por ventanas, así que la memoria no depende del tamaño del documento.
+
+    El id del documento se deriva del hash del archivo: volver a subir el
+    mismo contenido (con cualquier nombre) no escribe nada, y un archivo
+    distinto con el mismo nombre es otro documento. Para subir una nueva
+    versión se indica el `document_id` del documento a actualizar: la
+    ingesta es incremental, el id de cada chunk se deriva de su contenido,
+    así que solo se vectorizan los chunks nuevos o modificados y se
+    eliminan los que ya no existen.
 
     Args:
         file: Archivo subido
+        progress: Trabajo de ingesta a actualizar (ver app.services.jobs)
+        namespace: Namespace de Pinecone donde se guarda el documento
+        document_id: Documento del que este archivo es una nueva versión
+            (por defecto, el derivado del contenido)
+
+    Si la ingesta falla a mitad de camino, se eliminan los chunks nuevos ya
+    guardados: el documento queda como estaba.
 
     Returns:
         Dict con resultado del procesamiento
     """
-    # Validaciones simples
-    if not file.filename:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Filename required"
-        )
+    # 1-2. Extraer texto y dividirlo en chunks como flujo (memoria acotada)
+    document = DocumentIngestion(file, namespace, document_id)
 
-    # 1. Extraer texto
-    text = extract_text_from_file(file)
-    if not text.strip():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Document contains no valid text",
-        )
+    # 3-4. Vectorizar y almacenar por ventanas solo los chunks nuevos
+    vector_ids = []
 
-    # 2. Crear chunks
-    chunks = create_text_chunks(text, file.filename)
-    if not chunks:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Could not create text chunks",
+    try:
+        while True:
+            if progress:
+                progress.set_stage(JobStage.extracting)
+            window = list(islice(document.chunks, settings.INGESTION_WINDOW_CHUNKS))
+            if not window:
+                break
+
+            new_chunks = document.select_new_chunks(window)
+            if progress:
+                progress.add_chunks_total(len(window))
+                progress.add_chunks_embedded(len(window) - len(new_chunks))
+            if not new_chunks:
+                continue
+
+            if progress:
+                progress.set_stage(JobStage.embedding)
+            vectors = create_vectors_from_chunks(
+                new_chunks,
+                on_progress=progress.add_chunks_embedded if progress else None,
+                namespace=namespace,
+            )
+
+            if progress:
+                progress.set_stage(JobStage.upserting)
+            vector_ids.extend(store_vectors(vectors, namespace=namespace))
+
+        document.check_text()
+
+    except Exception:
+        # Sin esto quedarían en el índice los chunks de las ventanas ya guardadas
+        discard_partial_ingestion(document)
+        raise
+
+    # 5. Eliminar los chunks que ya no están en la nueva versión
+    chunks_deleted = document.finish()
+
+    # 6. Resultado
+    return document.result(len(vector_ids), chunks_deleted)
+
+
+def discard_partial_ingestion(document: DocumentIngestion) -> None:
+    """Elimina lo que guardó una ingesta fallida (sin ocultar el error original)"""
+    try:
+        document.delete_new_chunks()
+    except Exception as e:
+        logger.error(
+            f"❌ No se pudieron eliminar los chunks de {document.filename}: {e}"
         )
 
-    # 3. Generar embeddings y vectorizar
-    vectors = create_vectors_from_chunks(chunks)
-
-    # 4. Almacenar en Pinecone
-    vector_ids = store_vectors_in_pinecone(vectors)
-
-    # 5. Resultado
-    doc_id = chunks[0]["document_id"]  # Todos los chunks tienen el mismo doc_id
-
-    return {
-        "document_id": doc_id,
-        "filename": file.filename,
-        "text_length": len(text),
-        "chunks_count": len(chunks),
-        "vectors_count": len(vector_ids),
-        "status": "success",
-        "message": f"Document '{file.filename}' processed successfully",
-    }
 
-
-def delete_all_vectors() -> dict[str, Any]:
+def delete_all_vectors(store: VectorStore | None = None) -> dict[str, Any]:
     """
-    🗑️ Elimina TODOS los vectores del índice de Pinecone
+    🗑️ Elimina TODOS los vectores del almacén (todos los namespaces)
 
     ⚠️ OPERACIÓN DESTRUCTIVA: No se puede deshacer
 
+    Args:
+        store: Almacén de vectores (por defecto, el del proceso)
+
     Returns:
         Dict con información del proceso de eliminación
     """
     try:
         logger.info("🗑️ Iniciando eliminación de todos los vectores...")
 
-        # Obtener índice
-        index = get_pinecone_index()
+        store = store or get_vector_store()
 
         # Obtener estadísticas antes
-        stats_before = index.describe_index_stats()
+        stats_before = store.stats()
         total_vectors_before = stats_before.get("total_vector_count", 0)
 
         logger.info(f"📊 Vectores encontrados: {total_vectors_before}")
@@ -120,9 +322,16 @@ def delete_all_vectors() -> dict[str, Any]:
                 "operation": "delete_all_vectors",
             }
 
-        # Eliminar todos los vectores usando delete con namespace vacío
-        # Esto elimina TODOS los vectores del índice
-        index.delete(delete_all=True)
+        # Eliminar todos los vectores de todos los namespaces
+        store.delete_all()
+
+        # El vocabulario disperso y los textos describían los chunks eliminados
+        encoder = get_sparse_encoder()
+        if encoder is not None:
+            encoder.clear()
+        chunk_store = get_chunk_store()
+        if chunk_store is not None:
+            chunk_store.clear()
 
         logger.info("🗑️ Comando de eliminación enviado")
 
@@ -148,7 +357,7 @@ def delete_all_vectors() -> dict[str, Any]:
 
 def get_index_stats() -> dict[str, Any]:
     """
-    📊 Obtiene estadísticas del índice de Pinecone
+    📊 Obtiene estadísticas del almacén de vectores
 
     Returns:
         Dict con estadísticas del índice
@@ -156,8 +365,8 @@ def get_index_stats() -> dict[str, Any]:
     try:
         logger.info("📊 Obteniendo estadísticas del índice...")
 
-        index = get_pinecone_index()
-        stats = index.describe_index_stats()
+        stats = get_vector_store().stats()
+        chunk_store = get_chunk_store()
 
         # Formatear respuesta
         return {
@@ -166,6 +375,7 @@ def get_index_stats() -> dict[str, Any]:
             "dimension": stats.get("dimension", 0),
             "index_fullness": stats.get("index_fullness", 0.0),
             "namespaces": stats.get("namespaces", {}),
+            "chunk_texts": chunk_store.stats() if chunk_store else None,
             "operation": "get_index_stats",
         }
 
@@ -1,9 +1,29 @@
-import io
+import codecs
+import multiprocessing
+import os
+import threading
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
 from fastapi import UploadFile
 import PyPDF2
 import docx
 import pandas as pd
 
+from app.core.config import settings
+
+# Formatos de documento soportados
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt", ".md", ".csv")
+
+# Tamaño de bloque al leer archivos de texto (bytes)
+TEXT_READ_BLOCK_SIZE = 1024 * 1024
+
+# Encodings que se prueban, en orden, para archivos de texto plano
+TEXT_ENCODINGS = ["utf-8", "latin-1", "cp1252"]
+
+# Filas por bloque al leer CSV
+CSV_CHUNK_ROWS = 50_000
+
 
 def extract_text_from_file(file: UploadFile) -> str:
     """
@@ -15,6 +35,27 @@ def extract_text_from_file(file: UploadFile) -> str:
     Returns:
         Texto extraído
 
+    Raises:
+        ValueError: Si el formato no es soportado
+    """
+    return "".join(iter_text_from_file(file)).strip()
+
+
+def iter_text_from_file(file: UploadFile) -> Iterator[str]:
+    """
+    Extrae texto por segmentos (páginas en PDF, párrafos en DOCX, bloques
+    en texto plano)
+
+    Los extractores leen directamente del archivo subido (en memoria o en
+    disco según su tamaño), sin copiar su contenido completo.
+    Concatenar los segmentos da el texto completo del documento.
+
+    Args:
+        file: Archivo subido
+
+    Yields:
+        Segmentos de texto
+
     Raises:
         ValueError: Si el formato no es soportado
     """
@@ -22,13 +63,13 @@ def extract_text_from_file(file: UploadFile) -> str:
 
     try:
         if filename.endswith(".pdf"):
-            return extract_text_from_pdf(file)
+            yield from iter_text_from_pdf(file)
         elif filename.endswith(".docx"):
-            return extract_text_from_docx(file)
+            yield from iter_text_from_docx(file)
         elif filename.endswith(".txt") or filename.endswith(".md"):
-            return extract_text_from_txt(file)
+            yield from iter_text_from_txt(file)
         elif filename.endswith(".csv"):
-            return extract_text_from_csv(file)
+            yield extract_text_from_csv(file)
         else:
             raise ValueError(f"Unsupported file format: {filename}")
 
@@ -38,85 +79,232 @@ def extract_text_from_file(file: UploadFile) -> str:
 
 def extract_text_from_pdf(file: UploadFile) -> str:
     """Extrae texto de PDF"""
+    return "".join(iter_text_from_pdf(file)).strip()
+
+
+def iter_text_from_pdf(file: UploadFile) -> Iterator[str]:
+    """
+    Extrae texto de PDF página por página
+
+    Si el PDF es grande y está en disco, reparte rangos de páginas entre
+    un pool de procesos y entrega las páginas en orden.
+
+    Yields:
+        Texto de cada página (terminado en salto de línea)
+    """
     if PyPDF2 is None:
         raise ValueError("PyPDF2 not installed. Run: pip install PyPDF2")
 
-    content = file.file.read()
-    pdf_file = io.BytesIO(content)
+    pdf_reader = PyPDF2.PdfReader(file.file)
+    page_count = len(pdf_reader.pages)
+    path = _get_file_path(file)
 
-    pdf_reader = PyPDF2.PdfReader(pdf_file)
-    text = ""
+    if (
+        path
+        and page_count >= settings.PDF_PARALLEL_MIN_PAGES
+        and settings.PDF_EXTRACTION_WORKERS > 1
+    ):
+        pages = _iter_pdf_pages_parallel(path, page_count)
+    else:
+        pages = (page.extract_text() for page in pdf_reader.pages)
 
-    for page in pdf_reader.pages:
-        text += page.extract_text() + "\n"
+    for page_text in pages:
+        yield page_text + "\n"
 
     file.file.seek(0)  # Reset file pointer
-    return text.strip()
+
+
+def _get_file_path(file: UploadFile) -> str | None:
+    """Ruta en disco del archivo subido (None si está solo en memoria)"""
+    name = getattr(file.file, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    return None
+
+
+def _extract_pdf_page_range(path: str, start: int, end: int) -> list[str]:
+    """Extrae el texto de un rango de páginas (se ejecuta en otro proceso)"""
+    pdf_reader = PyPDF2.PdfReader(path)
+    return [pdf_reader.pages[i].extract_text() for i in range(start, end)]
+
+
+_pdf_executor: ProcessPoolExecutor | None = None
+_pdf_executor_lock = threading.Lock()
+
+
+def _get_pdf_executor() -> ProcessPoolExecutor:
+    """Pool de procesos para extracción de PDF (se crea una vez)"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            _pdf_executor = ProcessPoolExecutor(
+                max_workers=settings.PDF_EXTRACTION_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pdf_executor
+
+
+def _iter_pdf_pages_parallel(path: str, page_count: int) -> Iterator[str]:
+    """
+    Extrae páginas en paralelo manteniendo el orden
+
+    Mantiene como máximo dos rangos por worker en vuelo para que la
+    memoria no dependa del tamaño del documento.
+    """
+    executor = _get_pdf_executor()
+    step = settings.PDF_PAGES_PER_TASK
+    ranges = iter(range(0, page_count, step))
+    in_flight = deque()
+
+    def submit_next() -> None:
+        start = next(ranges, None)
+        if start is not None:
+            end = min(start + step, page_count)
+            in_flight.append(executor.submit(_extract_pdf_page_range, path, start, end))
+
+    for _ in range(settings.PDF_EXTRACTION_WORKERS * 2):
+        submit_next()
+
+    try:
+        while in_flight:
+            pages = in_flight.popleft().result()
+            submit_next()
+            yield from pages
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+def shutdown_pdf_workers() -> None:
+    """Detiene el pool de procesos de extracción de PDF"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        executor, _pdf_executor = _pdf_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
 def extract_text_from_docx(file: UploadFile) -> str:
     """Extrae texto de DOCX"""
+    return "".join(iter_text_from_docx(file)).strip()
+
+
+def iter_text_from_docx(file: UploadFile) -> Iterator[str]:
+    """Extrae texto de DOCX párrafo por párrafo"""
     if docx is None:
         raise ValueError("python-docx not installed. Run: pip install python-docx")
 
-    content = file.file.read()
-    doc_file = io.BytesIO(content)
-
-    doc = docx.Document(doc_file)
-    text = ""
+    # python-docx abre el zip directamente desde el archivo
+    file.file.seek(0)
+    doc = docx.Document(file.file)
 
     for paragraph in doc.paragraphs:
-        text += paragraph.text + "\n"
+        yield paragraph.text + "\n"
 
     file.file.seek(0)  # Reset file pointer
-    return text.strip()
 
 
 def extract_text_from_txt(file: UploadFile) -> str:
     """Extrae texto de archivo de texto plano"""
-    content = file.file.read()
+    return "".join(iter_text_from_txt(file)).strip()
 
-    # Intentar diferentes encodings
-    encodings = ["utf-8", "latin-1", "cp1252"]
 
-    for encoding in encodings:
+def iter_text_from_txt(file: UploadFile) -> Iterator[str]:
+    """
+    Extrae texto plano por bloques
+
+    Se decodifica de forma incremental, así que nunca hay en memoria más
+    de un bloque del archivo.
+    """
+    encoding = _detect_text_encoding(file.file)
+    decoder = codecs.getincrementaldecoder(encoding)()
+
+    for block in _iter_blocks(file.file):
+        text = decoder.decode(block)
+        if text:
+            yield text
+
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+    file.file.seek(0)  # Reset file pointer
+
+
+def _detect_text_encoding(fh) -> str:
+    """Primer encoding de TEXT_ENCODINGS que decodifica el archivo completo"""
+    for encoding in TEXT_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
         try:
-            text = content.decode(encoding)
-            file.file.seek(0)  # Reset file pointer
-            return text.strip()
+            for block in _iter_blocks(fh):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+            return encoding
         except UnicodeDecodeError:
             continue
 
     raise ValueError("Could not decode text file with any supported encoding")
 
 
+def _iter_blocks(fh) -> Iterator[bytes]:
+    """Lee un archivo por bloques desde el principio"""
+    fh.seek(0)
+    while block := fh.read(TEXT_READ_BLOCK_SIZE):
+        yield block
+
+
 def extract_text_from_csv(file: UploadFile) -> str:
-    """Extrae texto de CSV convirtiéndolo a texto"""
+    """
+    Extrae texto de CSV convirtiéndolo a texto
+
+    Se lee por bloques de filas: solo se conservan las primeras filas de
+    muestra y los acumulados para los promedios de columnas numéricas.
+    """
     if pd is None:
         raise ValueError("pandas not installed. Run: pip install pandas")
 
-    content = file.file.read()
-    csv_file = io.StringIO(content.decode("utf-8"))
+    file.file.seek(0)
+    row_count = 0
+    columns = None
+    sample_rows = []
+    numeric_sums: dict = {}
+    numeric_counts: dict = {}
+    non_numeric: set = set()
+
+    for chunk in pd.read_csv(file.file, chunksize=CSV_CHUNK_ROWS):
+        if columns is None:
+            columns = chunk.columns
+        if len(sample_rows) < 5:
+            sample_rows.extend(chunk.head(5 - len(sample_rows)).iterrows())
+
+        # Una columna es numérica solo si lo es en todos los bloques
+        numeric_cols = set(chunk.select_dtypes(include=["number"]).columns)
+        non_numeric.update(col for col in chunk.columns if col not in numeric_cols)
+        for col in numeric_cols - non_numeric:
+            numeric_sums[col] = numeric_sums.get(col, 0) + chunk[col].sum()
+            numeric_counts[col] = numeric_counts.get(col, 0) + chunk[col].count()
+
+        row_count += len(chunk)
 
-    df = pd.read_csv(csv_file)  # Convertir DataFrame a texto descriptivo
     text_parts = []
 
     # Headers
-    text_parts.append(f"Archivo CSV con {len(df)} filas y {len(df.columns)} columnas.")
-    text_parts.append(f"Columnas: {', '.join(df.columns.tolist())}")
+    text_parts.append(f"Archivo CSV con {row_count} filas y {len(columns)} columnas.")
+    text_parts.append(f"Columnas: {', '.join(columns.tolist())}")
 
     # Sample data (primeras 5 filas)
     text_parts.append("\nDatos de muestra:")
-    for idx, row in df.head().iterrows():
+    for idx, row in sample_rows:
         row_text = ", ".join([f"{col}: {val}" for col, val in row.items()])
         text_parts.append(f"Fila {idx + 1}: {row_text}")
 
     # Summary stats for numeric columns
-    numeric_cols = df.select_dtypes(include=["number"]).columns
+    numeric_cols = [c for c in columns if c in numeric_sums and c not in non_numeric]
     if len(numeric_cols) > 0:
         text_parts.append("\nEstadísticas de columnas numéricas:")
         for col in numeric_cols:
-            mean_val = df[col].mean()
+            count = numeric_counts[col]
+            mean_val = numeric_sums[col] / count if count else float("nan")
             text_parts.append(f"{col}: promedio {mean_val:.2f}")
 
     file.file.seek(0)  # Reset file pointer
@@ -0,0 +1,29 @@
+from functools import lru_cache
+from typing import Any
+
+import tiktoken
+
+# Aproximación usada cuando el tokenizer no está disponible (sin red, etc.)
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=8)
+def get_tokenizer(encoding_name: str = "cl100k_base") -> Any | None:
+    """
+    Obtiene el tokenizer de tiktoken (cacheado por proceso)
+
+    Returns:
+        Encoding de tiktoken o None si no se pudo cargar
+    """
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+    """Cuenta tokens de un texto (estimación si no hay tokenizer)"""
+    tokenizer = get_tokenizer(encoding_name)
+    if tokenizer is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(tokenizer.encode(text, disallowed_special=()))
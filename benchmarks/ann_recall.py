@@ -0,0 +1,175 @@
+"""
+📈 Benchmark de recall@k y QPS del índice IVF local
+
+Genera vectores sintéticos agrupados (como los embeddings de chunks de
+documentos parecidos), los carga en un índice IVF temporal y compara cada
+valor de `nprobe` contra la búsqueda exacta: recall@k (fracción de los k
+vecinos exactos encontrados) y consultas por segundo. Repite la medición
+con cada cuantización (bytes por vector de la primera pasada) y mide
+cuánto tarda en reabrirse el índice desde disco.
+
+Uso:
+    python benchmarks/ann_recall.py --vectors 200000 --dimensions 256 --nlist 1024
+    python benchmarks/ann_recall.py --quantization none int8 pq --nprobe 32
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+# Variables mínimas para poder importar la configuración de la app
+for key in (
+    "OPENAI_API_KEY",
+    "PINECONE_API_KEY",
+    "PINECONE_INDEX_NAME",
+    "LANGSMITH_API_KEY",
+):
+    os.environ.setdefault(key, "benchmark")
+
+# El índice se entrena una sola vez, después de cargar todos los vectores
+os.environ["ANN_TRAIN_MIN_VECTORS"] = str(2**62)
+
+import numpy as np  # noqa: E402
+
+from app.services.ann import IVFIndex  # noqa: E402
+
+UPSERT_BATCH = 10_000
+
+
+def make_dataset(
+    vectors: int, dimensions: int, queries: int, seed: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """Vectores normalizados alrededor de centros al azar y consultas cercanas"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(vectors // 1000, 1), dimensions))
+    data = centers[rng.integers(len(centers), size=vectors)]
+    data = (data + rng.normal(scale=0.7, size=data.shape)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+
+    picked = data[rng.choice(vectors, queries, replace=False)]
+    query = picked + rng.normal(scale=0.3, size=picked.shape).astype(np.float32)
+    query /= np.linalg.norm(query, axis=1, keepdims=True)
+    return data, query
+
+
+def exact_neighbours(data: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Filas de los k vecinos exactos de cada consulta"""
+    scores = queries @ data.T
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def build_index(
+    directory: str, data: np.ndarray, nlist: int, quantization: str
+) -> tuple[IVFIndex, dict[str, float]]:
+    """Carga los vectores, entrena y reabre el índice midiendo cada paso"""
+    index = IVFIndex(directory, quantization=quantization)
+
+    start = time.perf_counter()
+    for i in range(0, len(data), UPSERT_BATCH):
+        batch = data[i : i + UPSERT_BATCH]
+        index.upsert(
+            [str(row) for row in range(i, i + len(batch))],
+            batch,
+            [{} for _ in range(len(batch))],
+        )
+    loaded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.train(nlist)
+    trained = time.perf_counter() - start
+    index.close()
+
+    start = time.perf_counter()
+    index = IVFIndex(directory)
+    reopened = time.perf_counter() - start
+    return index, {"loaded": loaded, "trained": trained, "reopened": reopened}
+
+
+def run_benchmark(
+    vectors: int,
+    dimensions: int,
+    queries: int,
+    k: int,
+    nlist: int,
+    nprobes: list[int],
+    quantizations: list[str],
+) -> None:
+    """Mide recall@k y QPS para cada cuantización y nprobe"""
+    data, query_vectors = make_dataset(vectors, dimensions, queries)
+    truth = exact_neighbours(data, query_vectors, k)
+
+    print(
+        f"📋 {vectors} vectores de {dimensions} dimensiones, {nlist} listas, "
+        f"{queries} consultas, k={k}"
+    )
+
+    # Referencia: búsqueda exacta sobre la matriz en memoria
+    start = time.perf_counter()
+    for query in query_vectors:
+        np.argpartition(-(data @ query), k - 1)[:k]
+    elapsed = time.perf_counter() - start
+    print(
+        f"   exacta (float32 en memoria): {queries / elapsed:.1f} QPS, "
+        f"{dimensions * 4} bytes/vector"
+    )
+
+    for quantization in quantizations:
+        with tempfile.TemporaryDirectory() as directory:
+            index, timings = build_index(directory, data, nlist, quantization)
+            print(
+                f"\n🧮 {quantization}: {index.code_bytes} bytes/vector en la primera "
+                f"pasada ({dimensions * 4 / index.code_bytes:.0f}x menos que float32)"
+            )
+            print(
+                f"   carga {timings['loaded']:.2f}s, entrenamiento "
+                f"{timings['trained']:.2f}s, reapertura "
+                f"{timings['reopened'] * 1000:.1f} ms"
+            )
+            print(f"{'nprobe':>7} {'recall@k':>9} {'QPS':>9} {'ms/consulta':>12}")
+
+            for nprobe in nprobes:
+                found = 0
+                start = time.perf_counter()
+                for query, expected in zip(query_vectors, truth, strict=True):
+                    matches = index.search(
+                        query, k, nprobe=nprobe, include_metadata=False
+                    )
+                    found += len(
+                        {int(m["id"]) for m in matches} & set(expected.tolist())
+                    )
+                elapsed = time.perf_counter() - start
+
+                print(
+                    f"{nprobe:>7} {found / (queries * k):>9.3f} "
+                    f"{queries / elapsed:>9.1f} {elapsed / queries * 1000:>12.2f}"
+                )
+            index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument(
+        "--quantization", nargs="+", default=["none", "float16", "int8", "pq"]
+    )
+    args = parser.parse_args()
+
+    run_benchmark(
+        args.vectors,
+        args.dimensions,
+        args.queries,
+        args.k,
+        args.nlist or int(4 * np.sqrt(args.vectors)),
+        args.nprobe,
+        args.quantization,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+📈 Benchmark de recall@k, tamaño del índice y latencia por dimensión
+
+Compara la búsqueda exacta con embeddings recortados a 256, 512, 1024 y
+1536 dimensiones contra la búsqueda con los vectores completos. Los
+modelos text-embedding-3 ordenan la información de mayor a menor
+importancia, y pedirles menos dimensiones equivale a recortar el vector y
+volver a normalizarlo, así que se mide sin llamar a la API.
+
+Usa los embeddings del cache local (EMBEDDING_CACHE_PATH) si hay
+suficientes del modelo configurado; si no, genera vectores sintéticos cuya
+varianza decae con la dimensión. Las consultas son vectores del conjunto
+con ruido, y los vecinos de referencia salen de los vectores completos.
+
+Uso:
+    python benchmarks/embedding_dimensions.py --vectors 50000 --k 10
+    python benchmarks/embedding_dimensions.py --cache .cache/embeddings.sqlite3
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+
+# Variables mínimas para poder importar la configuración de la app
+for key in (
+    "OPENAI_API_KEY",
+    "PINECONE_API_KEY",
+    "PINECONE_INDEX_NAME",
+    "LANGSMITH_API_KEY",
+):
+    os.environ.setdefault(key, "benchmark")
+
+import numpy as np  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+
+FULL_DIMENSIONS = 1536
+
+
+def load_cached_vectors(path: str, model: str, limit: int) -> np.ndarray | None:
+    """Embeddings completos del cache local (None si no hay cache)"""
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT vector FROM embeddings WHERE key LIKE ? LIMIT ?",
+            (f"{model}:{FULL_DIMENSIONS}:%", limit),
+        ).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return None
+    return np.stack([np.frombuffer(row[0], dtype=np.float32) for row in rows])
+
+
+def make_dataset(vectors: int, seed: int = 0) -> np.ndarray:
+    """Vectores agrupados con varianza decreciente por dimensión"""
+    rng = np.random.default_rng(seed)
+    decay = 1 / np.sqrt(np.arange(1, FULL_DIMENSIONS + 1, dtype=np.float32))
+    centers = rng.normal(size=(max(vectors // 500, 1), FULL_DIMENSIONS)) * decay
+    data = centers[rng.integers(len(centers), size=vectors)]
+    data += rng.normal(scale=0.6, size=data.shape) * decay
+    return data.astype(np.float32)
+
+
+def truncate(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """Primeras `dimensions` componentes, normalizadas a norma 1"""
+    truncated = np.ascontiguousarray(vectors[:, :dimensions])
+    norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+    return truncated / np.where(norms > 0, norms, 1.0)
+
+
+def top_k(data: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Filas de los k vecinos exactos de cada consulta"""
+    scores = queries @ data.T
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def run_benchmark(
+    data: np.ndarray, queries: int, k: int, dimensions: list[int], seed: int = 0
+) -> None:
+    """Mide recall@k, bytes del índice y latencia para cada dimensión"""
+    rng = np.random.default_rng(seed)
+    picked = data[rng.choice(len(data), queries, replace=False)]
+    query_vectors = picked + rng.normal(
+        scale=0.5 * data.std(axis=0), size=picked.shape
+    ).astype(np.float32)
+
+    full = truncate(data, FULL_DIMENSIONS)
+    truth = top_k(full, truncate(query_vectors, FULL_DIMENSIONS), k)
+
+    print(f"📋 {len(data)} vectores, {queries} consultas, k={k}")
+    print(
+        f"{'dims':>6} {'recall@k':>9} {'índice':>10} {'bytes/vector':>13} "
+        f"{'ms/consulta':>12}"
+    )
+    for dimension in dimensions:
+        index = truncate(data, dimension)
+        reduced = truncate(query_vectors, dimension)
+
+        found = 0
+        start = time.perf_counter()
+        for query, expected in zip(reduced, truth, strict=True):
+            rows = np.argpartition(-(index @ query), k - 1)[:k]
+            found += len(set(rows.tolist()) & set(expected.tolist()))
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"{dimension:>6} {found / (queries * k):>9.3f} "
+            f"{index.nbytes / 2**20:>7.1f} MB {dimension * 4:>13} "
+            f"{elapsed / queries * 1000:>12.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument(
+        "--dimensions", type=int, nargs="+", default=[256, 512, 1024, 1536]
+    )
+    parser.add_argument("--cache", default=settings.EMBEDDING_CACHE_PATH)
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL)
+    args = parser.parse_args()
+
+    data = load_cached_vectors(args.cache, args.model, args.vectors)
+    if data is not None and len(data) > args.queries:
+        print(f"📂 {len(data)} embeddings de {args.model} del cache {args.cache}")
+    else:
+        print("🧪 Sin embeddings en cache: se usan vectores sintéticos")
+        data = make_dataset(args.vectors)
+
+    run_benchmark(data, args.queries, args.k, sorted(args.dimensions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+📈 Benchmark de throughput de embeddings
+
+Levanta un servidor local que imita `POST /v1/embeddings` de OpenAI con una
+latencia fija por request y mide cuántos chunks por segundo vectoriza
+`embed_texts` con distintos tamaños de lote y niveles de concurrencia.
+
+Uso:
+    python benchmarks/embedding_throughput.py --chunks 400 --latency-ms 200
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Variables mínimas para poder importar la configuración de la app
+for key in (
+    "OPENAI_API_KEY",
+    "PINECONE_API_KEY",
+    "PINECONE_INDEX_NAME",
+    "LANGSMITH_API_KEY",
+):
+    os.environ.setdefault(key, "benchmark")
+
+from langchain_openai import OpenAIEmbeddings  # noqa: E402
+
+from app.services.embeddings import embed_texts  # noqa: E402
+
+DIMENSIONS = 1536
+
+
+def create_fake_server(latency_ms: float) -> ThreadingHTTPServer:
+    """Crea un servidor de embeddings falso con latencia fija"""
+
+    class FakeEmbeddingsHandler(BaseHTTPRequestHandler):
+        requests_served = 0
+        lock = threading.Lock()
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length))
+            inputs = payload["input"]
+            if isinstance(inputs, str):
+                inputs = [inputs]
+
+            time.sleep(latency_ms / 1000)
+            with FakeEmbeddingsHandler.lock:
+                FakeEmbeddingsHandler.requests_served += 1
+
+            body = json.dumps(
+                {
+                    "object": "list",
+                    "model": payload.get("model", "fake"),
+                    "data": [
+                        {
+                            "object": "embedding",
+                            "index": i,
+                            "embedding": [0.1] * DIMENSIONS,
+                        }
+                        for i in range(len(inputs))
+                    ],
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                }
+            ).encode()
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeEmbeddingsHandler)
+    server.handler = FakeEmbeddingsHandler
+    return server
+
+
+def run_benchmark(
+    chunks: int, latency_ms: float, batch_sizes: list[int], concurrencies: list[int]
+) -> None:
+    """Ejecuta la matriz de configuraciones e imprime los resultados"""
+    server = create_fake_server(latency_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    embeddings = OpenAIEmbeddings(
+        api_key="benchmark",
+        base_url=f"http://127.0.0.1:{server.server_port}/v1",
+        model="text-embedding-3-small",
+        check_embedding_ctx_length=False,
+        max_retries=0,
+    )
+    texts = [f"chunk de prueba número {i} " * 40 for i in range(chunks)]
+
+    print(f"📋 {chunks} chunks, latencia simulada {latency_ms:.0f} ms por request")
+    print(f"{'batch':>6} {'conc':>5} {'requests':>9} {'segundos':>9} {'chunks/s':>9}")
+
+    for batch_size in batch_sizes:
+        for concurrency in concurrencies:
+            server.handler.requests_served = 0
+            start = time.perf_counter()
+            vectors = embed_texts(
+                texts,
+                embeddings=embeddings,
+                max_batch_size=batch_size,
+                max_concurrency=concurrency,
+            )
+            elapsed = time.perf_counter() - start
+            assert len(vectors) == chunks
+
+            print(
+                f"{batch_size:>6} {concurrency:>5} {server.handler.requests_served:>9}"
+                f" {elapsed:>9.2f} {chunks / elapsed:>9.1f}"
+            )
+
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=400)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64, 256])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    run_benchmark(args.chunks, args.latency_ms, args.batch_sizes, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,12 @@ os.environ["OPENAI_API_KEY"] = "test-openai-key"
 os.environ["PINECONE_API_KEY"] = "test-pinecone-key"
 os.environ["PINECONE_INDEX_NAME"] = "test-index"
 os.environ["LANGSMITH_API_KEY"] = "test-langsmith-key"
+os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+os.environ["QUERY_EMBEDDING_CACHE_ENABLED"] = "false"
+os.environ["SEMANTIC_CACHE_ENABLED"] = "false"
+os.environ["CHUNK_TEXT_STORE_ENABLED"] = "false"
+os.environ["INGESTION_JOB_STORE_PATH"] = ":memory:"
+os.environ["INDEX_GENERATION_PATH"] = ":memory:"
 
 # No necesitamos importar la app para tests de funciones
 
@@ -25,6 +31,9 @@ def mock_embeddings():
     mock_client.embed_query.return_value = [
         0.1
     ] * 1536  # Vector fake de 1536 dimensiones
+    mock_client.embed_documents.side_effect = lambda texts: [
+        [0.1] * 1536 for _ in texts
+    ]
     yield mock_client
 
 
@@ -151,6 +160,42 @@ class TestHelpers:
         file_obj = BytesIO(content.encode())
         return UploadFile(filename=filename, file=file_obj)
 
+    @staticmethod
+    def create_pdf_bytes(pages: list[str]) -> bytes:
+        """Crea un PDF mínimo con una línea de texto por página"""
+        count = len(pages)
+        kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(count))
+        objects = [
+            "<< /Type /Catalog /Pages 2 0 R >>",
+            f"<< /Type /Pages /Kids [{kids}] /Count {count} >>",
+            "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        ]
+        for i, text in enumerate(pages):
+            content = f"BT /F1 12 Tf 10 100 Td ({text}) Tj ET"
+            objects.append(
+                "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 200] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+            )
+            objects.append(
+                f"<< /Length {len(content)} >>\nstream\n{content}\nendstream"
+            )
+
+        pdf = b"%PDF-1.4\n"
+        offsets = []
+        for number, obj in enumerate(objects, start=1):
+            offsets.append(len(pdf))
+            pdf += f"{number} 0 obj\n{obj}\nendobj\n".encode()
+
+        xref = len(pdf)
+        pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+        for offset in offsets:
+            pdf += f"{offset:010d} 00000 n \n".encode()
+        pdf += (
+            f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+            f"startxref\n{xref}\n%%EOF\n"
+        ).encode()
+        return pdf
+
     @staticmethod
     def assert_valid_uuid(uuid_string: str) -> bool:
         """Verifica que un string sea un UUID válido"""
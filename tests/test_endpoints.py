@@ -0,0 +1,524 @@
+"""
+🧪 Tests para API Endpoints
+
+Tests de las rutas de documentos usando TestClient (sin llamadas externas)
+"""
+
+import json
+import threading
+import time
+import zipfile
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.formparsers import MultiPartParser
+
+from app.api.deps import get_clients
+from app.core.config import settings
+from app.main import app
+from app.schemas.job import JobStage
+from app.services.clients import Clients
+from app.services.jobs import shutdown_ingestion_workers
+from app.services.vector_store import PineconeVectorStore
+
+
+@pytest.fixture
+def client():
+    """Cliente de testing con lifespan de la app (sin clientes externos)"""
+    with patch("app.main.init_clients"), TestClient(app) as test_client:
+        yield test_client
+
+
+def wait_for_job(client: TestClient, job_id: str, timeout: float = 5.0) -> dict:
+    """Consulta un trabajo hasta que termine"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/documents/jobs/{job_id}").json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} no terminó a tiempo")
+
+
+class TestBulkUploadEndpoint:
+    """Tests para la subida masiva de documentos"""
+
+    def test_bulk_upload_returns_job(self, client):
+        """Test que la subida masiva procesa todos los archivos en un trabajo"""
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("corpus/b.txt", "documento b")
+            zf.writestr("corpus/c.jpg", "imagen")
+
+        def fake_bulk(files, progress=None, namespace="", document_ids=None):
+            from app.utils.bulk_ingestion import iter_bulk_files
+
+            names = [file.filename for file in iter_bulk_files(files)]
+            return {
+                "files_total": len(names),
+                "files_completed": len(names),
+                "files_failed": 0,
+                "files_skipped": 0,
+                "chunks_total": 2,
+                "chunks_new": 2,
+                "chunks_reused": 0,
+                "chunks_deleted": 0,
+                "total_seconds": 0.1,
+                "files_per_second": 20.0,
+                "chunks_per_second": 20.0,
+                "files": [{"filename": name, "status": "completed"} for name in names],
+            }
+
+        with patch("app.services.jobs.process_documents_bulk", side_effect=fake_bulk):
+            response = client.post(
+                "/api/documents/upload/bulk",
+                files=[
+                    ("files", ("a.txt", b"documento a", "text/plain")),
+                    ("files", ("corpus.zip", archive.getvalue(), "application/zip")),
+                ],
+            )
+            assert response.status_code == 202
+            assert response.json()["files_total"] == 2
+
+            job = wait_for_job(client, response.json()["job_id"])
+
+        assert job["status"] == "completed"
+        assert job["files_total"] == 2
+        assert [f["filename"] for f in job["result"]["files"]] == [
+            "a.txt",
+            "corpus/b.txt",
+            "corpus/c.jpg",
+        ]
+
+    def test_bulk_upload_document_ids(self, client):
+        """Test que document_ids llega al trabajo y se valida"""
+        document_id = "3f2b8c1e-5d4a-4e6f-9b7c-1a2d3e4f5a6b"
+        received = {}
+
+        def fake_bulk(files, progress=None, namespace="", document_ids=None):
+            received.update(document_ids)
+            return {
+                "files_total": 1,
+                "files_completed": 0,
+                "files_failed": 0,
+                "files_skipped": 1,
+                "chunks_total": 0,
+                "chunks_new": 0,
+                "chunks_reused": 0,
+                "chunks_deleted": 0,
+                "total_seconds": 0.1,
+                "files_per_second": 0.0,
+                "chunks_per_second": 0.0,
+                "files": [],
+            }
+
+        with patch("app.services.jobs.process_documents_bulk", side_effect=fake_bulk):
+            response = client.post(
+                "/api/documents/upload/bulk",
+                files=[("files", ("a.txt", b"documento a", "text/plain"))],
+                data={"document_ids": f'{{"a.txt": "{document_id.upper()}"}}'},
+            )
+            assert response.status_code == 202
+            wait_for_job(client, response.json()["job_id"])
+
+        assert received == {"a.txt": document_id}
+
+        for document_ids in ("no es json", '["a.txt"]', '{"a.txt": "doc-1"}'):
+            response = client.post(
+                "/api/documents/upload/bulk",
+                files=[("files", ("a.txt", b"documento a", "text/plain"))],
+                data={"document_ids": document_ids},
+            )
+            assert response.status_code == 400
+
+    def test_bulk_upload_unsupported_type(self, client):
+        """Test que un archivo no soportado rechaza el lote"""
+        response = client.post(
+            "/api/documents/upload/bulk",
+            files=[
+                ("files", ("a.txt", b"texto", "text/plain")),
+                ("files", ("image.jpg", b"\xff\xd8", "image/jpeg")),
+            ],
+        )
+        assert response.status_code == 400
+        assert "image.jpg" in response.json()["detail"]
+
+
+class TestUploadEndpoint:
+    """Tests para la subida asíncrona de documentos"""
+
+    def test_upload_returns_job(self, client):
+        """Test que la subida responde 202 y el trabajo termina"""
+
+        def fake_process(file, progress=None, namespace="", document_id=None):
+            assert file.file.read() == b"contenido del documento"
+            progress.set_stage(JobStage.embedding)
+            progress.add_chunks_total(3)
+            progress.add_chunks_embedded(3)
+            return {
+                "document_id": "doc-1",
+                "filename": file.filename,
+                "text_length": 23,
+                "chunks_count": 3,
+                "vectors_count": 3,
+                "message": "ok",
+            }
+
+        with patch("app.services.jobs.process_document", side_effect=fake_process):
+            response = client.post(
+                "/api/documents/upload",
+                files={"file": ("doc.txt", b"contenido del documento", "text/plain")},
+            )
+            assert response.status_code == 202
+            body = response.json()
+            assert body["status"] in ("queued", "running", "completed")
+            assert body["status_url"].endswith(body["job_id"])
+
+            job = wait_for_job(client, body["job_id"])
+
+        assert job["status"] == "completed"
+        assert job["stage"] == "done"
+        assert job["chunks_embedded"] == 3
+        assert job["result"]["document_id"] == "doc-1"
+        assert "files_total" not in job
+        assert "embedding" in job["stage_timings"]
+
+    def test_upload_large_file_is_not_copied(self, client):
+        """Test que el trabajo usa el archivo temporal de la request"""
+        content = b"linea de texto\n" * 1000
+        received = {}
+
+        def fake_process(file, progress=None, namespace="", document_id=None):
+            received["file"] = file.file
+            received["content"] = file.file.read()
+            return {
+                "document_id": "doc-1",
+                "filename": file.filename,
+                "text_length": len(content),
+                "chunks_count": 1,
+                "vectors_count": 1,
+            }
+
+        with (
+            patch.object(MultiPartParser, "spool_max_size", 1024),
+            patch("app.services.jobs.process_document", side_effect=fake_process),
+        ):
+            response = client.post(
+                "/api/documents/upload",
+                files={"file": ("big.txt", content, "text/plain")},
+            )
+            job = wait_for_job(client, response.json()["job_id"])
+
+        assert job["status"] == "completed"
+        assert received["content"] == content
+        # Es el mismo archivo que Starlette pasó a disco, no una copia
+        assert isinstance(received["file"], SpooledTemporaryFile)
+        assert received["file"]._rolled
+
+    def test_upload_failed_job_reports_error(self, client):
+        """Test que un error de procesamiento queda en el trabajo"""
+        with patch(
+            "app.services.jobs.process_document", side_effect=ValueError("boom")
+        ):
+            response = client.post(
+                "/api/documents/upload",
+                files={"file": ("doc.txt", b"texto", "text/plain")},
+            )
+            job = wait_for_job(client, response.json()["job_id"])
+
+        assert job["status"] == "failed"
+        assert job["error"] == "boom"
+
+    def test_job_status_from_another_worker(self, client):
+        """Test que el estado se lee del almacén si el trabajo es de otro proceso"""
+        with patch(
+            "app.services.jobs.process_document", side_effect=ValueError("boom")
+        ):
+            response = client.post(
+                "/api/documents/upload",
+                files={"file": ("doc.txt", b"texto", "text/plain")},
+            )
+            job_id = response.json()["job_id"]
+            wait_for_job(client, job_id)
+
+        # Simula otro worker de uvicorn: el trabajo no está en su memoria
+        with patch.dict("app.services.jobs._jobs", clear=True):
+            job = client.get(f"/api/documents/jobs/{job_id}").json()
+
+        assert job["status"] == "failed"
+        assert job["error"] == "boom"
+        assert "files_total" not in job
+
+    def test_cancelled_jobs_fail_and_release_files(self, client, tmp_path):
+        """Test que al detener la ingesta los trabajos en cola fallan y se limpian"""
+        release = threading.Event()
+
+        def fake_process(file, progress=None, namespace="", document_id=None):
+            release.wait(timeout=5)
+            raise ValueError("stopped")
+
+        with (
+            patch.object(settings, "INGESTION_MAX_WORKERS", 1),
+            patch.object(settings, "UPLOAD_SPOOL_MAX_BYTES", 10),
+            patch("tempfile.tempdir", str(tmp_path)),
+            patch("app.services.jobs.process_document", side_effect=fake_process),
+        ):
+            shutdown_ingestion_workers()
+            running = client.post(
+                "/api/documents/upload",
+                files={"file": ("a.txt", b"texto", "text/plain")},
+            ).json()
+            queued = client.post(
+                "/api/documents/upload",
+                files={"file": ("b.pdf", b"%PDF-1.4" * 10, "application/pdf")},
+            ).json()
+            # El PDF grande se copió a un archivo con nombre
+            assert list(tmp_path.glob("ingestion-*.pdf"))
+
+            shutdown_ingestion_workers()
+            release.set()
+            job = client.get(f"/api/documents/jobs/{queued['job_id']}").json()
+            wait_for_job(client, running["job_id"])
+
+        assert job["status"] == "failed"
+        assert job["error"] == "Ingestion stopped before the job started"
+        assert not list(tmp_path.glob("ingestion-*"))
+
+    def test_upload_new_version_of_document(self, client):
+        """Test que `document_id` se pasa a la ingesta y se valida"""
+        document_id = "ff078d80-0434-418a-a6b3-91aee2b2858d"
+        received = {}
+
+        def fake_process(file, progress=None, namespace="", document_id=None):
+            received["document_id"] = document_id
+            return {
+                "document_id": document_id,
+                "filename": file.filename,
+                "text_length": 5,
+                "chunks_count": 1,
+                "vectors_count": 1,
+            }
+
+        with patch("app.services.jobs.process_document", side_effect=fake_process):
+            response = client.post(
+                "/api/documents/upload",
+                files={"file": ("doc.txt", b"texto", "text/plain")},
+                data={"document_id": document_id.upper()},
+            )
+            job = wait_for_job(client, response.json()["job_id"])
+
+            invalid = client.post(
+                "/api/documents/upload",
+                files={"file": ("doc.txt", b"texto", "text/plain")},
+                data={"document_id": "doc.txt"},
+            )
+
+        assert job["status"] == "completed"
+        assert received["document_id"] == document_id
+        assert invalid.status_code == 400
+
+    def test_upload_unsupported_type(self, client):
+        """Test que los formatos no soportados se rechazan al instante"""
+        response = client.post(
+            "/api/documents/upload",
+            files={"file": ("image.jpg", b"\xff\xd8", "image/jpeg")},
+        )
+        assert response.status_code == 400
+
+    def test_unknown_job(self, client):
+        """Test trabajo inexistente"""
+        response = client.get("/api/documents/jobs/no-existe")
+        assert response.status_code == 404
+
+
+def parse_sse(body: str) -> list[tuple[str, dict]]:
+    """Separa un cuerpo Server-Sent Events en (evento, datos)"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class TestQueryStreamEndpoint:
+    """Tests para la consulta con respuesta en streaming"""
+
+    @pytest.fixture
+    def rag_mocks(self, mock_pinecone_index):
+        """Embeddings, índice asíncrono y LLM en streaming simulados"""
+        async_index = Mock()
+        async_index.query = AsyncMock(
+            return_value=mock_pinecone_index.query.return_value
+        )
+
+        async def fake_astream(prompt):
+            for text in ["Machine learning ", "es una rama ", "de la IA."]:
+                yield Mock(content=text)
+
+        llm = Mock()
+        llm.astream = fake_astream
+
+        # Las rutas reciben los clientes por dependencia
+        app.dependency_overrides[get_clients] = lambda: Clients(
+            embeddings=Mock(), llm=llm, vector_store=PineconeVectorStore()
+        )
+        try:
+            with (
+                patch(
+                    "app.services.document.aembed_query_cached",
+                    AsyncMock(return_value=[0.1] * 1536),
+                ),
+                patch(
+                    "app.services.vector_store.get_async_pinecone_index",
+                    return_value=async_index,
+                ),
+            ):
+                yield
+        finally:
+            app.dependency_overrides.clear()
+
+    def test_stream_sources_tokens_done(self, client, rag_mocks):
+        """Test que se emiten fuentes, tokens y el evento final en orden"""
+        with client.stream(
+            "POST", "/api/documents/query/stream", json={"query": "¿Qué es ML?"}
+        ) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            events = parse_sse(response.read().decode())
+
+        names = [name for name, _ in events]
+        assert names == ["sources", "token", "token", "token", "done"]
+        assert len(events[0][1]["sources"]) == 2
+
+        answer = "".join(data["text"] for name, data in events if name == "token")
+        done = events[-1][1]
+        assert done["answer"] == answer
+        assert done["guard_rail_triggered"] is None
+        assert done["confidence"] in ("high", "medium", "low")
+        assert done["time_to_first_token_ms"] is not None
+        assert "sources" not in done
+
+    def test_stream_guard_rail(self, client, rag_mocks):
+        """Test que un guard rail responde sin tokens"""
+        with client.stream(
+            "POST",
+            "/api/documents/query/stream",
+            json={"query": "¿Qué es ML?", "similarity_threshold": 0.99},
+        ) as response:
+            events = parse_sse(response.read().decode())
+
+        assert [name for name, _ in events] == ["sources", "done"]
+        assert events[-1][1]["guard_rail_triggered"] == "low_similarity"
+
+
+class TestQueryBatchEndpoint:
+    """Tests para las consultas en lote"""
+
+    def test_batch_returns_results_in_order(self, client):
+        """Test que el lote responde cada consulta en orden"""
+        from app.schemas.query import QueryResponse
+
+        async def fake_batch(queries, **kwargs):
+            return [
+                QueryResponse(query=query, answer=f"respuesta {i}", confidence="low")
+                for i, query in enumerate(queries)
+            ]
+
+        with patch(
+            "app.api.routes.documents.aquery_documents_batch", side_effect=fake_batch
+        ) as batch:
+            response = client.post(
+                "/api/documents/query/batch",
+                json={"queries": [" ¿Qué es ML? ", "¿Qué es RAG?"], "max_results": 3},
+            )
+
+        assert response.status_code == 200
+        body = response.json()
+        assert [r["query"] for r in body["results"]] == ["¿Qué es ML?", "¿Qué es RAG?"]
+        assert body["queries_per_second"] > 0
+        assert batch.call_args.kwargs["max_results"] == 3
+
+    def test_batch_too_many_queries(self, client):
+        """Test que un lote demasiado grande se rechaza"""
+        with patch("app.api.routes.documents.settings.QUERY_BATCH_MAX_SIZE", 2):
+            response = client.post(
+                "/api/documents/query/batch",
+                json={"queries": ["uno", "dos", "tres"]},
+            )
+        assert response.status_code == 400
+
+
+class TestNamespaces:
+    """Tests para namespaces y filtros de metadata"""
+
+    def test_upload_into_namespace(self, client):
+        """Test que el namespace del formulario llega a la ingesta"""
+        received = {}
+
+        def fake_process(file, progress=None, namespace="", document_id=None):
+            received["namespace"] = namespace
+            return {
+                "document_id": "doc-1",
+                "filename": file.filename,
+                "namespace": namespace,
+                "text_length": 5,
+                "chunks_count": 1,
+                "vectors_count": 1,
+            }
+
+        with patch("app.services.jobs.process_document", side_effect=fake_process):
+            response = client.post(
+                "/api/documents/upload",
+                files={"file": ("doc.txt", b"texto", "text/plain")},
+                data={"namespace": "linea-a"},
+            )
+            job = wait_for_job(client, response.json()["job_id"])
+
+        assert received["namespace"] == "linea-a"
+        assert job["namespace"] == "linea-a"
+        assert job["result"]["namespace"] == "linea-a"
+
+    def test_query_passes_namespace_and_filters(self, client):
+        """Test que la consulta pasa el namespace y los filtros al servicio"""
+        from app.schemas.query import QueryResponse
+
+        query = AsyncMock(
+            return_value=QueryResponse(query="q", answer="a", confidence="low")
+        )
+        with patch("app.api.routes.documents.aquery_documents", query):
+            response = client.post(
+                "/api/documents/query",
+                json={
+                    "query": "¿Qué es ML?",
+                    "namespace": "linea-a",
+                    "filters": {
+                        "document_id": "doc-1",
+                        "uploaded_before": "2025-01-01T00:00:00",
+                    },
+                },
+            )
+
+        assert response.status_code == 200
+        kwargs = query.call_args.kwargs
+        assert kwargs["namespace"] == "linea-a"
+        assert kwargs["filters"].document_id == "doc-1"
+        assert kwargs["filters"].uploaded_before.year == 2025
+
+    def test_routes_need_app_clients(self, client):
+        """Test que sin los clientes del lifespan las rutas responden 503"""
+        client.app.state.clients = None
+        response = client.delete("/api/documents/vectors/namespaces/linea-a")
+        assert response.status_code == 503
+
+    def test_delete_namespace(self, client):
+        """Test que se puede vaciar un solo namespace"""
+        with patch("app.api.routes.documents.delete_namespace") as delete:
+            response = client.delete("/api/documents/vectors/namespaces/linea-a")
+
+        assert response.status_code == 200
+        assert response.json()["namespace"] == "linea-a"
+        store = app.state.clients.vector_store
+        delete.assert_called_once_with("linea-a", store)
@@ -4,32 +4,98 @@
 Tests para lógica de negocio (embeddings, pinecone, document processing)
 """
 
+import hashlib
+from contextlib import ExitStack, contextmanager
+
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import ANY, AsyncMock, Mock, patch
 from fastapi import HTTPException
 
 from app.services.embeddings import (
+    chunk_metadata,
     create_embeddings,
     create_text_splitter,
     create_text_chunks,
+    create_embedding_batches,
+    create_vectors_from_chunks,
+    aembed_queries_cached,
+    embed_query_cached,
+    iter_text_chunks,
+    make_chunk_id,
+)
+from app.services.context import build_context, merge_adjacent_chunks
+from app.services.rerank import bm25_scores, rerank_results
+from app.services.sparse import SparseEncoder, term_ids
+from app.services.document import (
+    aquery_documents,
+    aquery_documents_batch,
+    query_arguments,
+    query_documents,
+    search_similar_documents,
 )
-from app.services.document import query_documents
-from app.utils.doc_to_vectores import process_document
+from app.services.chunk_store import ChunkTextStore
+from app.services.embedding_cache import EmbeddingCache
+from app.services.query_cache import QueryEmbeddingCache
+from app.services.semantic_cache import SemanticAnswerCache
+from app.services.single_flight import SingleFlight
+from app.utils.tokens import count_tokens
+from app.schemas.query import QueryFilters, QueryResponse
+from app.services.pinecone import (
+    create_upsert_batches,
+    delete_namespace,
+    delete_vectors,
+    fetch_metadata,
+    get_index_generation,
+    list_vector_ids,
+    update_metadata,
+    upsert_vectors,
+)
+from pinecone.exceptions import PineconeApiException
+from app.services.ann import ANNVectorStore
+from app.services.local_vector_store import LocalVectorStore, matches_filter
+from app.services.vector_store import PineconeVectorStore
+from app.services.vector_store import delete_namespace as store_delete_namespace
+from app.services.vector_store import delete_vectors as store_delete_vectors
+from app.utils.bulk_ingestion import process_documents_bulk
+from app.utils.doc_to_vectores import DocumentIngestion, process_document
 
 
 class TestEmbeddingsService:
     """Tests para servicio de embeddings"""
 
     def test_create_embeddings(self):
-        """Test creación de cliente de embeddings"""
+        """Test que el cliente de embeddings se crea una vez y se comparte"""
+        create_embeddings.cache_clear()
         with patch("app.services.embeddings.OpenAIEmbeddings") as mock_embeddings:
             mock_instance = Mock()
             mock_embeddings.return_value = mock_instance
 
             result = create_embeddings()
 
+            assert create_embeddings() is result
             mock_embeddings.assert_called_once()
             assert result == mock_instance
+            assert "http_client" in mock_embeddings.call_args.kwargs
+        create_embeddings.cache_clear()
+
+    @pytest.mark.parametrize(
+        "model,expected",
+        [("text-embedding-3-large", 512), ("text-embedding-ada-002", None)],
+    )
+    def test_create_embeddings_dimensions(self, model, expected):
+        """Test que solo text-embedding-3 recibe las dimensiones configuradas"""
+        create_embeddings.cache_clear()
+        with (
+            patch("app.services.embeddings.OpenAIEmbeddings") as mock_embeddings,
+            patch("app.services.embeddings.settings.EMBEDDING_MODEL", model),
+            patch("app.services.embeddings.settings.EMBEDDING_DIMENSIONS", 512),
+        ):
+            create_embeddings()
+
+        kwargs = mock_embeddings.call_args.kwargs
+        assert kwargs["model"] == model
+        assert kwargs["dimensions"] == expected
+        create_embeddings.cache_clear()
 
     def test_create_text_splitter(self):
         """Test creación de text splitter"""
@@ -68,26 +134,1568 @@ class TestEmbeddingsService:
         # Verificar filename
         assert all(chunk["filename"] == "test.txt" for chunk in chunks)
 
-        # Verificar chunk_id format
+        # Verificar chunk_id format (derivado del contenido)
         for i, chunk in enumerate(chunks):
-            expected_chunk_id = f"{doc_id}_{i}"
-            assert chunk["chunk_id"] == expected_chunk_id
+            assert chunk["chunk_id"] == make_chunk_id(doc_id, chunk["text"])
             assert chunk["chunk_index"] == i
 
+        # El mismo archivo produce los mismos ids
+        assert create_text_chunks(sample_text, "test.txt") == [
+            {**chunk, "metadata": ANY} for chunk in chunks
+        ]
+
+    def test_chunk_ids_repeated_text(self):
+        """Test que los textos repetidos tienen ids distintos"""
+        paragraph = "palabra " * 100
+        chunks = create_text_chunks(f"{paragraph}\n\n{paragraph}", "t.txt")
+        texts = [chunk["text"] for chunk in chunks]
+        ids = [chunk["chunk_id"] for chunk in chunks]
+
+        assert texts[0] == texts[1]
+        assert len(set(ids)) == len(ids)
+        assert ids[1] == ids[0] + "-1"
+
+    def test_iter_text_chunks_matches_splitter(self):
+        """Test que el chunking en flujo produce los mismos chunks"""
+        words = [
+            "lorem",
+            "ipsum",
+            "dolor",
+            "sit",
+            "amet",
+            "consectetur",
+            "adipiscing",
+            "elit",
+        ]
+        paragraphs = [
+            " ".join(words[(i + j) % len(words)] for j in range(20 + (i * 37) % 300))
+            for i in range(120)
+        ]
+        text = "\n\n".join(paragraphs)
+        segments = [text[i : i + 700] for i in range(0, len(text), 700)]
+
+        expected = create_text_splitter().split_text(text)
+        chunks = list(
+            iter_text_chunks(segments, "test.txt", document_id="doc", window_size=3000)
+        )
+
+        assert [chunk["text"] for chunk in chunks] == expected
+        assert [chunk["chunk_index"] for chunk in chunks] == list(range(len(expected)))
+        assert all(chunk["chunk_id"].startswith("doc#") for chunk in chunks)
+
+    @pytest.mark.parametrize("seed", range(40))
+    def test_iter_split_text_random_segmentations(self, seed):
+        """Test que cualquier segmentación da los chunks del texto completo"""
+        import random
+
+        from app.services.embeddings import _iter_split_text
+
+        rng = random.Random(seed)
+        alphabet = "abcdefgh" * 6 + "  " * 3 + "\n.,"
+        header = "Manual de operación — Página\n"
+        paragraphs = []
+        for _ in range(rng.randint(3, 60)):
+            if rng.random() < 0.1:
+                paragraphs.append(header * rng.randint(1, 3))  # Texto repetido
+                continue
+            size = rng.choice([50, 400, 1100, 1400])
+            paragraphs.append(
+                "".join(rng.choice(alphabet) for _ in range(rng.randint(1, size)))
+            )
+        text = paragraphs[0]
+        for paragraph in paragraphs[1:]:
+            text += rng.choice(["\n\n", "\n\n\n", "\n\n\n\n", " \n\n"]) + paragraph
+
+        cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, 40)))
+        segments = [
+            text[i:j] for i, j in zip([0, *cuts], [*cuts, len(text)], strict=True)
+        ]
+        splitter = create_text_splitter()
+
+        for window_size in (1500, 2500, 4000):
+            chunks = list(_iter_split_text(segments, splitter, window_size))
+            assert chunks == splitter.split_text(text)
+
+    def test_create_embedding_batches(self):
+        """Test agrupación de textos por cantidad y tokens"""
+        texts = [f"texto {i}" for i in range(10)]
+
+        batches = create_embedding_batches(texts, max_batch_size=4)
+        assert [len(batch) for batch in batches] == [4, 4, 2]
+        assert [text for batch in batches for text in batch] == texts
+
+        with patch("app.services.embeddings.count_tokens", return_value=30):
+            batches = create_embedding_batches(
+                texts, max_batch_size=100, max_batch_tokens=100
+            )
+        assert [len(batch) for batch in batches] == [3, 3, 3, 1]
+
+    def test_create_vectors_from_chunks_batched(self, mock_embeddings):
+        """Test vectorización en lotes conservando el orden"""
+        chunks = [
+            {
+                "document_id": "doc-1",
+                "chunk_id": f"doc-1_{i}",
+                "chunk_index": i,
+                "text": f"chunk {i}",
+                "filename": "test.txt",
+            }
+            for i in range(7)
+        ]
+        mock_embeddings.embed_documents.side_effect = lambda texts: [
+            [float(text.split()[-1])] for text in texts
+        ]
+
+        with (
+            patch(
+                "app.services.embeddings.create_embeddings",
+                return_value=mock_embeddings,
+            ),
+            patch("app.services.embeddings.settings.EMBEDDING_BATCH_SIZE", 2),
+        ):
+            vectors = create_vectors_from_chunks(chunks)
+
+        assert mock_embeddings.embed_documents.call_count == 4
+        mock_embeddings.embed_query.assert_not_called()
+        assert [v["id"] for v in vectors] == [c["chunk_id"] for c in chunks]
+        assert [v["values"] for v in vectors] == [[float(i)] for i in range(7)]
+        assert all(v["metadata"]["embedding_dimensions"] == 1 for v in vectors)
+
     # Test eliminado: Hacía llamadas reales a OpenAI API
 
 
+class TestEmbeddingCache:
+    """Tests para el cache persistente de embeddings"""
+
+    def test_get_and_put(self, tmp_path):
+        """Test guardado y lectura con contadores de hits/misses"""
+        cache = EmbeddingCache(tmp_path / "cache.sqlite3", max_entries=10)
+        key = cache.make_key("model", 3, "hola")
+
+        assert cache.get_many([key]) == {}
+        cache.put_many({key: [0.5, 0.25, 1.0]})
+
+        assert cache.get_many([key]) == {key: [0.5, 0.25, 1.0]}
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["entries"] == 1
+
+    def test_key_depends_on_model_and_dimensions(self):
+        """Test que la clave cambia con el modelo y las dimensiones"""
+        keys = {
+            EmbeddingCache.make_key("a", 3, "texto"),
+            EmbeddingCache.make_key("b", 3, "texto"),
+            EmbeddingCache.make_key("a", 2, "texto"),
+        }
+        assert len(keys) == 3
+
+    def test_eviction_and_persistence(self, tmp_path):
+        """Test límite de tamaño (LRU) y persistencia en disco"""
+        path = tmp_path / "cache.sqlite3"
+        cache = EmbeddingCache(path, max_entries=2)
+        cache.put_many({"a": [1.0]})
+        cache.put_many({"b": [2.0]})
+        cache.get_many(["a"])  # "b" pasa a ser la menos usada
+        cache.put_many({"c": [3.0]})
+        cache.close()
+
+        reopened = EmbeddingCache(path, max_entries=2)
+        assert set(reopened.get_many(["a", "b", "c"])) == {"a", "c"}
+        assert reopened.stats()["entries"] == 2
+
+    def test_create_vectors_uses_cache(self, tmp_path, mock_embeddings, sample_chunks):
+        """Test que una segunda ingesta no vuelve a llamar a OpenAI"""
+        cache = EmbeddingCache(tmp_path / "cache.sqlite3", max_entries=100)
+        mock_embeddings.embed_documents.side_effect = lambda texts: [
+            [0.5, 0.25] for _ in texts
+        ]
+
+        with (
+            patch("app.services.embeddings.get_embedding_cache", return_value=cache),
+            patch(
+                "app.services.embeddings.create_embeddings",
+                return_value=mock_embeddings,
+            ),
+        ):
+            first = create_vectors_from_chunks(sample_chunks)
+            second = create_vectors_from_chunks(sample_chunks)
+
+        assert mock_embeddings.embed_documents.call_count == 1
+        assert [v["values"] for v in first] == [v["values"] for v in second]
+        assert cache.stats()["hits"] == len(sample_chunks)
+
+
+class TestChunkTextStore:
+    """Tests para el almacén comprimido de textos de chunks"""
+
+    def test_get_put_and_delete_by_namespace(self, tmp_path):
+        """Test que los textos se guardan por namespace y se borran por id"""
+        store = ChunkTextStore(tmp_path / "chunks.sqlite3")
+        store.put_many({"a#1": "hola mundo", "a#2": "ñandú"})
+        store.put_many({"a#1": "otro namespace"}, namespace="linea-a")
+
+        assert store.get_many(["a#1", "a#2", "x"]) == {
+            "a#1": "hola mundo",
+            "a#2": "ñandú",
+        }
+        assert store.get_many(["a#1"], "linea-a") == {"a#1": "otro namespace"}
+
+        store.delete(["a#1"])
+        store.delete_namespace("linea-a")
+        assert store.get_many(["a#1", "a#2"]) == {"a#2": "ñandú"}
+        assert store.get_many(["a#1"], "linea-a") == {}
+
+    def test_compressed_and_persistent(self, tmp_path):
+        """Test que los textos se comprimen y sobreviven a un reinicio"""
+        path = tmp_path / "chunks.sqlite3"
+        store = ChunkTextStore(path)
+        text = "El manual describe el error E1234 y su solución. " * 20
+        store.put_many({"a#1": text})
+        store.close()
+
+        reopened = ChunkTextStore(path)
+        stats = reopened.stats()
+        assert reopened.get_many(["a#1"]) == {"a#1": text}
+        assert stats["entries"] == 1
+        assert stats["text_bytes"] == len(text.encode("utf-8"))
+        assert stats["compressed_bytes"] < stats["text_bytes"] / 4
+
+    def test_vectors_stored_without_text(self, tmp_path):
+        """Test que el texto va al almacén local y la búsqueda lo recupera"""
+        from app.services.vector_store import delete_vectors, store_vectors
+
+        chunk_store = ChunkTextStore(tmp_path / "chunks.sqlite3")
+        vector_store = LocalVectorStore(tmp_path / "vectors")
+        vectors = [
+            {
+                "id": f"a#{i}",
+                "values": values,
+                "metadata": {"text": f"chunk {i}", "document_id": "a"},
+            }
+            for i, values in enumerate([[1.0, 0.0], [0.0, 1.0]])
+        ]
+
+        with (
+            patch(
+                "app.services.vector_store.get_chunk_store", return_value=chunk_store
+            ),
+            patch(
+                "app.services.vector_store.get_vector_store",
+                return_value=vector_store,
+            ),
+            patch("app.services.document.get_chunk_store", return_value=chunk_store),
+            patch("app.services.document.get_vector_store", return_value=vector_store),
+            patch("app.services.document.settings.EMBEDDING_DIMENSIONS", 2),
+        ):
+            store_vectors(vectors, namespace="linea-a")
+            stored = vector_store.query([1.0, 0.0], top_k=2, namespace="linea-a")
+            results = search_similar_documents(
+                "consulta", 2, [1.0, 0.0], namespace="linea-a"
+            )
+            delete_vectors(["a#0"], namespace="linea-a")
+
+        assert all("text" not in match["metadata"] for match in stored)
+        assert vectors[0]["metadata"]["text"] == "chunk 0"
+        assert [r["metadata"]["text"] for r in results] == ["chunk 0", "chunk 1"]
+        # La metadata del almacén de vectores no se modifica
+        assert "text" not in vector_store.query([1.0, 0.0], 1, "linea-a")[0]["metadata"]
+        assert chunk_store.get_many(["a#0", "a#1"], "linea-a") == {"a#1": "chunk 1"}
+
+    def test_legacy_text_in_metadata_is_kept(self):
+        """Test que los vectores con el texto en la metadata no se consultan"""
+        from app.services.document import attach_chunk_texts
+
+        chunk_store = Mock()
+        matches = [{"id": "a#0", "score": 0.9, "metadata": {"text": "viejo"}}]
+        with patch("app.services.document.get_chunk_store", return_value=chunk_store):
+            assert attach_chunk_texts(matches) == matches
+
+        chunk_store.get_many.assert_not_called()
+
+    def test_missing_text_is_logged(self, tmp_path):
+        """Test que un chunk sin texto en el almacén se avisa en el log"""
+        from app.services.document import attach_chunk_texts
+
+        chunk_store = ChunkTextStore(tmp_path / "chunks.sqlite3")
+        chunk_store.put_many({"a#0": "chunk 0"})
+        matches = [{"id": "a#0", "score": 0.9}, {"id": "b#0", "score": 0.8}]
+        with (
+            patch("app.services.document.get_chunk_store", return_value=chunk_store),
+            patch("app.services.document.logger") as mock_logger,
+        ):
+            results = attach_chunk_texts(matches)
+
+        assert results[0]["metadata"]["text"] == "chunk 0"
+        assert "metadata" not in results[1]
+        assert "1 chunks sin texto" in mock_logger.warning.call_args.args[0]
+
+    @pytest.mark.parametrize(
+        ("backend", "enabled", "expected"),
+        [
+            ("pinecone", None, False),
+            ("local", None, True),
+            ("ann", None, True),
+            ("pinecone", True, True),
+            ("local", False, False),
+        ],
+    )
+    def test_enabled_by_default_only_for_local_backends(
+        self, tmp_path, backend, enabled, expected
+    ):
+        """Test que por defecto el almacén solo se activa sin Pinecone"""
+        from app.core.config import settings
+        from app.services.chunk_store import get_chunk_store
+
+        get_chunk_store.cache_clear()
+        try:
+            with (
+                patch.object(settings, "VECTOR_STORE_BACKEND", backend),
+                patch.object(settings, "CHUNK_TEXT_STORE_ENABLED", enabled),
+                patch.object(
+                    settings, "CHUNK_TEXT_STORE_PATH", str(tmp_path / "c.sqlite3")
+                ),
+            ):
+                assert (get_chunk_store() is not None) is expected
+        finally:
+            get_chunk_store.cache_clear()
+
+
+class TestQueryEmbeddingCache:
+    """Tests para el cache en memoria de embeddings de consultas"""
+
+    def test_normalized_key(self):
+        """Test que la clave ignora mayúsculas, espacios y forma Unicode"""
+        key = QueryEmbeddingCache.make_key
+        assert key("m", "¿Qué es  RAG?\n") == key("m", "¿qué es rag?")
+        assert key("m", "Que\u0301 es") == key("m", "qué es")
+        assert key("m", "hola") != key("otro-modelo", "hola")
+
+    def test_lru_eviction_and_stats(self):
+        """Test que se descarta la entrada usada hace más tiempo"""
+        cache = QueryEmbeddingCache(max_entries=2, ttl_seconds=60)
+        cache.put("a", [0.5])
+        cache.put("b", [0.25])
+        assert cache.get("a") == [0.5]  # "b" pasa a ser la menos usada
+        cache.put("c", [1.0])
+
+        assert cache.get("b") is None
+        assert cache.get("c") == [1.0]
+        stats = cache.stats()
+        assert stats["entries"] == 2
+        assert stats["hits"] == 2
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == pytest.approx(2 / 3)
+
+    def test_ttl_expiry(self):
+        """Test que las entradas vencen después del TTL"""
+        cache = QueryEmbeddingCache(max_entries=10, ttl_seconds=60)
+        with patch("app.services.query_cache.time.monotonic", return_value=0.0):
+            cache.put("a", [0.5])
+        with patch("app.services.query_cache.time.monotonic", return_value=30.0):
+            assert cache.get("a") == [0.5]
+        with patch("app.services.query_cache.time.monotonic", return_value=61.0):
+            assert cache.get("a") is None
+
+        assert cache.stats()["expired"] == 1
+        assert cache.stats()["entries"] == 0
+
+    def test_embed_query_uses_cache(self, mock_embeddings):
+        """Test que las consultas repetidas no llaman a OpenAI"""
+        cache = QueryEmbeddingCache(max_entries=10, ttl_seconds=60)
+
+        with (
+            patch(
+                "app.services.embeddings.get_query_embedding_cache",
+                return_value=cache,
+            ),
+            patch(
+                "app.services.embeddings.create_embeddings",
+                return_value=mock_embeddings,
+            ),
+        ):
+            first = embed_query_cached("¿Qué es Machine Learning?")
+            second = embed_query_cached("  ¿qué es machine   learning? ")
+
+        assert first == second
+        mock_embeddings.embed_query.assert_called_once()
+        assert cache.stats()["hits"] == 1
+
+    def test_embed_queries_batch(self):
+        """Test que un lote se vectoriza en una request sin repetir consultas"""
+        import asyncio
+
+        cache = QueryEmbeddingCache(max_entries=10, ttl_seconds=60)
+        cache.put(cache.make_key("text-embedding-3-small", "ya vista"), [9.0])
+        embeddings = Mock()
+        embeddings.aembed_documents = AsyncMock(
+            side_effect=lambda texts: [[float(i)] for i in range(len(texts))]
+        )
+
+        with (
+            patch(
+                "app.services.embeddings.get_query_embedding_cache",
+                return_value=cache,
+            ),
+            patch("app.services.embeddings.create_embeddings", return_value=embeddings),
+        ):
+            vectors = asyncio.run(
+                aembed_queries_cached(["uno", "Ya  vista", "dos", "UNO"])
+            )
+
+        embeddings.aembed_documents.assert_awaited_once_with(["uno", "dos"])
+        assert vectors == [[0.0], [9.0], [1.0], [0.0]]
+
+
+class TestSemanticAnswerCache:
+    """Tests para el cache semántico de respuestas"""
+
+    @staticmethod
+    def make_response(answer: str = "respuesta") -> QueryResponse:
+        return QueryResponse(query="q", answer=answer, confidence="high")
+
+    def test_hit_within_distance(self):
+        """Test que una consulta parecida reutiliza la respuesta"""
+        cache = SemanticAnswerCache(capacity=4, max_distance=0.05)
+        generation = get_index_generation()
+        cache.put([1.0, 0.0, 0.0], "5:0.7", self.make_response(), generation)
+
+        found = cache.get([0.99, 0.05, 0.0], "5:0.7")
+        assert found is not None
+        assert found[0].answer == "respuesta"
+        assert found[1] > 0.95
+
+        assert cache.get([0.0, 1.0, 0.0], "5:0.7") is None  # Lejana
+        assert cache.get([1.0, 0.0, 0.0], "3:0.7") is None  # Otros parámetros
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 2
+
+    def test_fixed_capacity(self):
+        """Test que al llenarse se reemplaza la entrada más antigua"""
+        cache = SemanticAnswerCache(capacity=2, max_distance=0.01)
+        generation = get_index_generation()
+        for i, vector in enumerate([[1, 0, 0], [0, 1, 0], [0, 0, 1]]):
+            cache.put(vector, "p", self.make_response(f"r{i}"), generation)
+
+        assert cache.stats()["entries"] == 2
+        assert cache.get([1, 0, 0], "p") is None
+        assert cache.get([0, 0, 1], "p")[0].answer == "r2"
+
+    def test_invalidated_by_index_changes(self, mock_pinecone_index):
+        """Test que escribir en el índice invalida las respuestas"""
+        cache = SemanticAnswerCache(capacity=4, max_distance=0.05)
+        generation = get_index_generation()
+        cache.put([1.0, 0.0], "p", self.make_response(), generation)
+
+        upsert_vectors(
+            [{"id": "a", "values": [0.5, 0.5], "metadata": {}}],
+            index=mock_pinecone_index,
+        )
+
+        assert cache.get([1.0, 0.0], "p") is None
+        assert cache.stats()["invalidations"] == 1
+
+        # Una respuesta calculada antes del cambio no se guarda
+        cache.put([1.0, 0.0], "p", self.make_response(), generation)
+        assert cache.stats()["entries"] == 0
+
+    def test_invalidated_by_other_workers(self, tmp_path):
+        """Test que una escritura de otro worker invalida las respuestas"""
+        from app.services.pinecone import IndexGeneration
+
+        path = tmp_path / "generation.sqlite3"
+        this_worker, other_worker = IndexGeneration(path), IndexGeneration(path)
+        cache = SemanticAnswerCache(capacity=4, max_distance=0.05)
+
+        with patch(
+            "app.services.pinecone.get_index_generation_store",
+            return_value=this_worker,
+        ):
+            cache.put([1.0, 0.0], "p", self.make_response(), get_index_generation())
+            assert cache.get([1.0, 0.0], "p") is not None
+
+            other_worker.bump()
+
+            assert cache.get([1.0, 0.0], "p") is None
+            assert cache.stats()["invalidations"] == 1
+
+    def test_entries_expire(self):
+        """Test que las respuestas vencen a los `ttl` segundos"""
+        cache = SemanticAnswerCache(capacity=4, max_distance=0.05, ttl=60.0)
+        generation = get_index_generation()
+
+        with patch("app.services.semantic_cache.time.monotonic", return_value=1000.0):
+            cache.put([1.0, 0.0], "p", self.make_response(), generation)
+        with patch("app.services.semantic_cache.time.monotonic", return_value=1059.0):
+            assert cache.get([1.0, 0.0], "p") is not None
+        with patch("app.services.semantic_cache.time.monotonic", return_value=1061.0):
+            assert cache.get([1.0, 0.0], "p") is None
+
+    def test_query_documents_marks_cached_answer(
+        self, mock_embeddings, mock_pinecone_index, mock_llm
+    ):
+        """Test que una paráfrasis se responde desde el cache"""
+        cache = SemanticAnswerCache(capacity=8, max_distance=0.05)
+
+        with (
+            patch("app.services.document.get_semantic_cache", return_value=cache),
+            patch(
+                "app.services.embeddings.create_embeddings",
+                return_value=mock_embeddings,
+            ),
+            patch(
+                "app.services.vector_store.get_pinecone_index",
+                return_value=mock_pinecone_index,
+            ),
+            patch("app.services.document.create_llm", return_value=mock_llm),
+        ):
+            first = query_documents("¿Qué es machine learning?")
+            second = query_documents("¿Qué significa machine learning?")
+
+        assert not first.cached
+        assert second.cached
+        assert second.query == "¿Qué significa machine learning?"
+        assert second.answer == first.answer
+        assert second.cache_similarity == pytest.approx(1.0)
+        mock_llm.invoke.assert_called_once()
+        mock_pinecone_index.query.assert_called_once()
+
+    def test_streamed_answer_served_from_cache(self, mock_pinecone_index):
+        """Test que una respuesta en streaming se reutiliza en el mismo alcance"""
+        import asyncio
+
+        from app.services.document import astream_query_documents
+
+        cache = SemanticAnswerCache(capacity=8, max_distance=0.05)
+        async_index = Mock()
+        async_index.query = AsyncMock(
+            return_value=mock_pinecone_index.query.return_value
+        )
+        llm = Mock()
+
+        async def fake_astream(prompt):
+            for text in ["Machine learning ", "es una rama de la IA."]:
+                yield Mock(content=text)
+
+        llm.astream = Mock(side_effect=fake_astream)
+        filters = QueryFilters(filename="ml.pdf")
+
+        async def stream() -> dict:
+            events = [
+                event
+                async for event in astream_query_documents(
+                    "¿Qué es ML?", namespace="linea-a", filters=filters
+                )
+            ]
+            return events[-1][1]
+
+        with (
+            patch("app.services.document.get_semantic_cache", return_value=cache),
+            patch(
+                "app.services.document.aembed_query_cached",
+                AsyncMock(return_value=[0.1] * 1536),
+            ),
+            patch(
+                "app.services.vector_store.get_async_pinecone_index",
+                return_value=async_index,
+            ),
+            patch("app.services.document.create_llm", return_value=llm),
+        ):
+            first = asyncio.run(stream())
+            second = asyncio.run(stream())
+
+        assert not first["cached"]
+        assert second["cached"]
+        assert second["answer"] == first["answer"]
+        llm.astream.assert_called_once()
+        async_index.query.assert_awaited_once()
+
+
+class TestSingleFlight:
+    """Tests para la deduplicación de consultas en curso"""
+
+    def test_concurrent_calls_share_result(self):
+        """Test que las llamadas con la misma clave comparten un cálculo"""
+        import asyncio
+
+        flight = SingleFlight()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "respuesta"
+
+        async def run():
+            same = [flight.run("a", compute) for _ in range(5)]
+            return await asyncio.gather(*same, flight.run("b", compute))
+
+        results = asyncio.run(run())
+
+        assert results == ["respuesta"] * 6
+        assert calls == 2
+        assert flight.stats()["coalesced"] == 4
+        assert flight.stats()["in_flight"] == 0
+
+    def test_errors_shared_and_leader_cancel_isolated(self):
+        """Test que el error llega a todos y cancelar al primero no afecta"""
+        import asyncio
+
+        flight = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.02)
+            raise RuntimeError("boom")
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        async def run():
+            errors = await asyncio.gather(
+                flight.run("x", failing),
+                flight.run("x", failing),
+                return_exceptions=True,
+            )
+            leader = asyncio.ensure_future(flight.run("y", slow))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.run("y", slow))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return errors, await follower
+
+        errors, result = asyncio.run(run())
+
+        assert all(isinstance(e, RuntimeError) for e in errors)
+        assert result == "ok"
+
+
+class TestContextBuilder:
+    """Tests para el armado del contexto con presupuesto de tokens"""
+
+    @staticmethod
+    def result(document_id, chunk_index, text, score=0.9):
+        return {
+            "id": f"{document_id}-{chunk_index}",
+            "score": score,
+            "metadata": {
+                "document_id": document_id,
+                "chunk_index": chunk_index,
+                "text": text,
+            },
+        }
+
+    def test_merges_adjacent_chunks_without_overlap(self):
+        """Test que los chunks consecutivos se unen sin repetir texto"""
+        text = " ".join(f"palabra{i}" for i in range(600))
+        chunks = create_text_splitter().split_text(text)
+        assert len(chunks) > 2
+
+        # Orden de relevancia distinto al del documento
+        results = [self.result("doc", i, chunk) for i, chunk in enumerate(chunks)]
+        segments = merge_adjacent_chunks(results[::-1])
+
+        assert len(segments) == 1
+        assert segments[0]["text"] == text
+
+    def test_keeps_gaps_and_documents_apart(self):
+        """Test que los chunks no consecutivos quedan como fragmentos separados"""
+        results = [
+            self.result("a", 0, "uno", 0.7),
+            self.result("a", 2, "tres", 0.95),
+            self.result("b", 1, "otro documento", 0.8),
+            self.result("b", 1, "otro documento", 0.8),  # Texto repetido
+        ]
+        context = build_context(results, max_tokens=1000)
+        assert context == "tres\n\notro documento\n\nuno"
+
+    def test_trims_to_token_budget(self):
+        """Test que el contexto no supera el presupuesto de tokens"""
+        results = [
+            self.result("a", 0, "importante " * 20, 0.95),
+            self.result("b", 0, "relleno " * 500, 0.8),
+            self.result("c", 0, "descartado", 0.75),
+        ]
+        context = build_context(results, max_tokens=100)
+
+        assert context.startswith("importante")
+        assert "relleno" in context
+        assert "descartado" not in context
+        assert count_tokens(context) <= 100
+
+
+class TestRerank:
+    """Tests para el reranking local con BM25"""
+
+    def test_bm25_prefers_matching_terms(self):
+        """Test que BM25 puntúa más los textos con los términos de la consulta"""
+        scores = bm25_scores(
+            "error E1234",
+            [
+                "El código de error E1234 indica sobrecalentamiento.",
+                "La máquina funciona sin problemas.",
+                "Otro error distinto.",
+            ],
+        )
+        assert scores[0] > scores[2] > scores[1] == 0
+
+    def test_rerank_keeps_best_k(self):
+        """Test que el rerank combina scores y conserva el score denso"""
+        results = [
+            {"id": "a", "score": 0.82, "metadata": {"text": "texto general"}},
+            {"id": "b", "score": 0.80, "metadata": {"text": "pieza XJ-900 rota"}},
+            {"id": "c", "score": 0.78, "metadata": {"text": "otro texto"}},
+        ]
+        reranked = rerank_results("pieza XJ-900", results, k=2, dense_weight=0.5)
+
+        assert [r["id"] for r in reranked] == ["b", "a"]
+        assert reranked[0]["score"] == 0.80
+        assert reranked[0]["rerank_score"] > reranked[1]["rerank_score"]
+
+    def test_search_oversamples_when_enabled(self, mock_pinecone_index):
+        """Test que con rerank se piden más candidatos y se devuelven k"""
+        with (
+            patch("app.services.document.settings.RERANK_ENABLED", True),
+            patch("app.services.document.settings.RERANK_OVERSAMPLE", 4),
+            patch(
+                "app.services.vector_store.get_pinecone_index",
+                return_value=mock_pinecone_index,
+            ),
+        ):
+            results = search_similar_documents("machine learning", 1, [0.1] * 1536)
+
+        assert mock_pinecone_index.query.call_args.kwargs["top_k"] == 4
+        assert len(results) == 1
+
+
+class TestSparseEncoder:
+    """Tests para los vectores dispersos de la búsqueda híbrida"""
+
+    def test_encode_documents_updates_statistics(self):
+        """Test que el vocabulario se actualiza de forma incremental"""
+        encoder = SparseEncoder(":memory:")
+        first = encoder.encode_documents(["error E1234 en la bomba", "bomba nueva"])
+        encoder.encode_documents(["otra bomba"])
+
+        assert len(first[0]["indices"]) == 5
+        assert all(0 < value <= 1 for value in first[0]["values"])
+        assert encoder.stats() == {
+            "terms": 7,
+            "documents": 3,
+            "average_length": 3.0,
+        }
+
+    def test_encode_query_weights_rare_terms(self):
+        """Test que los términos raros pesan más en la consulta"""
+        encoder = SparseEncoder(":memory:")
+        encoder.encode_documents(
+            ["error E1234 en la bomba", "bomba nueva", "otra bomba", "bomba"]
+        )
+        query = encoder.encode_query("bomba E1234")
+        weights = dict(zip(query["indices"], query["values"], strict=True))
+        [rare] = term_ids(["e1234"]).tolist()
+        [common] = term_ids(["bomba"]).tolist()
+
+        assert weights[rare] > weights[common]
+        assert sum(query["values"]) == pytest.approx(1.0)
+
+    def test_hybrid_search_arguments_and_scores(self, mock_pinecone_index):
+        """Test que la búsqueda híbrida pondera vectores y reescala scores"""
+        encoder = SparseEncoder(":memory:")
+        encoder.encode_documents(["machine learning", "deep learning"])
+
+        with (
+            patch("app.services.document.get_sparse_encoder", return_value=encoder),
+            patch("app.services.document.settings.HYBRID_ALPHA", 0.5),
+            patch("app.services.document.settings.EMBEDDING_DIMENSIONS", 4),
+            patch(
+                "app.services.vector_store.get_pinecone_index",
+                return_value=mock_pinecone_index,
+            ),
+        ):
+            arguments = query_arguments("machine learning", [0.2] * 4, 5)
+            results = search_similar_documents("machine learning", 5, [0.2] * 4)
+
+        assert arguments["vector"] == pytest.approx([0.1] * 4)
+        assert len(arguments["sparse_vector"]["indices"]) == 2
+        assert sum(arguments["sparse_vector"]["values"]) == pytest.approx(0.5)
+        # Los scores vuelven a la escala densa: 0.95 / 0.5
+        assert results[0]["score"] == pytest.approx(1.9)
+
+    def test_query_without_known_terms_keeps_dense_scores(self, mock_pinecone_index):
+        """Test que sin ponderación híbrida los scores no se reescalan"""
+        encoder = SparseEncoder(":memory:")
+
+        with (
+            patch("app.services.document.get_sparse_encoder", return_value=encoder),
+            patch("app.services.document.settings.HYBRID_ALPHA", 0.5),
+            patch("app.services.document.settings.EMBEDDING_DIMENSIONS", 4),
+            patch(
+                "app.services.vector_store.get_pinecone_index",
+                return_value=mock_pinecone_index,
+            ),
+        ):
+            arguments = query_arguments("¿?", [0.2] * 4, 5)
+            results = search_similar_documents("¿?", 5, [0.2] * 4)
+
+        assert "sparse_vector" not in arguments
+        assert arguments["vector"] == [0.2] * 4
+        assert results[0]["score"] == pytest.approx(0.95)
+
+    def test_removed_chunks_leave_statistics(self):
+        """Test que eliminar o recodificar chunks resta sus términos"""
+        encoder = SparseEncoder(":memory:")
+        encoder.encode_documents(["bomba nueva"], ids=["a#1"])
+        before = encoder.stats()
+        query_before = encoder.encode_query("bomba E1234")
+
+        encoder.encode_documents(
+            ["error E1234 en la bomba", "otra bomba"], ids=["b#1", "b#2"]
+        )
+        # Volver a codificar un id no lo cuenta dos veces
+        encoder.encode_documents(["otra bomba"], ids=["b#2"])
+        assert encoder.stats()["documents"] == 3
+
+        assert encoder.remove(["b#1", "b#2", "no-existe"]) == 2
+        assert encoder.stats() == before
+        assert encoder.encode_query("bomba E1234") == query_before
+
+        encoder.encode_documents(["bomba"], ids=["c#1"], namespace="otro")
+        assert encoder.remove_namespace("otro") == 1
+        assert encoder.stats() == before
+
+    def test_statistics_are_shared_between_workers(self, tmp_path):
+        """Test que las ingestas de otro worker cambian el IDF y el largo promedio"""
+        path = tmp_path / "sparse.sqlite3"
+        worker = SparseEncoder(path)
+        other = SparseEncoder(path)
+        worker.encode_documents(["bomba nueva"], ids=["a#1"])
+        query_before = worker.encode_query("bomba E1234")
+
+        other.encode_documents(
+            ["error E1234 en la bomba del tablero principal"], ids=["b#1"]
+        )
+
+        assert worker.stats() == other.stats()
+        assert worker.stats()["documents"] == 2
+        assert worker.encode_query("bomba E1234") != query_before
+        assert worker.encode_query("bomba E1234") == other.encode_query("bomba E1234")
+        assert worker.average_length == other.average_length == 5.0
+        worker.close()
+        other.close()
+
+    def test_deletes_update_sparse_statistics(self):
+        """Test que los borrados del almacén se restan del vocabulario"""
+        encoder = Mock()
+
+        with (
+            patch("app.services.vector_store.get_sparse_encoder", return_value=encoder),
+            patch("app.services.vector_store.get_vector_store") as mock_store,
+            patch("app.services.vector_store.get_chunk_store", return_value=None),
+        ):
+            mock_store.return_value.delete.return_value = 2
+            store_delete_vectors(["a#1", "a#2"], namespace="ns")
+            store_delete_namespace("ns")
+
+        encoder.remove.assert_called_once_with(["a#1", "a#2"], "ns")
+        encoder.remove_namespace.assert_called_once_with("ns")
+
+    def test_vectors_include_sparse_values(self, mock_embeddings):
+        """Test que la ingesta agrega sparse_values con búsqueda híbrida"""
+        chunks = create_text_chunks("código de error E1234", "manual.txt")
+
+        with (
+            patch(
+                "app.services.embeddings.get_sparse_encoder",
+                return_value=SparseEncoder(":memory:"),
+            ),
+            patch(
+                "app.services.embeddings.create_embeddings",
+                return_value=mock_embeddings,
+            ),
+        ):
+            vectors = create_vectors_from_chunks(chunks)
+
+        assert len(vectors[0]["sparse_values"]["indices"]) == 4
+
+
+class TestSharedClients:
+    """Tests para los clientes compartidos del proceso"""
+
+    def test_init_and_close_clients(self):
+        """Test que los clientes comparten el pool HTTP y se cierran al final"""
+        import asyncio
+
+        from app.core import http
+        from app.services.clients import close_clients, init_clients
+
+        with (
+            patch("app.services.embeddings.OpenAIEmbeddings") as mock_embeddings,
+            patch("app.services.agent.ChatOpenAI") as mock_llm,
+            patch("app.services.pinecone.Pinecone") as mock_pinecone,
+            patch("app.services.pinecone.AsyncIndex") as mock_async_index,
+        ):
+            mock_async_index.return_value.close = AsyncMock()
+            mock_pinecone.return_value.Index.return_value.describe_index_stats.return_value = {
+                "total_vector_count": 0,
+                "dimension": 1536,
+                "namespaces": {},
+            }
+            init_clients()
+            clients = init_clients()
+
+            assert clients.embeddings is mock_embeddings.return_value
+            assert clients.llm is mock_llm.return_value
+            mock_embeddings.assert_called_once()
+            mock_llm.assert_called_once()
+            mock_pinecone.assert_called_once()
+            mock_async_index.assert_called_once()
+            http_client = mock_embeddings.call_args.kwargs["http_client"]
+            assert mock_llm.call_args.kwargs["http_client"] is http_client
+
+            asyncio.run(close_clients())
+            mock_async_index.return_value.close.assert_awaited_once()
+
+        assert http_client.is_closed
+        assert http._http_client is None
+
+    def test_init_clients_rejects_index_dimensions(self):
+        """Test que el arranque falla si el índice tiene otra dimensión"""
+        from app.services.clients import check_index_dimensions
+
+        store = Mock()
+        store.stats.return_value = {"dimension": 3072, "namespaces": {}}
+        with patch("app.services.clients.get_vector_store", return_value=store):
+            with pytest.raises(ValueError, match="3072"):
+                check_index_dimensions()
+
+            # Un índice vacío (sin dimensión) no se valida
+            store.stats.return_value = {"dimension": 0, "namespaces": {}}
+            check_index_dimensions()
+
+
 class TestPineconeService:
     """Tests para servicio de Pinecone"""
 
+    @staticmethod
+    def make_vectors(count: int, text_size: int = 10) -> list[dict]:
+        return [
+            {
+                "id": f"doc_{i}",
+                "values": [0.5] * 8,
+                "metadata": {"text": "x" * text_size, "chunk_index": i},
+            }
+            for i in range(count)
+        ]
+
+    def test_create_upsert_batches_by_bytes(self):
+        """Test que los lotes se arman por tamaño serializado"""
+        small = self.make_vectors(10)
+        assert len(create_upsert_batches(small, 10_000_000, 1000)) == 1
+        assert len(create_upsert_batches(small, 10_000_000, 4)) == 3
+
+        large = self.make_vectors(10, text_size=4000)
+        batches = create_upsert_batches(large, max_batch_bytes=10_000)
+        assert all(len(batch) <= 2 for batch in batches)
+        assert [v["id"] for batch in batches for v in batch] == [v["id"] for v in large]
+
+    def test_upsert_vectors_retries_failed_batch(self, mock_pinecone_index):
+        """Test que un lote fallido se reintenta sin repetir los demás"""
+        calls = []
+
+        def flaky_upsert(vectors, namespace=""):
+            calls.append(vectors[0]["id"])
+            if vectors[0]["id"] == "doc_2" and calls.count("doc_2") == 1:
+                raise ConnectionError("timeout")
+
+        mock_pinecone_index.upsert.side_effect = flaky_upsert
+        vectors = self.make_vectors(6)
+
+        with (
+            patch("app.services.pinecone.settings.PINECONE_UPSERT_MAX_BATCH_SIZE", 2),
+            patch("app.services.pinecone.settings.PINECONE_UPSERT_RETRY_BACKOFF", 0),
+        ):
+            report = upsert_vectors(vectors, index=mock_pinecone_index)
+
+        assert report["ids"] == [v["id"] for v in vectors]
+        assert sorted(calls) == ["doc_0", "doc_2", "doc_2", "doc_4"]
+        assert [batch["attempts"] for batch in report["batches"]] == [1, 2, 1]
+        assert all("latency_ms" in batch for batch in report["batches"])
+
+    def test_upsert_vectors_gives_up(self, mock_pinecone_index):
+        """Test que se propaga el error al agotar los reintentos"""
+        mock_pinecone_index.upsert.side_effect = ConnectionError("down")
+
+        with (
+            patch("app.services.pinecone.settings.PINECONE_UPSERT_MAX_RETRIES", 1),
+            patch("app.services.pinecone.settings.PINECONE_UPSERT_RETRY_BACKOFF", 0),
+            pytest.raises(ConnectionError),
+        ):
+            upsert_vectors(self.make_vectors(3), index=mock_pinecone_index)
+
+        assert mock_pinecone_index.upsert.call_count == 2
+
+    def test_list_vector_ids_pages(self, mock_pinecone_index):
+        """Test que se recorren todas las páginas del listado"""
+        mock_pinecone_index.list.return_value = iter(
+            [
+                Mock(vectors=[Mock(id="doc#a"), Mock(id="doc#b")]),
+                Mock(vectors=[Mock(id="doc#c")]),
+            ]
+        )
+
+        ids = list_vector_ids("doc#", index=mock_pinecone_index)
+
+        assert ids == ["doc#a", "doc#b", "doc#c"]
+        mock_pinecone_index.list.assert_called_once_with(prefix="doc#", namespace="")
+
+    def test_update_metadata_per_id(self, mock_pinecone_index):
+        """Test que la metadata se actualiza por id sin reenviar los vectores"""
+        generation = get_index_generation()
+
+        updated = update_metadata(
+            {"doc#a": {"chunk_index": 0}, "doc#b": {"chunk_index": 1}},
+            index=mock_pinecone_index,
+            namespace="otro",
+        )
+
+        assert updated == 2
+        mock_pinecone_index.update.assert_any_call(
+            id="doc#b", set_metadata={"chunk_index": 1}, namespace="otro"
+        )
+        assert mock_pinecone_index.update.call_count == 2
+        mock_pinecone_index.upsert.assert_not_called()
+        assert get_index_generation() == generation + 1
+
+    def test_list_vector_ids_unsupported(self, mock_pinecone_index):
+        """Test que un índice sin listado se trata como vacío"""
+        mock_pinecone_index.list.side_effect = PineconeApiException(
+            "This operation is not supported for pod-based indexes.", 400
+        )
+        assert list_vector_ids("doc#", index=mock_pinecone_index) == []
+
+    def test_list_vector_ids_propagates_errors(self, mock_pinecone_index):
+        """Test que un error del listado no se confunde con un índice vacío"""
+        for error in (
+            PineconeApiException("Service unavailable", 503),
+            ConnectionError("down"),
+        ):
+            mock_pinecone_index.list.side_effect = error
+            with pytest.raises(type(error)):
+                list_vector_ids("doc#", index=mock_pinecone_index)
+
+    def test_fetch_metadata(self, mock_pinecone_index):
+        """Test que se obtiene la metadata de los ids que existen"""
+        mock_pinecone_index.fetch.return_value = Mock(
+            vectors={"doc#a": Mock(metadata={"chunk_index": 0})}
+        )
+
+        metadata = fetch_metadata(
+            ["doc#a", "doc#b"], index=mock_pinecone_index, namespace="otro"
+        )
+
+        assert metadata == {"doc#a": {"chunk_index": 0}}
+        mock_pinecone_index.fetch.assert_called_once_with(
+            ids=["doc#a", "doc#b"], namespace="otro"
+        )
+
+    def test_delete_vectors_in_batches(self, mock_pinecone_index):
+        """Test que el borrado por ids se hace en lotes"""
+        ids = [f"doc#{i}" for i in range(2500)]
+
+        assert delete_vectors(ids, index=mock_pinecone_index) == 2500
+        assert mock_pinecone_index.delete.call_count == 3
+        assert delete_vectors([], index=mock_pinecone_index) == 0
+
+    def test_delete_namespace(self, mock_pinecone_index):
+        """Test que se borra solo el namespace indicado e invalida caches"""
+        generation = get_index_generation()
+
+        delete_namespace("linea-a", index=mock_pinecone_index)
+
+        mock_pinecone_index.delete.assert_called_once_with(
+            delete_all=True, namespace="linea-a"
+        )
+        assert get_index_generation() == generation + 1
+
+    def test_vectors_include_upload_timestamp(self, mock_embeddings):
+        """Test que la metadata incluye la fecha de subida como número"""
+        chunks = create_text_chunks("Texto de prueba para fechas.", "doc.txt")
+        with patch(
+            "app.services.embeddings.create_embeddings", return_value=mock_embeddings
+        ):
+            vectors = create_vectors_from_chunks(chunks)
+
+        assert isinstance(vectors[0]["metadata"]["upload_timestamp"], int)
+
     # Tests eliminados: Hacían llamadas reales a Pinecone API
 
 
+class TestLocalVectorStore:
+    """Tests para el almacén de vectores local (NumPy)"""
+
+    @staticmethod
+    def vector(vector_id: str, values: list[float], **metadata) -> dict:
+        return {"id": vector_id, "values": values, "metadata": metadata}
+
+    def make_store(self, path) -> LocalVectorStore:
+        store = LocalVectorStore(path)
+        store.upsert(
+            [
+                self.vector("a#0", [1.0, 0.0, 0.0], document_id="a", chunk_index=0),
+                self.vector("a#1", [0.8, 0.6, 0.0], document_id="a", chunk_index=1),
+                self.vector("b#0", [0.0, 1.0, 0.0], document_id="b", chunk_index=0),
+            ]
+        )
+        return store
+
+    def test_query_returns_top_k_in_order(self, tmp_path):
+        """Test que la búsqueda exacta devuelve los más parecidos primero"""
+        store = self.make_store(tmp_path)
+
+        matches = store.query([1.0, 0.0, 0.0], top_k=2)
+
+        assert [m["id"] for m in matches] == ["a#0", "a#1"]
+        assert matches[0]["score"] == pytest.approx(1.0)
+        assert matches[1]["score"] == pytest.approx(0.8)
+        assert matches[0]["metadata"]["document_id"] == "a"
+
+    def test_upsert_overwrites_and_delete(self, tmp_path):
+        """Test que un id repetido se reemplaza y el borrado mueve filas"""
+        store = self.make_store(tmp_path)
+        store.upsert([self.vector("a#0", [0.0, 0.0, 2.0], document_id="a")])
+
+        assert store.stats()["total_vector_count"] == 3
+        assert store.query([0.0, 0.0, 1.0], top_k=1)[0]["id"] == "a#0"
+
+        assert store.delete(["a#0", "missing"]) == 1
+        assert sorted(store.list_ids("a#")) == ["a#1"]
+        assert store.query([0.0, 1.0, 0.0], top_k=1)[0]["id"] == "b#0"
+
+    def test_filters_and_namespaces(self, tmp_path):
+        """Test que los filtros y los namespaces limitan la búsqueda"""
+        store = self.make_store(tmp_path)
+        store.upsert([self.vector("c#0", [1.0, 0.0, 0.0])], namespace="otro")
+
+        matches = store.query(
+            [1.0, 0.0, 0.0], top_k=5, filter={"document_id": {"$eq": "b"}}
+        )
+        assert [m["id"] for m in matches] == ["b#0"]
+        assert store.query([1.0, 0.0, 0.0], top_k=5, namespace="otro")[0]["id"] == (
+            "c#0"
+        )
+
+        store.delete_namespace("otro")
+        assert store.query([1.0, 0.0, 0.0], top_k=5, namespace="otro") == []
+        assert store.stats()["namespaces"] == {"": {"vector_count": 3}}
+
+    def test_matches_filter_operators(self):
+        """Test de los operadores de filtro de metadata"""
+        metadata = {"document_id": "a", "upload_timestamp": 100}
+
+        assert matches_filter(metadata, {"document_id": "a"})
+        assert matches_filter(metadata, {"document_id": {"$in": ["a", "b"]}})
+        assert matches_filter(metadata, {"upload_timestamp": {"$gte": 50, "$lte": 100}})
+        assert not matches_filter(metadata, {"upload_timestamp": {"$gt": 100}})
+        assert not matches_filter(metadata, {"filename": {"$eq": "x.txt"}})
+        assert matches_filter(
+            metadata, {"$or": [{"document_id": "z"}, {"upload_timestamp": 100}]}
+        )
+
+    def test_persistence_across_instances(self, tmp_path):
+        """Test que los vectores se cargan de disco al crear el almacén"""
+        store = self.make_store(tmp_path)
+        store.upsert([self.vector("c#0", [0.0, 0.0, 1.0])], namespace="línea/a")
+        store.delete(["b#0"])
+
+        reloaded = LocalVectorStore(tmp_path)
+
+        assert reloaded.stats() == store.stats()
+        assert (
+            reloaded.query([0.0, 0.0, 1.0], top_k=1, namespace="línea/a")[0]["id"]
+            == "c#0"
+        )
+
+        reloaded.delete_all()
+        assert LocalVectorStore(tmp_path).stats()["total_vector_count"] == 0
+
+    def test_update_metadata_merges_fields(self, tmp_path):
+        """Test que actualizar metadata combina campos y se guarda en disco"""
+        store = self.make_store(tmp_path)
+
+        assert store.update_metadata({"a#1": {"chunk_index": 5}, "x#0": {}}) == 1
+
+        for reloaded in (store, LocalVectorStore(tmp_path)):
+            match = reloaded.query([0.8, 0.6, 0.0], top_k=1)[0]
+            assert match["id"] == "a#1"
+            assert match["metadata"] == {"document_id": "a", "chunk_index": 5}
+            assert reloaded.fetch_metadata(["a#1", "x#0"]) == {
+                "a#1": {"document_id": "a", "chunk_index": 5}
+            }
+
+    def test_writes_append_to_log(self, tmp_path):
+        """Test que las escrituras agregan al log sin reescribir la instantánea"""
+        store = self.make_store(tmp_path)
+        snapshot = (tmp_path / "default.npz").read_bytes()
+
+        store.upsert([self.vector("c#0", [0.0, 0.0, 1.0], document_id="c")])
+        store.update_metadata({"a#1": {"chunk_index": 9}})
+        store.delete(["b#0"])
+
+        assert (tmp_path / "default.npz").read_bytes() == snapshot
+        assert len((tmp_path / "default.log").read_text().splitlines()) == 3
+
+        reloaded = LocalVectorStore(tmp_path)
+        assert sorted(reloaded.list_ids("")) == ["a#0", "a#1", "c#0"]
+        assert reloaded.query([0.0, 0.0, 1.0], top_k=1)[0]["id"] == "c#0"
+        assert reloaded.query([0.8, 0.6, 0.0], top_k=1)[0]["metadata"] == {
+            "document_id": "a",
+            "chunk_index": 9,
+        }
+
+    def test_log_is_compacted(self, tmp_path):
+        """Test que el log se vuelca a la instantánea al superar al namespace"""
+        store = self.make_store(tmp_path)
+
+        with patch("app.services.local_vector_store.COMPACT_MIN_LOG_ROWS", 4):
+            for i in range(6):
+                store.upsert([self.vector("a#0", [0.0, 0.1 * i, 1.0])])
+
+        # 5 filas escritas superan a las 4 mínimas: se compactó y quedó 1
+        assert len((tmp_path / "default.log").read_text().splitlines()) == 1
+        reloaded = LocalVectorStore(tmp_path)
+        assert reloaded.stats() == store.stats()
+        # Queda el último valor escrito
+        assert reloaded.query([0.0, 0.5, 1.0], top_k=1) == store.query(
+            [0.0, 0.5, 1.0], top_k=1
+        )
+
+    def test_interrupted_log_write_is_ignored(self, tmp_path):
+        """Test que una línea incompleta al final del log se descarta"""
+        store = self.make_store(tmp_path)
+        store.upsert([self.vector("c#0", [0.0, 0.0, 1.0])])
+        with open(tmp_path / "default.log", "a", encoding="utf-8") as f:
+            f.write('{"op": "delete", "ids": ["a#')
+        with open(tmp_path / "default.vec", "ab") as f:
+            f.write(b"\x00\x01")
+
+        reloaded = LocalVectorStore(tmp_path)
+        assert reloaded.stats()["total_vector_count"] == 4
+
+        # La siguiente escritura sigue siendo legible
+        reloaded.upsert([self.vector("e#0", [1.0, 1.0, 0.0])])
+        assert LocalVectorStore(tmp_path).query([1.0, 1.0, 0.0], top_k=1)[0]["id"] == (
+            "e#0"
+        )
+
+    def test_unreadable_snapshot_fails_loudly(self, tmp_path):
+        """Test que una instantánea dañada no se descarta en silencio"""
+        self.make_store(tmp_path)
+        snapshot = tmp_path / "default.npz"
+        snapshot.write_bytes(snapshot.read_bytes()[:40])
+
+        with pytest.raises(ValueError, match=r"default\.npz"):
+            LocalVectorStore(tmp_path)
+        # El archivo queda para recuperarlo a mano
+        assert len(snapshot.read_bytes()) == 40
+
+    def test_aquery_runs_off_the_event_loop(self, tmp_path):
+        """Test que la búsqueda asíncrona no bloquea el event loop"""
+        import asyncio
+        import threading
+
+        store = self.make_store(tmp_path)
+        threads = []
+        original = store.query
+
+        def query(**arguments):
+            threads.append(threading.current_thread())
+            return original(**arguments)
+
+        store.query = query
+        matches = asyncio.run(store.aquery(vector=[1.0, 0.0, 0.0], top_k=1))
+
+        assert matches[0]["id"] == "a#0"
+        assert threads[0] is not threading.main_thread()
+
+    def test_writes_invalidate_caches(self, tmp_path):
+        """Test que las escrituras aumentan la generación del índice"""
+        store = self.make_store(tmp_path)
+        generation = get_index_generation()
+
+        store.delete(["a#0"])
+
+        assert get_index_generation() == generation + 1
+
+    def test_search_with_local_backend(self, tmp_path):
+        """Test que la búsqueda de documentos usa el almacén configurado"""
+        store = self.make_store(tmp_path)
+
+        with (
+            patch("app.services.document.get_vector_store", return_value=store),
+            patch("app.services.document.settings.EMBEDDING_DIMENSIONS", 3),
+        ):
+            results = search_similar_documents(
+                "consulta", k=1, query_embedding=[0.0, 1.0, 0.0]
+            )
+
+        assert results[0]["id"] == "b#0"
+
+    def test_pinecone_delete_all_covers_namespaces(self, mock_pinecone_index):
+        """Test que borrar todo en Pinecone vacía cada namespace"""
+        mock_pinecone_index.describe_index_stats.return_value = {
+            "total_vector_count": 3,
+            "dimension": 1536,
+            "namespaces": {"": {"vector_count": 1}, "otro": {"vector_count": 2}},
+        }
+
+        with (
+            patch(
+                "app.services.pinecone.get_pinecone_index",
+                return_value=mock_pinecone_index,
+            ),
+            patch(
+                "app.services.vector_store.get_pinecone_index",
+                return_value=mock_pinecone_index,
+            ),
+        ):
+            PineconeVectorStore().delete_all()
+
+        assert mock_pinecone_index.delete.call_count == 2
+        mock_pinecone_index.delete.assert_any_call(delete_all=True, namespace="otro")
+
+
+class TestANNVectorStore:
+    """Tests para el índice IVF local sobre archivos mapeados"""
+
+    @staticmethod
+    def make_vectors(count: int, dimensions: int = 16, seed: int = 0) -> list[dict]:
+        import numpy as np
+
+        rng = np.random.default_rng(seed)
+        values = rng.normal(size=(count, dimensions))
+        return [
+            {
+                "id": f"doc{i // 10}#{i % 10}",
+                "values": values[i].tolist(),
+                "metadata": {"document_id": f"doc{i // 10}", "chunk_index": i % 10},
+            }
+            for i in range(count)
+        ]
+
+    def test_exact_until_trained(self, tmp_path):
+        """Test que sin entrenar la búsqueda coincide con la exacta"""
+        vectors = self.make_vectors(300)
+        ann = ANNVectorStore(tmp_path / "ann")
+        exact = LocalVectorStore(tmp_path / "exact")
+        ann.upsert(vectors)
+        exact.upsert(vectors)
+
+        query = vectors[7]["values"]
+        assert ann.index().centroids is None
+        assert [m["id"] for m in ann.query(query, top_k=5)] == [
+            m["id"] for m in exact.query(query, top_k=5)
+        ]
+
+    def test_trained_index_with_all_lists_is_exact(self, tmp_path):
+        """Test que revisando todas las listas el resultado es exacto"""
+        vectors = self.make_vectors(500)
+        exact = LocalVectorStore(tmp_path / "exact")
+        exact.upsert(vectors)
+        with patch("app.services.ann.settings.ANN_TRAIN_MIN_VECTORS", 400):
+            ann = ANNVectorStore(tmp_path / "ann", nprobe=1000)
+            ann.upsert(vectors)
+        # El entrenamiento que dispara el upsert corre en segundo plano
+        ann.index().wait_for_training()
+
+        assert ann.index().nlist > 1
+        for vector in vectors[:20]:
+            assert [m["id"] for m in ann.query(vector["values"], top_k=5)] == [
+                m["id"] for m in exact.query(vector["values"], top_k=5)
+            ]
+
+    def test_training_does_not_block_queries_or_writes(self, tmp_path):
+        """Test que el entrenamiento en segundo plano no toma el lock del índice"""
+        import threading
+
+        from app.services import ann as ann_module
+
+        vectors = self.make_vectors(500)
+        training = threading.Event()
+        release = threading.Event()
+        kmeans = ann_module.spherical_kmeans
+
+        def slow_kmeans(*args, **kwargs):
+            training.set()
+            release.wait(timeout=5)
+            return kmeans(*args, **kwargs)
+
+        with (
+            patch("app.services.ann.settings.ANN_TRAIN_MIN_VECTORS", 400),
+            patch("app.services.ann.spherical_kmeans", side_effect=slow_kmeans),
+        ):
+            ann = ANNVectorStore(tmp_path, nprobe=1000)
+            ann.upsert(vectors[:450])
+            assert training.wait(timeout=5)
+
+            # Mientras entrena, se consulta (exacto) y se escribe sin esperar
+            assert ann.query(vectors[7]["values"], top_k=1)[0]["id"] == "doc0#7"
+            ann.upsert(vectors[450:])
+            ann.delete(["doc0#7"])
+            assert ann.index().centroids is None
+
+            release.set()
+            ann.index().wait_for_training()
+
+        index = ann.index()
+        assert index.nlist > 1
+        assert index.stats()["vector_count"] == 499
+        # Las filas agregadas y borradas durante el entrenamiento se respetan
+        assert ann.query(vectors[480]["values"], top_k=1)[0]["id"] == "doc48#0"
+        assert "doc0#7" not in [
+            m["id"] for m in ann.query(vectors[7]["values"], top_k=5)
+        ]
+
+    def test_index_is_locked_to_one_process(self, tmp_path):
+        """Test que un segundo proceso no puede abrir el mismo índice"""
+        from app.services.ann import IVFIndex
+
+        index = IVFIndex(tmp_path)
+        with pytest.raises(ValueError, match="otro proceso"):
+            IVFIndex(tmp_path)
+
+        index.close()
+        IVFIndex(tmp_path).close()
+
+    def test_incremental_upsert_and_delete_after_training(self, tmp_path):
+        """Test que las inserciones y borrados posteriores al entrenamiento se ven"""
+        vectors = self.make_vectors(400)
+        ann = ANNVectorStore(tmp_path, nprobe=1)
+        ann.upsert(vectors)
+        ann.index().train(nlist=8)
+
+        new = self.make_vectors(1, seed=42)[0] | {"id": "nuevo#0"}
+        ann.upsert([new])
+        assert ann.query(new["values"], top_k=1)[0]["id"] == "nuevo#0"
+
+        ann.upsert([vectors[3] | {"values": new["values"]}])
+        assert ann.stats()["total_vector_count"] == 401
+        assert {m["id"] for m in ann.query(new["values"], top_k=2)} == {
+            "nuevo#0",
+            "doc0#3",
+        }
+
+        assert ann.delete(["nuevo#0", "doc0#3", "missing"]) == 2
+        assert ann.index().deleted == 3
+        assert "nuevo#0" not in [m["id"] for m in ann.query(new["values"], top_k=5)]
+
+        ann.index().compact()
+        assert ann.index().deleted == 0
+        assert ann.stats()["total_vector_count"] == 399
+        assert ann.query(vectors[5]["values"], top_k=1)[0]["id"] == "doc0#5"
+        assert ann.list_ids("doc0#") == [
+            f"doc0#{i}" for i in (0, 1, 2, 4, 5, 6, 7, 8, 9)
+        ]
+
+    def test_update_metadata_keeps_vectors(self, tmp_path):
+        """Test que actualizar metadata no mueve el vector ni sus filtros"""
+        vectors = self.make_vectors(20)
+        ann = ANNVectorStore(tmp_path)
+        ann.upsert(vectors)
+
+        assert ann.update_metadata({"doc1#2": {"chunk_index": 7}, "x#0": {}}) == 1
+
+        match = ann.query(vectors[12]["values"], top_k=1)[0]
+        assert match["id"] == "doc1#2"
+        assert match["metadata"] == {"document_id": "doc1", "chunk_index": 7}
+        assert ann.fetch_metadata(["doc1#2", "x#0"]) == {
+            "doc1#2": {"document_id": "doc1", "chunk_index": 7}
+        }
+        filtered = ann.query(
+            vectors[0]["values"], top_k=5, filter={"chunk_index": {"$eq": 7}}
+        )
+        assert {m["id"] for m in filtered} == {"doc0#7", "doc1#2", "doc1#7"}
+
+    def test_filter_falls_back_to_all_lists(self, tmp_path):
+        """Test que un filtro selectivo encuentra vectores fuera de las listas revisadas"""
+        vectors = self.make_vectors(400)
+        ann = ANNVectorStore(tmp_path, nprobe=1)
+        ann.upsert(vectors)
+        ann.index().train(nlist=16)
+
+        matches = ann.query(
+            vectors[0]["values"], top_k=10, filter={"document_id": {"$eq": "doc7"}}
+        )
+
+        assert sorted(m["id"] for m in matches) == [f"doc7#{i}" for i in range(10)]
+
+    @pytest.mark.parametrize(
+        ("quantization", "code_bytes"), [("float16", 32), ("int8", 16), ("pq", 2)]
+    )
+    def test_quantized_search_rescores_exactly(
+        self, tmp_path, quantization, code_bytes
+    ):
+        """Test que la primera pasada usa códigos y los scores finales son exactos"""
+        vectors = self.make_vectors(600)
+        exact = LocalVectorStore(tmp_path / "exact")
+        exact.upsert(vectors)
+        with patch("app.services.ann.settings.ANN_QUANTIZATION", quantization):
+            ann = ANNVectorStore(tmp_path / "ann", nprobe=1000)
+            ann.upsert(vectors)
+        ann.index().train(nlist=4)
+
+        assert ann.stats()["namespaces"][""]["quantization"] == quantization
+        assert ann.index().code_bytes == code_bytes
+
+        found = 0
+        for vector in vectors[:50]:
+            expected = exact.query(vector["values"], top_k=5)
+            matches = ann.query(vector["values"], top_k=5)
+            found += len({m["id"] for m in matches} & {m["id"] for m in expected})
+            exact_scores = {
+                m["id"]: m["score"] for m in exact.query(vector["values"], top_k=600)
+            }
+            for match in matches:
+                assert match["score"] == pytest.approx(
+                    exact_scores[match["id"]], abs=1e-5
+                )
+        assert found / 250 >= (0.9 if quantization != "pq" else 0.6)
+
+        new = self.make_vectors(1, seed=42)[0] | {"id": "nuevo#0"}
+        ann.upsert([new])
+        ann.close()
+        reopened = ANNVectorStore(tmp_path / "ann", nprobe=1000)
+        assert reopened.index().quantizer is not None
+        assert reopened.query(new["values"], top_k=1)[0]["id"] == "nuevo#0"
+
+    def test_reopen_from_disk(self, tmp_path):
+        """Test que un índice reabierto conserva vectores, listas y namespaces"""
+        vectors = self.make_vectors(300)
+        ann = ANNVectorStore(tmp_path)
+        ann.upsert(vectors)
+        ann.upsert(vectors[:10], namespace="otro")
+        ann.index().train(nlist=4)
+        ann.delete(["doc1#1"])
+        expected = ann.query(vectors[9]["values"], top_k=3)
+        stats = ann.stats()
+        ann.close()
+
+        reopened = ANNVectorStore(tmp_path)
+
+        assert reopened.stats() == stats
+        assert reopened.index().nlist == 4
+        assert reopened.query(vectors[9]["values"], top_k=3) == expected
+
+        reopened.delete_namespace("otro")
+        assert reopened.query(vectors[0]["values"], top_k=1, namespace="otro") == []
+        reopened.delete_all()
+        assert reopened.stats()["total_vector_count"] == 0
+
+
 class TestDocumentService:
     """Tests para servicio de documentos"""
 
-    # Test eliminado: Hacía llamadas reales a Pinecone API
-
     def test_query_documents_empty_query(self):
         """Test consulta con query vacío"""
         response = query_documents(query="", max_results=5, similarity_threshold=0.7)
@@ -104,6 +1712,201 @@ class TestDocumentService:
         assert response.confidence == "low"
         assert "demasiado corta" in response.answer
 
+    def test_aquery_documents_concurrent(
+        self, mock_embeddings, mock_pinecone_index, mock_llm
+    ):
+        """Test que las consultas asíncronas no se bloquean entre sí"""
+        import asyncio
+        import time
+
+        async def slow_ainvoke(prompt):
+            await asyncio.sleep(0.2)
+            return mock_llm.invoke.return_value
+
+        mock_llm.ainvoke = AsyncMock(side_effect=slow_ainvoke)
+        mock_embeddings.aembed_query = AsyncMock(return_value=[0.1] * 1536)
+        async_index = Mock()
+        async_index.query = AsyncMock(
+            return_value=mock_pinecone_index.query.return_value
+        )
+
+        async def run_queries():
+            return await asyncio.gather(
+                *(aquery_documents(f"consulta número {i}") for i in range(20))
+            )
+
+        with (
+            patch(
+                "app.services.embeddings.create_embeddings",
+                return_value=mock_embeddings,
+            ),
+            patch(
+                "app.services.vector_store.get_async_pinecone_index",
+                return_value=async_index,
+            ),
+            patch("app.services.document.create_llm", return_value=mock_llm),
+        ):
+            start = time.perf_counter()
+            responses = asyncio.run(run_queries())
+            elapsed = time.perf_counter() - start
+
+        # 20 llamadas de 0.2 s en serie tardarían 4 s
+        assert elapsed < 1.5
+        assert all(r.guard_rail_triggered is None for r in responses)
+        assert all(r.context_chunks_used == 2 for r in responses)
+        assert async_index.query.await_count == 20
+        mock_llm.invoke.assert_not_called()
+        mock_embeddings.embed_query.assert_not_called()
+
+    def test_aquery_documents_coalesces_identical_queries(
+        self, mock_embeddings, mock_pinecone_index, mock_llm
+    ):
+        """Test que consultas idénticas simultáneas usan un solo cálculo"""
+        import asyncio
+
+        async def slow_ainvoke(prompt):
+            await asyncio.sleep(0.05)
+            return mock_llm.invoke.return_value
+
+        mock_llm.ainvoke = AsyncMock(side_effect=slow_ainvoke)
+        mock_embeddings.aembed_query = AsyncMock(return_value=[0.1] * 1536)
+        async_index = Mock()
+        async_index.query = AsyncMock(
+            return_value=mock_pinecone_index.query.return_value
+        )
+        flight = SingleFlight()
+        queries = ["¿Qué es ML?", "  ¿qué es ml? "] * 10 + ["Otra consulta"]
+
+        async def run_queries():
+            return await asyncio.gather(*(aquery_documents(q) for q in queries))
+
+        with (
+            patch(
+                "app.services.embeddings.create_embeddings",
+                return_value=mock_embeddings,
+            ),
+            patch(
+                "app.services.vector_store.get_async_pinecone_index",
+                return_value=async_index,
+            ),
+            patch("app.services.document.create_llm", return_value=mock_llm),
+            patch("app.services.document.get_query_single_flight", return_value=flight),
+        ):
+            responses = asyncio.run(run_queries())
+
+        assert [r.query for r in responses] == queries
+        assert mock_llm.ainvoke.await_count == 2
+        assert flight.stats()["coalesced"] == 19
+
+    def test_aquery_documents_batch(self, mock_pinecone_index, mock_llm):
+        """Test lote: un embedding, guard rails por consulta y LLM acotado"""
+        import asyncio
+
+        running = 0
+        max_running = 0
+
+        async def slow_ainvoke(prompt):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.05)
+            running -= 1
+            return mock_llm.invoke.return_value
+
+        mock_llm.ainvoke = AsyncMock(side_effect=slow_ainvoke)
+        embeddings = Mock()
+        embeddings.aembed_documents = AsyncMock(
+            side_effect=lambda texts: [[0.1] * 1536 for _ in texts]
+        )
+        async_index = Mock()
+        async_index.query = AsyncMock(
+            return_value=mock_pinecone_index.query.return_value
+        )
+        queries = [f"consulta número {i}" for i in range(10)]
+        queries.insert(3, "ab")
+
+        with (
+            patch("app.services.embeddings.create_embeddings", return_value=embeddings),
+            patch(
+                "app.services.vector_store.get_async_pinecone_index",
+                return_value=async_index,
+            ),
+            patch("app.services.document.create_llm", return_value=mock_llm),
+        ):
+            responses = asyncio.run(aquery_documents_batch(queries, llm_concurrency=3))
+
+        assert [r.query for r in responses] == queries
+        assert responses[3].guard_rail_triggered == "short_query"
+        assert sum(r.guard_rail_triggered is None for r in responses) == 10
+        embeddings.aembed_documents.assert_awaited_once()
+        assert len(embeddings.aembed_documents.await_args.args[0]) == 10
+        assert async_index.query.await_count == 10
+        assert max_running == 3
+
+    def test_aquery_documents_batch_isolates_errors(self, mock_llm):
+        """Test que el error de una consulta no tumba el lote"""
+        import asyncio
+
+        embeddings = Mock()
+        embeddings.aembed_documents = AsyncMock(
+            side_effect=lambda texts: [[0.1] * 1536 for _ in texts]
+        )
+        search = AsyncMock(
+            side_effect=[
+                RuntimeError("pinecone caído"),
+                [{"id": "c", "score": 0.2, "metadata": {}}],
+            ]
+        )
+
+        with (
+            patch("app.services.embeddings.create_embeddings", return_value=embeddings),
+            patch("app.services.document.asearch_similar_documents", search),
+        ):
+            responses = asyncio.run(aquery_documents_batch(["primera", "segunda"]))
+
+        assert responses[0].guard_rail_triggered == "error"
+        assert "pinecone caído" in responses[0].answer
+        assert responses[1].guard_rail_triggered == "low_similarity"
+
+    def test_search_scoped_to_namespace_and_filters(self, mock_pinecone_index):
+        """Test que la búsqueda se limita al namespace y a los filtros"""
+        from datetime import UTC, datetime
+
+        filters = QueryFilters(
+            filename="manual.pdf",
+            uploaded_after=datetime(2024, 1, 1, tzinfo=UTC),
+        )
+        with patch(
+            "app.services.vector_store.get_pinecone_index",
+            return_value=mock_pinecone_index,
+        ):
+            search_similar_documents(
+                "machine learning", 3, [0.1] * 1536, "linea-a", filters
+            )
+
+        kwargs = mock_pinecone_index.query.call_args.kwargs
+        assert kwargs["namespace"] == "linea-a"
+        assert kwargs["filter"] == {
+            "filename": {"$eq": "manual.pdf"},
+            "upload_timestamp": {"$gte": 1704067200},
+        }
+
+    def test_query_rejects_other_dimensions(self):
+        """Test que una consulta con otra dimensión falla antes de buscar"""
+        with (
+            patch("app.services.document.get_vector_store") as mock_store,
+            pytest.raises(ValueError, match="EMBEDDING_DIMENSIONS"),
+        ):
+            search_similar_documents("consulta", 3, [0.1] * 512)
+
+        mock_store.return_value.query.assert_not_called()
+
+    def test_search_without_filters(self, mock_pinecone_index):
+        """Test que sin filtros se busca en el namespace por defecto"""
+        arguments = query_arguments("consulta", [0.1] * 1536, 3, filters=QueryFilters())
+        assert arguments["namespace"] == ""
+        assert "filter" not in arguments
+
     # Test eliminado: Hacía llamadas reales a Pinecone API
 
 
@@ -138,4 +1941,550 @@ class TestDocumentProcessing:
             assert exc_info.value.status_code == 400
             assert "no valid text" in str(exc_info.value.detail)
 
+    def test_process_document_streams_windows(self):
+        """Test que el documento se vectoriza y almacena por ventanas"""
+        from tests.conftest import TestHelpers
+
+        text = "\n\n".join(f"Párrafo {i}. " + "texto " * 150 for i in range(12))
+        mock_file = TestHelpers.create_mock_file("doc.txt", text)
+
+        with (
+            patch(
+                "app.utils.doc_to_vectores.create_vectors_from_chunks",
+                side_effect=lambda chunks, on_progress=None, namespace="": [
+                    {"id": chunk["chunk_id"]} for chunk in chunks
+                ],
+            ) as mock_vectors,
+            patch(
+                "app.utils.doc_to_vectores.store_vectors",
+                side_effect=lambda vectors, namespace="": [v["id"] for v in vectors],
+            ) as mock_store,
+            patch("app.utils.doc_to_vectores.settings.INGESTION_WINDOW_CHUNKS", 4),
+            patch("app.utils.doc_to_vectores.list_vector_ids", return_value=[]),
+        ):
+            result = process_document(mock_file)
+
+        chunks_count = len(create_text_chunks(text, "doc.txt"))
+        assert result["chunks_count"] == chunks_count
+        assert result["vectors_count"] == chunks_count
+        assert result["chunks_new"] == chunks_count
+        assert result["chunks_reused"] == 0
+        assert mock_vectors.call_count == mock_store.call_count
+        assert mock_store.call_count == -(-chunks_count // 4)
+        assert TestHelpers.assert_valid_uuid(result["document_id"])
+
+    def test_process_document_incremental(self):
+        """Test que una nueva versión solo vectoriza los chunks cambiados"""
+        from tests.conftest import TestHelpers
+
+        paragraphs = [f"Párrafo {i}. " + "texto " * 150 for i in range(6)]
+        old_chunks = create_text_chunks("\n\n".join(paragraphs), "doc.txt")
+        document_id = old_chunks[0]["document_id"]
+        paragraphs.insert(0, "Párrafo agregado. " + "nuevo " * 150)
+        paragraphs[3] = "Párrafo reescrito. " + "nuevo " * 150
+        new_text = "\n\n".join(paragraphs)
+        new_chunks = list(iter_text_chunks([new_text], "doc-v2.txt", document_id))
+
+        old_ids = {chunk["chunk_id"] for chunk in old_chunks}
+        new_ids = {chunk["chunk_id"] for chunk in new_chunks}
+
+        with (
+            patch(
+                "app.utils.doc_to_vectores.list_vector_ids",
+                return_value=sorted(old_ids),
+            ) as mock_list,
+            patch(
+                "app.utils.doc_to_vectores.create_vectors_from_chunks",
+                side_effect=self.fake_vectors,
+            ) as mock_vectors,
+            patch(
+                "app.utils.doc_to_vectores.store_vectors",
+                side_effect=lambda vectors, namespace="": [v["id"] for v in vectors],
+            ),
+            patch("app.utils.doc_to_vectores.update_vector_metadata") as mock_update,
+            patch(
+                "app.utils.doc_to_vectores.delete_vectors",
+                side_effect=lambda ids, namespace="": len(ids),
+            ) as mock_delete,
+        ):
+            result = process_document(
+                TestHelpers.create_mock_file("doc-v2.txt", new_text),
+                document_id=document_id,
+            )
+
+        embedded = [
+            c["chunk_id"] for call in mock_vectors.call_args_list for c in call.args[0]
+        ]
+        assert result["document_id"] == document_id
+        assert set(embedded) == new_ids - old_ids
+        assert result["chunks_new"] == len(new_ids - old_ids)
+        assert result["chunks_reused"] == len(new_ids & old_ids)
+        assert result["chunks_deleted"] == len(old_ids - new_ids)
+        assert result["chunks_reused"] > 0
+        mock_delete.assert_called_once_with(sorted(old_ids - new_ids), namespace="")
+        mock_list.assert_called_once_with(f"{document_id}#", namespace="")
+        assert result["content_hash"] == hashlib.sha256(new_text.encode()).hexdigest()
+
+        # Los chunks reutilizados toman la posición y el nombre de esta versión
+        refreshed = {
+            chunk_id: fields
+            for call in mock_update.call_args_list
+            for chunk_id, fields in call.args[0].items()
+        }
+        assert set(refreshed) == new_ids & old_ids
+        for chunk in new_chunks:
+            if chunk["chunk_id"] in refreshed:
+                fields = refreshed[chunk["chunk_id"]]
+                assert fields["chunk_index"] == chunk["chunk_index"]
+                assert fields["filename"] == "doc-v2.txt"
+                assert isinstance(fields["upload_timestamp"], int)
+        assert any(
+            chunk["chunk_index"] != old["chunk_index"]
+            for chunk in new_chunks
+            for old in old_chunks
+            if chunk["chunk_id"] == old["chunk_id"]
+        )
+
+    def test_process_document_identity_follows_content(self):
+        """Test que el id del documento depende del contenido, no del nombre"""
+        from tests.conftest import TestHelpers
+
+        text = "\n\n".join(f"Párrafo {i}. " + "texto " * 150 for i in range(3))
+        indexed: dict[str, dict] = {}
+
+        with (
+            self.patch_index(indexed),
+            patch("app.utils.doc_to_vectores.delete_vectors") as mock_delete,
+        ):
+            first = process_document(TestHelpers.create_mock_file("a.txt", text))
+            # Mismo contenido con otro nombre: mismo documento, nada que vectorizar
+            copy = process_document(TestHelpers.create_mock_file("b.txt", text))
+            # Otro contenido con el mismo nombre: otro documento, no reemplaza
+            other = process_document(
+                TestHelpers.create_mock_file("a.txt", "Otro documento distinto.")
+            )
+
+        assert copy["document_id"] == first["document_id"]
+        assert copy["chunks_new"] == 0
+        assert copy["chunks_reused"] == first["chunks_count"]
+        assert other["document_id"] != first["document_id"]
+        assert other["chunks_deleted"] == 0
+        mock_delete.assert_not_called()
+        assert len(indexed) == first["chunks_count"] + other["chunks_count"]
+
+    def test_process_document_same_version_writes_nothing(self):
+        """Test que volver a subir la versión indexada no actualiza metadata"""
+        from tests.conftest import TestHelpers
+
+        paragraphs = [f"Párrafo {i}. " + "texto " * 150 for i in range(4)]
+        v1 = "\n\n".join(paragraphs)
+        v2 = "\n\n".join([*paragraphs[1:], paragraphs[0]])
+        indexed: dict[str, dict] = {}
+
+        with self.patch_index(indexed) as mock_update:
+            first = process_document(TestHelpers.create_mock_file("doc.txt", v1))
+            document_id = first["document_id"]
+
+            # Mismo contenido: ni siquiera se toca la metadata
+            same = process_document(
+                TestHelpers.create_mock_file("doc.txt", v1), document_id=document_id
+            )
+            assert same["chunks_reused"] == first["chunks_count"]
+            mock_update.assert_not_called()
+
+            # Nueva versión (mismos chunks, otro orden): se actualiza y se marca
+            process_document(
+                TestHelpers.create_mock_file("doc.txt", v2), document_id=document_id
+            )
+            assert mock_update.called
+            mock_update.reset_mock()
+            process_document(
+                TestHelpers.create_mock_file("doc.txt", v2), document_id=document_id
+            )
+            mock_update.assert_not_called()
+
+            # Volver a la primera versión no se confunde con la indexada
+            process_document(
+                TestHelpers.create_mock_file("doc.txt", v1), document_id=document_id
+            )
+            assert mock_update.called
+
+        first_chunk = min(indexed.values(), key=lambda m: m["chunk_index"])
+        assert first_chunk["content_hash"] == hashlib.sha256(v1.encode()).hexdigest()
+
+    def test_process_document_failed_version_is_not_marked(self):
+        """Test que una ingesta fallida no se toma como la versión indexada"""
+        from tests.conftest import TestHelpers
+
+        paragraphs = [f"Párrafo {i}. " + "texto " * 150 for i in range(4)]
+        v1 = "\n\n".join(paragraphs)
+        v2 = "\n\n".join([*paragraphs[:3], "Párrafo nuevo. " + "nuevo " * 150])
+        indexed: dict[str, dict] = {}
+
+        with self.patch_index(indexed) as mock_update:
+            document_id = process_document(TestHelpers.create_mock_file("doc.txt", v1))[
+                "document_id"
+            ]
+
+            with (
+                patch(
+                    "app.utils.doc_to_vectores.store_vectors",
+                    side_effect=ConnectionError("down"),
+                ),
+                pytest.raises(ConnectionError),
+            ):
+                process_document(
+                    TestHelpers.create_mock_file("doc.txt", v2),
+                    document_id=document_id,
+                )
+
+            mock_update.reset_mock()
+            process_document(
+                TestHelpers.create_mock_file("doc.txt", v2), document_id=document_id
+            )
+            assert mock_update.called
+
+        first_chunk = min(indexed.values(), key=lambda m: m["chunk_index"])
+        assert first_chunk["content_hash"] == hashlib.sha256(v2.encode()).hexdigest()
+
+    @staticmethod
+    @contextmanager
+    def patch_index(indexed: dict[str, dict]):
+        """Reemplaza el almacén de vectores por un dict id -> metadata"""
+
+        def store(vectors, namespace=""):
+            for vector in vectors:
+                indexed[vector["id"]] = dict(vector["metadata"])
+            return [vector["id"] for vector in vectors]
+
+        def update(metadata, namespace=""):
+            for vector_id, fields in metadata.items():
+                indexed[vector_id].update(fields)
+            return len(metadata)
+
+        def delete(ids, namespace=""):
+            for vector_id in ids:
+                indexed.pop(vector_id, None)
+            return len(ids)
+
+        def vectors(chunks, on_progress=None, namespace=""):
+            return [
+                {"id": chunk["chunk_id"], "metadata": chunk_metadata(chunk)}
+                for chunk in chunks
+            ]
+
+        stack = ExitStack()
+        for name, fake in (
+            (
+                "list_vector_ids",
+                lambda prefix, namespace="": sorted(
+                    i for i in indexed if i.startswith(prefix)
+                ),
+            ),
+            (
+                "fetch_vector_metadata",
+                lambda ids, namespace="": {i: indexed[i] for i in ids if i in indexed},
+            ),
+            ("create_vectors_from_chunks", vectors),
+            ("store_vectors", store),
+            ("delete_vectors", delete),
+        ):
+            stack.enter_context(patch(f"app.utils.doc_to_vectores.{name}", fake))
+        mock_update = stack.enter_context(
+            patch(
+                "app.utils.doc_to_vectores.update_vector_metadata", side_effect=update
+            )
+        )
+        stack.enter_context(
+            patch("app.utils.doc_to_vectores.settings.INGESTION_WINDOW_CHUNKS", 2)
+        )
+        with stack:
+            yield mock_update
+
+    def test_process_document_failure_discards_new_chunks(self):
+        """Test que una ingesta que falla a mitad de camino no deja vectores"""
+        from tests.conftest import TestHelpers
+
+        text = "\n\n".join(f"Párrafo {i}. " + "texto " * 150 for i in range(4))
+        stored: list[str] = []
+
+        def flaky_store(vectors, namespace=""):
+            if stored:
+                raise ConnectionError("down")
+            stored.extend(vector["id"] for vector in vectors)
+            return [vector["id"] for vector in vectors]
+
+        with (
+            patch("app.utils.doc_to_vectores.list_vector_ids", return_value=[]),
+            patch(
+                "app.utils.doc_to_vectores.create_vectors_from_chunks",
+                side_effect=self.fake_vectors,
+            ),
+            patch("app.utils.doc_to_vectores.store_vectors", side_effect=flaky_store),
+            patch("app.utils.doc_to_vectores.update_vector_metadata"),
+            patch(
+                "app.utils.doc_to_vectores.delete_vectors",
+                side_effect=lambda ids, namespace="": len(ids),
+            ) as mock_delete,
+            patch("app.utils.doc_to_vectores.settings.INGESTION_WINDOW_CHUNKS", 1),
+            pytest.raises(ConnectionError),
+        ):
+            process_document(TestHelpers.create_mock_file("doc.txt", text))
+
+        # Se eliminan los chunks nuevos, incluidos los de la ventana que falló
+        (deleted,), _ = mock_delete.call_args
+        assert set(stored) < set(deleted)
+
     # Tests eliminados: Hacían llamadas reales a Pinecone API
+
+    @staticmethod
+    def fake_vectors(chunks, on_progress=None, namespace=""):
+        return [{"id": chunk["chunk_id"]} for chunk in chunks]
+
+    def test_process_documents_bulk_shares_windows(self):
+        """Test que los chunks de varios documentos comparten ventanas"""
+        from tests.conftest import TestHelpers
+
+        files = [
+            TestHelpers.create_mock_file(f"doc{i}.txt", f"Documento {i}. " * 10)
+            for i in range(6)
+        ]
+        files.append(TestHelpers.create_mock_file("imagen.jpg", "binario"))
+
+        with (
+            patch("app.utils.doc_to_vectores.list_vector_ids", return_value=[]),
+            patch(
+                "app.utils.bulk_ingestion.create_vectors_from_chunks",
+                side_effect=self.fake_vectors,
+            ) as mock_vectors,
+            patch(
+                "app.utils.bulk_ingestion.store_vectors",
+                side_effect=lambda vectors, namespace="": [v["id"] for v in vectors],
+            ) as mock_store,
+            patch("app.utils.bulk_ingestion.settings.INGESTION_WINDOW_CHUNKS", 4),
+        ):
+            result = process_documents_bulk(files)
+
+        # 6 documentos de un chunk cada uno: dos ventanas (4 + 2)
+        windows = [call.args[0] for call in mock_vectors.call_args_list]
+        assert [len(window) for window in windows] == [4, 2]
+        assert len({chunk["document_id"] for chunk in windows[0]}) == 4
+        assert mock_store.call_count == 2
+
+        assert result["files_total"] == 7
+        assert result["files_completed"] == 6
+        assert result["files_skipped"] == 1
+        assert result["chunks_new"] == 6
+        assert result["chunks_per_second"] > 0
+        assert [entry["status"] for entry in result["files"]] == ["completed"] * 6 + [
+            "skipped"
+        ]
+
+    def test_process_documents_bulk_failed_window(self):
+        """Test que un lote fallido marca solo a sus documentos"""
+        from tests.conftest import TestHelpers
+
+        files = [
+            TestHelpers.create_mock_file("ok.txt", "Documento correcto. " * 10),
+            TestHelpers.create_mock_file("vacio.txt", "   "),
+            TestHelpers.create_mock_file("falla.txt", "Documento que falla. " * 10),
+        ]
+
+        def flaky_store(vectors, namespace=""):
+            if any("falla" in v["id"] for v in vectors):
+                raise ConnectionError("down")
+            return [v["id"] for v in vectors]
+
+        def tagged_vectors(chunks, on_progress=None, namespace=""):
+            return [{"id": chunk["filename"] + chunk["chunk_id"]} for chunk in chunks]
+
+        with (
+            patch("app.utils.doc_to_vectores.list_vector_ids", return_value=[]),
+            patch(
+                "app.utils.bulk_ingestion.create_vectors_from_chunks",
+                side_effect=tagged_vectors,
+            ),
+            patch(
+                "app.utils.bulk_ingestion.store_vectors",
+                side_effect=flaky_store,
+            ),
+            patch("app.utils.bulk_ingestion.settings.INGESTION_WINDOW_CHUNKS", 1),
+        ):
+            result = process_documents_bulk(files)
+
+        statuses = {entry["filename"]: entry for entry in result["files"]}
+        assert statuses["ok.txt"]["status"] == "completed"
+        assert statuses["vacio.txt"]["status"] == "failed"
+        assert "no valid text" in statuses["vacio.txt"]["error"]
+        assert statuses["falla.txt"]["status"] == "failed"
+        assert statuses["falla.txt"]["error"] == "down"
+        assert result["files_failed"] == 2
+
+    def test_process_documents_bulk_failed_document_discards_new_chunks(self):
+        """Test que un documento fallido no deja los chunks que ya se guardaron"""
+        from tests.conftest import TestHelpers
+
+        text = "\n\n".join(f"Párrafo {i}. " + "falla " * 150 for i in range(3))
+        files = [
+            TestHelpers.create_mock_file("ok.txt", "Documento correcto. " * 10),
+            TestHelpers.create_mock_file("falla.txt", text),
+        ]
+        stored: dict[str, list[str]] = {}
+
+        def flaky_store(vectors, namespace=""):
+            for vector in vectors:
+                if vector["filename"] == "falla.txt" and "falla.txt" in stored:
+                    raise ConnectionError("down")
+                stored.setdefault(vector["filename"], []).append(vector["id"])
+            return [v["id"] for v in vectors]
+
+        def tagged_vectors(chunks, on_progress=None, namespace=""):
+            return [
+                {"id": chunk["chunk_id"], "filename": chunk["filename"]}
+                for chunk in chunks
+            ]
+
+        with (
+            patch("app.utils.doc_to_vectores.list_vector_ids", return_value=[]),
+            patch(
+                "app.utils.bulk_ingestion.create_vectors_from_chunks",
+                side_effect=tagged_vectors,
+            ),
+            patch("app.utils.bulk_ingestion.store_vectors", side_effect=flaky_store),
+            patch(
+                "app.utils.doc_to_vectores.delete_vectors",
+                side_effect=lambda ids, namespace="": len(ids),
+            ) as mock_delete,
+            patch("app.utils.bulk_ingestion.settings.INGESTION_WINDOW_CHUNKS", 1),
+        ):
+            result = process_documents_bulk(files)
+
+        statuses = {entry["filename"]: entry for entry in result["files"]}
+        assert statuses["ok.txt"]["status"] == "completed"
+        assert statuses["falla.txt"]["status"] == "failed"
+        # Solo se eliminan los chunks del documento fallido
+        mock_delete.assert_called_once()
+        (deleted,), _ = mock_delete.call_args
+        assert set(stored["falla.txt"]) <= set(deleted)
+        assert not set(stored["ok.txt"]) & set(deleted)
+
+    def test_process_documents_bulk_replaces_by_filename(self):
+        """Test que document_ids sube un archivo como nueva versión de un documento"""
+        from tests.conftest import TestHelpers
+
+        document_id = "3f2b8c1e-5d4a-4e6f-9b7c-1a2d3e4f5a6b"
+        files = [
+            TestHelpers.create_mock_file("informe.txt", "Informe revisado. " * 10),
+            TestHelpers.create_mock_file("otro.txt", "Otro documento. " * 10),
+            TestHelpers.create_mock_file("copia.txt", "Una copia distinta. " * 10),
+        ]
+
+        with (
+            patch(
+                "app.utils.doc_to_vectores.list_vector_ids",
+                side_effect=lambda prefix, namespace="": [f"{prefix}viejo"],
+            ) as mock_list,
+            patch(
+                "app.utils.bulk_ingestion.create_vectors_from_chunks",
+                side_effect=self.fake_vectors,
+            ),
+            patch(
+                "app.utils.bulk_ingestion.store_vectors",
+                side_effect=lambda vectors, namespace="": [v["id"] for v in vectors],
+            ),
+            patch("app.utils.doc_to_vectores.update_vector_metadata"),
+            patch(
+                "app.utils.doc_to_vectores.delete_vectors",
+                side_effect=lambda ids, namespace="": len(ids),
+            ) as mock_delete,
+        ):
+            result = process_documents_bulk(
+                files,
+                document_ids={"informe.txt": document_id, "copia.txt": document_id},
+            )
+
+        statuses = {entry["filename"]: entry for entry in result["files"]}
+        assert statuses["informe.txt"]["result"]["document_id"] == document_id
+        assert statuses["informe.txt"]["result"]["chunks_deleted"] == 1
+        assert statuses["otro.txt"]["result"]["document_id"] != document_id
+        assert statuses["copia.txt"]["status"] == "skipped"
+        assert statuses["copia.txt"]["error"] == "Same document_id as informe.txt"
+        mock_list.assert_any_call(f"{document_id}#", namespace="")
+        mock_delete.assert_any_call([f"{document_id}#viejo"], namespace="")
+
+    def test_process_documents_bulk_duplicate_content(self):
+        """Test que un archivo con el mismo contenido que otro del lote se omite"""
+        from tests.conftest import TestHelpers
+
+        files = [
+            TestHelpers.create_mock_file("a.txt", "Documento repetido. " * 10),
+            TestHelpers.create_mock_file("copia/a.txt", "Documento repetido. " * 10),
+            TestHelpers.create_mock_file("b.txt", "Otro documento. " * 10),
+        ]
+
+        with (
+            patch("app.utils.doc_to_vectores.list_vector_ids", return_value=[]),
+            patch(
+                "app.utils.bulk_ingestion.create_vectors_from_chunks",
+                side_effect=self.fake_vectors,
+            ) as mock_vectors,
+            patch(
+                "app.utils.bulk_ingestion.store_vectors",
+                side_effect=lambda vectors, namespace="": [v["id"] for v in vectors],
+            ),
+        ):
+            result = process_documents_bulk(files)
+
+        assert [entry["status"] for entry in result["files"]] == [
+            "completed",
+            "skipped",
+            "completed",
+        ]
+        assert result["files"][1]["error"] == "Same content as a.txt"
+        embedded = [c for call in mock_vectors.call_args_list for c in call.args[0]]
+        assert len(embedded) == 2
+
+    def test_process_documents_bulk_survives_bad_files(self):
+        """Test que un archivo dañado o un error inesperado no cortan el lote"""
+        from io import BytesIO
+
+        from fastapi import UploadFile
+
+        from tests.conftest import TestHelpers
+
+        files = [
+            UploadFile(filename="roto.zip", file=BytesIO(b"no es un zip")),
+            TestHelpers.create_mock_file("explota.txt", "Documento que explota. " * 5),
+            TestHelpers.create_mock_file("ok.txt", "Documento correcto. " * 10),
+        ]
+        real_ingestion = DocumentIngestion
+
+        def flaky_ingestion(file, namespace="", document_id=None):
+            if file.filename == "explota.txt":
+                raise RuntimeError("extractor roto")
+            return real_ingestion(file, namespace, document_id)
+
+        with (
+            patch("app.utils.doc_to_vectores.list_vector_ids", return_value=[]),
+            patch(
+                "app.utils.bulk_ingestion.DocumentIngestion",
+                side_effect=flaky_ingestion,
+            ),
+            patch(
+                "app.utils.bulk_ingestion.create_vectors_from_chunks",
+                side_effect=self.fake_vectors,
+            ),
+            patch(
+                "app.utils.bulk_ingestion.store_vectors",
+                side_effect=lambda vectors, namespace="": [v["id"] for v in vectors],
+            ),
+        ):
+            result = process_documents_bulk(files)
+
+        statuses = {entry["filename"]: entry for entry in result["files"]}
+        assert statuses["roto.zip"]["status"] == "failed"
+        assert "Corrupt archive" in statuses["roto.zip"]["error"]
+        assert statuses["explota.txt"]["status"] == "failed"
+        assert statuses["explota.txt"]["error"] == "extractor roto"
+        assert statuses["ok.txt"]["status"] == "completed"
+        assert result["files_failed"] == 2
@@ -4,12 +4,23 @@
 Tests para funciones de utilidad (text extraction, etc.)
 """
 
+import tarfile
+import zipfile
+
 import pytest
 from unittest.mock import Mock, patch
 from io import BytesIO
 from fastapi import UploadFile
 
-from app.utils.text_extraction import extract_text_from_file
+from app.utils import text_extraction
+from app.utils.archives import ArchiveError, is_archive, iter_archive_members
+from app.utils.text_extraction import (
+    extract_text_from_file,
+    iter_text_from_pdf,
+    iter_text_from_txt,
+    shutdown_pdf_workers,
+)
+from tests.conftest import TestHelpers
 
 
 class TestTextExtraction:
@@ -83,6 +94,7 @@ class TestTextExtraction:
         mock_columns = Mock()
         mock_columns.tolist.return_value = ["col1", "col2"]
         type(mock_columns).__len__ = Mock(return_value=2)
+        type(mock_columns).__iter__ = lambda self: iter(["col1", "col2"])
         mock_df.columns = mock_columns
 
         # Mock head().iterrows()
@@ -98,7 +110,8 @@ class TestTextExtraction:
         mock_numeric.columns = []
         mock_df.select_dtypes.return_value = mock_numeric
 
-        mock_pd.read_csv.return_value = mock_df
+        # read_csv por bloques devuelve un iterador de DataFrames
+        mock_pd.read_csv.return_value = iter([mock_df])
 
         file_obj = BytesIO(b"col1,col2\nval1,val2")
         upload_file = UploadFile(filename="test.csv", file=file_obj)
@@ -109,6 +122,75 @@ class TestTextExtraction:
         assert "col1, col2" in result
         mock_pd.read_csv.assert_called_once()
 
+    def test_extract_text_from_csv_in_chunks(self):
+        """Test que el CSV leído por bloques da los mismos totales"""
+        rows = [f"{i},{i * 2},nombre {i}" for i in range(25)]
+        content = "a,b,c\n" + "\n".join(rows)
+        upload_file = UploadFile(filename="data.csv", file=BytesIO(content.encode()))
+
+        with patch("app.utils.text_extraction.CSV_CHUNK_ROWS", 4):
+            result = extract_text_from_file(upload_file)
+
+        assert "Archivo CSV con 25 filas y 3 columnas." in result
+        assert "Fila 5: a: 4, b: 8, c: nombre 4" in result
+        assert "Fila 6" not in result
+        assert "a: promedio 12.00" in result
+        assert "b: promedio 24.00" in result
+        assert "c: promedio" not in result
+
+    def test_iter_text_from_txt_streams_blocks(self):
+        """Test que el texto plano se decodifica por bloques"""
+        content = "línea con acentos: ñandú\n" * 200
+        upload_file = UploadFile(filename="big.txt", file=BytesIO(content.encode()))
+
+        with patch("app.utils.text_extraction.TEXT_READ_BLOCK_SIZE", 7):
+            segments = list(iter_text_from_txt(upload_file))
+
+        assert len(segments) > 1
+        assert "".join(segments) == content
+
+    def test_extract_text_from_txt_latin1(self):
+        """Test que se usa el siguiente encoding si no es UTF-8"""
+        content = "año, canción y pingüino"
+        upload_file = UploadFile(
+            filename="latin.txt", file=BytesIO(content.encode("latin-1"))
+        )
+
+        assert extract_text_from_file(upload_file) == content
+
+    def test_iter_text_from_pdf_pages(self):
+        """Test extracción de PDF página por página"""
+        pdf = TestHelpers.create_pdf_bytes(["Pagina uno", "Pagina dos"])
+        upload_file = UploadFile(filename="test.pdf", file=BytesIO(pdf))
+
+        assert list(iter_text_from_pdf(upload_file)) == [
+            "Pagina uno\n",
+            "Pagina dos\n",
+        ]
+        assert extract_text_from_file(upload_file) == "Pagina uno\nPagina dos"
+
+    def test_iter_text_from_pdf_parallel(self, tmp_path):
+        """Test extracción en paralelo de un PDF en disco conservando el orden"""
+        pages = [f"Pagina {i}" for i in range(9)]
+        path = tmp_path / "big.pdf"
+        path.write_bytes(TestHelpers.create_pdf_bytes(pages))
+
+        with (
+            patch("app.utils.text_extraction.settings.PDF_PARALLEL_MIN_PAGES", 4),
+            patch("app.utils.text_extraction.settings.PDF_PAGES_PER_TASK", 2),
+            patch("app.utils.text_extraction.settings.PDF_EXTRACTION_WORKERS", 2),
+            open(path, "rb") as fh,
+        ):
+            try:
+                upload_file = UploadFile(filename="big.pdf", file=fh)
+                result = list(iter_text_from_pdf(upload_file))
+                # Las páginas se extrajeron en el pool de procesos
+                assert text_extraction._pdf_executor is not None
+            finally:
+                shutdown_pdf_workers()
+
+        assert result == [f"{page}\n" for page in pages]
+
     def test_extract_text_unsupported_format(self):
         """Test archivo con formato no soportado"""
         file_obj = BytesIO(b"contenido binario")
@@ -155,6 +237,172 @@ class TestTextExtraction:
                 extract_text_from_file(upload_file)
 
 
+ARCHIVE_FILES = {
+    "docs/a.txt": b"Texto del documento A",
+    "docs/b.md": b"# Documento B",
+    ".oculto/c.txt": b"no se procesa",
+}
+
+
+class TestArchives:
+    """Tests para archivos zip/tar en subidas masivas"""
+
+    def test_iter_zip_members(self):
+        """Test que se recorren los miembros de un zip sin extraerlos"""
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            for name, content in ARCHIVE_FILES.items():
+                archive.writestr(name, content)
+            archive.writestr("docs/vacio/", b"")
+
+        upload = UploadFile(filename="corpus.zip", file=buffer)
+        members = {
+            member.filename: extract_text_from_file(member)
+            for member in iter_archive_members(upload)
+        }
+
+        assert members == {
+            "docs/a.txt": "Texto del documento A",
+            "docs/b.md": "# Documento B",
+        }
+
+    def test_iter_tar_members(self):
+        """Test que se recorren los miembros de un tar.gz"""
+        buffer = BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+            for name, content in ARCHIVE_FILES.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                archive.addfile(info, BytesIO(content))
+
+        upload = UploadFile(filename="corpus.tar.gz", file=buffer)
+        names = [member.filename for member in iter_archive_members(upload)]
+
+        assert names == ["docs/a.txt", "docs/b.md"]
+
+    @staticmethod
+    def zip_upload(files: dict[str, bytes]) -> UploadFile:
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, content in files.items():
+                archive.writestr(name, content)
+        return UploadFile(filename="corpus.zip", file=buffer)
+
+    def test_members_are_seekable_spooled_copies(self):
+        """Test que cada miembro se entrega descomprimido y seekable"""
+        upload = self.zip_upload({"a.txt": b"contenido " * 1000})
+
+        for member in iter_archive_members(upload):
+            assert member.file.seekable()
+            assert member.size == 10_000
+            member.file.seek(5000)
+            assert member.file.read(9) == b"contenido"
+
+    def test_corrupt_archive_is_reported(self):
+        """Test que un zip o tar dañado se entrega como error, sin lanzar"""
+        broken_zip = UploadFile(filename="roto.zip", file=BytesIO(b"no es un zip"))
+        broken_tar = UploadFile(filename="roto.tar.gz", file=BytesIO(b"\x1f\x8b roto"))
+
+        for upload in (broken_zip, broken_tar):
+            [error] = list(iter_archive_members(upload))
+            assert isinstance(error, ArchiveError)
+            assert error.filename == upload.filename
+            assert "Corrupt archive" in str(error)
+
+    def test_corrupt_member_does_not_stop_archive(self):
+        """Test que un miembro con CRC inválido se reporta y se sigue"""
+        upload = self.zip_upload({"a.txt": b"A" * 100, "b.txt": b"B" * 100})
+        data = bytearray(upload.file.getvalue())
+        # Romper los datos comprimidos del primer miembro
+        data[40] ^= 0xFF
+        upload = UploadFile(filename="corpus.zip", file=BytesIO(bytes(data)))
+
+        members = [
+            member if isinstance(member, ArchiveError) else member.file.read()
+            for member in iter_archive_members(upload)
+        ]
+
+        assert isinstance(members[0], ArchiveError)
+        assert members[0].filename == "a.txt"
+        assert members[1] == b"B" * 100
+
+    def test_truncated_tar_keeps_read_members(self):
+        """Test que un tar truncado entrega lo leído y luego el error"""
+        buffer = BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+            for name, content in ARCHIVE_FILES.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                archive.addfile(info, BytesIO(content))
+            big = tarfile.TarInfo("docs/z.txt")
+            big.size = 200_000
+            archive.addfile(big, BytesIO(bytes(range(256)) * 800))
+        data = buffer.getvalue()
+        upload = UploadFile(filename="corpus.tgz", file=BytesIO(data[: len(data) // 2]))
+
+        members = list(iter_archive_members(upload))
+
+        assert [m.filename for m in members[:2]] == ["docs/a.txt", "docs/b.md"]
+        assert isinstance(members[-1], ArchiveError)
+
+    def test_size_limits(self):
+        """Test que se cortan los miembros y archivos demasiado grandes"""
+        files = {
+            "grande.txt": b"0" * 5000,
+            "a.txt": b"1" * 800,
+            "b.txt": b"2" * 800,
+            "c.txt": b"3" * 800,
+        }
+
+        with (
+            patch("app.utils.archives.settings.BULK_MAX_MEMBER_BYTES", 1000),
+            patch("app.utils.archives.settings.BULK_MAX_ARCHIVE_BYTES", 3000),
+        ):
+            members = list(iter_archive_members(self.zip_upload(files)))
+
+        # El miembro grande se corta al pasar el límite, sin descomprimirlo entero
+        assert isinstance(members[0], ArchiveError)
+        assert members[0].filename == "grande.txt"
+        assert "exceeds 1000 bytes" in str(members[0])
+        assert [m.filename for m in members[1:3]] == ["a.txt", "b.txt"]
+        # 1001 (cortado) + 800 + 800 + 800 > 3000: el resto del archivo se omite
+        assert isinstance(members[3], ArchiveError)
+        assert members[3].filename == "corpus.zip"
+        assert len(members) == 4
+
+    def test_member_count_limit(self):
+        """Test que no se recorren más miembros que el límite"""
+        files = {f"doc{i}.txt": b"texto" for i in range(5)}
+        files["imagen.jpg"] = b"no cuenta"
+
+        with patch("app.utils.archives.settings.BULK_MAX_ARCHIVE_MEMBERS", 3):
+            members = list(
+                iter_archive_members(
+                    self.zip_upload(files),
+                    supported=lambda name: name.endswith(".txt"),
+                )
+            )
+
+        assert [m.filename for m in members[:3]] == ["doc0.txt", "doc1.txt", "doc2.txt"]
+        assert isinstance(members[3], ArchiveError)
+        assert "more than 3 files" in str(members[3])
+        assert len(members) == 4
+
+    def test_unsupported_members_are_not_read(self):
+        """Test que los miembros filtrados se entregan vacíos"""
+        upload = self.zip_upload({"imagen.jpg": b"\xff" * 10_000})
+
+        [member] = iter_archive_members(upload, supported=lambda name: False)
+
+        assert member.filename == "imagen.jpg"
+        assert member.file.read() == b""
+
+    def test_is_archive(self):
+        assert is_archive("corpus.ZIP")
+        assert is_archive("corpus.tar.gz")
+        assert not is_archive("documento.pdf")
+
+
 class TestFileValidation:
     """Tests para validación de archivos"""
 